@@ -1,15 +1,22 @@
 import hmac
 import os
-from contextlib import closing
-from datetime import datetime, timezone
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Optional, Tuple
 
-import psycopg2
 import requests
 from dotenv import load_dotenv
 from flask import Flask, jsonify, render_template, request, send_from_directory
 from psycopg2.extras import RealDictCursor
 
-from src.settings import _validate_database_url
+from src.cache import CacheEntry, PayloadCache, version_etag
+from src.database import TRACKER_NAME, ConnectionPool, load_change_activity
+from src.events import EventHub
+from src.metrics import render_prometheus
+from src.schedule import STALE_AFTER_SECONDS, PollSchedule
+from src.search import ResultIndex, SearchError
+from src.settings import DEFAULT_SOURCE, _validate_database_url
 
 
 load_dotenv()
@@ -22,23 +29,239 @@ GH_API_TOKEN = os.getenv("GH_API_TOKEN", "").strip()
 REPO_NAME = os.getenv("GH_REPO_NAME", "AlbatrossC/sppu-result-tracker").strip()
 WORKFLOW_FILE = os.getenv("GH_WORKFLOW_FILE", "fetch.yml").strip()
 REF_BRANCH = os.getenv("GH_REF_BRANCH", "main").strip()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+
+RESULTS_CACHE = PayloadCache(float(os.getenv("RESULTS_CACHE_TTL", "15")))
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "10"))
+ADAPTIVE_SCHEDULE = os.getenv("SPPU_ADAPTIVE_SCHEDULE", "").strip().lower() in {"1", "true", "yes"}
+TRIGGER_BASELINE_INTERVAL = float(os.getenv("TRIGGER_BASELINE_INTERVAL", "600"))
+SCHEDULE_REFRESH_SECONDS = 3600.0
+
+_pool = None
+_pool_lock = threading.Lock()
+_health_row = None
+_health_checked_at = 0.0
+_health_lock = threading.Lock()
+_schedule = None
+_schedule_built_at = 0.0
+_index = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+LIVE_EVENTS = os.getenv("LIVE_EVENTS", "").strip().lower() in {"1", "true", "yes"}
+EVENT_KEEPALIVE = 15.0
+_event_hub = None
+PAGE_PARAMETERS = {"q", "from", "to", "sort", "cursor", "limit"}
+MAX_PAGE_SIZE = 100
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if not DATABASE_URL:
+                    raise RuntimeError("DATABASE_URL is not configured")
+                _validate_database_url(DATABASE_URL)
+                _pool = ConnectionPool(
+                    DATABASE_URL,
+                    maxconn=DB_POOL_SIZE,
+                    autocommit=True,
+                    cursor_factory=RealDictCursor,
+                    application_name="sppu-result-tracker-web",
+                )
+    return _pool
 
 
 def get_db():
-    if not DATABASE_URL:
-        raise RuntimeError("DATABASE_URL is not configured")
-    _validate_database_url(DATABASE_URL)
-    return psycopg2.connect(
-        DATABASE_URL,
-        cursor_factory=RealDictCursor,
-        connect_timeout=10,
-        application_name="sppu-result-tracker-web",
+    return get_pool().connection()
+
+
+def get_event_hub() -> EventHub:
+    global _event_hub
+    if _event_hub is None:
+        pool = get_pool()
+        with _pool_lock:
+            if _event_hub is None:
+                _event_hub = EventHub(pool.database_url, pool)
+    return _event_hub
+
+
+def _results_version(cursor) -> tuple:
+    cursor.execute(
+        """
+        SELECT COUNT(*) AS count, MAX(last_seen) AS last_seen, MAX(updated_at) AS updated_at
+        FROM results
+        WHERE source = %s
+        """,
+        (DEFAULT_SOURCE,),
+    )
+    row = cursor.fetchone()
+    return (row["count"], row["last_seen"], row["updated_at"])
+
+
+def _results_payload(cursor) -> bytes:
+    cursor.execute(
+        """
+        SELECT course_name, result_date, last_seen
+        FROM results
+        WHERE source = %s
+        ORDER BY result_date DESC, course_name
+        """,
+        (DEFAULT_SOURCE,),
     )
+    return app.json.dumps(cursor.fetchall()).encode("utf-8")
+
+
+def _etag_matches(etag: str) -> bool:
+    tags = request.if_none_match
+    return any(tags.contains_weak(tag) for tag in (etag, f"{etag}-gzip", f"{etag}-br"))
+
+
+def _payload_response(entry: Optional[CacheEntry], etag: str, cache_control: str):
+    """Return 304 for a matching If-None-Match, otherwise the best precompressed body."""
+    if entry is None or _etag_matches(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+    else:
+        encoding = request.accept_encodings.best_match(list(entry.encoded))
+        if encoding:
+            response = app.response_class(entry.encoded[encoding], mimetype="application/json")
+            response.headers["Content-Encoding"] = encoding
+            response.set_etag(f"{etag}-{encoding}")
+        else:
+            response = app.response_class(entry.body, mimetype="application/json")
+            response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def _results_entry() -> Tuple[Optional[CacheEntry], str]:
+    """Return the cached payload, or ``(None, etag)`` when the client's copy is current."""
+    entry = RESULTS_CACHE.fresh("results")
+    if entry is not None:
+        return entry, entry.etag
+
+    with get_db() as conn:
+        with conn.cursor() as cursor:
+            version = _results_version(cursor)
+            etag = version_etag(version)
+            if _etag_matches(etag):
+                return None, etag
+            entry = RESULTS_CACHE.lookup("results", version)
+            if entry is None:
+                entry = RESULTS_CACHE.store("results", version, _results_payload(cursor))
+    return entry, entry.etag
+
+
+def _poll_schedule() -> PollSchedule:
+    """Rebuild the adaptive schedule from change history at most once an hour."""
+    global _schedule, _schedule_built_at
+    if _schedule is None or time.monotonic() - _schedule_built_at >= SCHEDULE_REFRESH_SECONDS:
+        activity = load_change_activity(get_pool())
+        _schedule = PollSchedule.from_activity(activity, TRIGGER_BASELINE_INTERVAL)
+        _schedule_built_at = time.monotonic()
+    return _schedule
+
+
+def _trigger_skip_reason() -> Optional[dict]:
+    """Return a response body when the adaptive schedule says the check is not due yet."""
+    now = datetime.now(timezone.utc)
+    try:
+        schedule = _poll_schedule()
+        last_checked = _tracker_summary()["last_checked"]
+    except Exception:
+        app.logger.exception("Could not load the polling schedule; dispatching anyway")
+        return None
+    if schedule.due(last_checked, now):
+        return None
+    return {
+        "message": "Check not due",
+        "next_check": schedule.next_check(last_checked, now).isoformat(),
+    }
+
+
+def _results_index() -> ResultIndex:
+    """Return the search index for the current results version, rechecked like the payload cache."""
+    global _index, _index_checked_at
+    with _index_lock:
+        index, checked_at = _index, _index_checked_at
+    if index is not None and time.monotonic() - checked_at < RESULTS_CACHE.ttl:
+        return index
+
+    with get_db() as conn:
+        with conn.cursor() as cursor:
+            version = _results_version(cursor)
+            if index is None or index.version != version:
+                cursor.execute(
+                    """
+                    SELECT course_key, course_name, result_date, last_seen
+                    FROM results
+                    WHERE source = %s
+                    """,
+                    (DEFAULT_SOURCE,),
+                )
+                index = ResultIndex(version, cursor.fetchall())
+    with _index_lock:
+        _index, _index_checked_at = index, time.monotonic()
+    return index
+
+
+def _date_argument(name: str) -> Optional[date]:
+    value = request.args.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError as exc:
+        raise SearchError(f"{name} must be a YYYY-MM-DD date") from exc
+
+
+def _limit_argument() -> int:
+    try:
+        limit = int(request.args.get("limit", "50"))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise SearchError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def _id_argument(name: str) -> Optional[int]:
+    value = request.args.get(name, "").strip()
+    if not value:
+        return None
+    if not value.isdigit():
+        raise SearchError(f"{name} must be an event id")
+    return int(value)
+
+
+def _results_page():
+    limit = _limit_argument()
+    date_from, date_to = _date_argument("from"), _date_argument("to")
+
+    index = _results_index()
+    etag = version_etag((index.version, tuple(sorted(request.args.items(multi=True)))))
+    if _etag_matches(etag):
+        response = app.response_class(status=304)
+    else:
+        page = index.page(
+            query=request.args.get("q", ""),
+            date_from=date_from,
+            date_to=date_to,
+            sort=request.args.get("sort", "date_desc"),
+            cursor=request.args.get("cursor") or None,
+            limit=limit,
+        )
+        response = jsonify({"items": page.items, "total": page.total, "next_cursor": page.next_cursor})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return response
 
 
 @app.get("/")
 def index():
-    return render_template("index.html")
+    return render_template("index.html", live_events=LIVE_EVENTS)
 
 
 @app.get("/about")
@@ -49,74 +272,166 @@ def about():
 @app.get("/api/results")
 def get_results():
     try:
-        with closing(get_db()) as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT course_name, result_date, last_seen
-                    FROM results
-                    ORDER BY result_date DESC, course_name
-                    """
-                )
-                rows = cursor.fetchall()
-        response = jsonify(rows)
-        response.headers["Cache-Control"] = "public, max-age=60"
-        return response
+        if PAGE_PARAMETERS.intersection(request.args):
+            return _results_page()
+        entry, etag = _results_entry()
+        return _payload_response(entry, etag, "public, max-age=60")
+    except SearchError as exc:
+        return jsonify({"error": str(exc)}), 400
     except Exception:
         app.logger.exception("Could not load active results")
         return jsonify({"error": "Results are temporarily unavailable"}), 503
 
 
+def _history_page(course_key: Optional[str] = None):
+    """Newest events first, or with ``since`` every later event oldest first for incremental polling."""
+    limit = _limit_argument()
+    before, since = _id_argument("before"), _id_argument("since")
+    if before is not None and since is not None:
+        raise SearchError("Use either before or since, not both")
+
+    conditions, params = ["source = %s"], [DEFAULT_SOURCE]
+    if course_key is not None:
+        conditions.append("course_key = %s")
+        params.append(course_key)
+    if since is not None:
+        conditions.append("id > %s")
+        params.append(since)
+    elif before is not None:
+        conditions.append("id < %s")
+        params.append(before)
+    where = f"WHERE {' AND '.join(conditions)}"
+    order = "ASC" if since is not None else "DESC"
+
+    with get_db() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT id, course_key, course_name, change_type,
+                       old_result_date, new_result_date, created_at
+                FROM results_history
+                {where}
+                ORDER BY id {order}
+                LIMIT %s
+                """,
+                (*params, limit + 1),
+            )
+            events = cursor.fetchall()
+
+    more = len(events) > limit
+    events = events[:limit]
+    if since is not None:
+        next_cursor = events[-1]["id"] if events else since
+    else:
+        next_cursor = events[-1]["id"] if more else None
+    response = jsonify({"events": events, "next_cursor": next_cursor, "has_more": more})
+    response.headers["Cache-Control"] = "public, max-age=30"
+    return response
+
+
+@app.get("/api/history")
+def get_history():
+    try:
+        return _history_page()
+    except SearchError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except Exception:
+        app.logger.exception("Could not load result history")
+        return jsonify({"error": "History is temporarily unavailable"}), 503
+
+
+@app.get("/api/courses/<path:course_key>/timeline")
+def get_course_timeline(course_key: str):
+    try:
+        return _history_page(course_key)
+    except SearchError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except Exception:
+        app.logger.exception("Could not load course timeline")
+        return jsonify({"error": "History is temporarily unavailable"}), 503
+
+
+@app.get("/api/events")
+def stream_events():
+    """Server-Sent Events for new history rows, resumable with ``Last-Event-ID``."""
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if last_event_id is not None and not last_event_id.isdigit():
+        return jsonify({"error": "Last-Event-ID must be an event id"}), 400
+    try:
+        hub = get_event_hub()
+        subscription = hub.subscribe(int(last_event_id) if last_event_id else None)
+    except Exception:
+        app.logger.exception("Could not subscribe to result events")
+        return jsonify({"error": "Live updates are temporarily unavailable"}), 503
+
+    def stream():
+        try:
+            yield "retry: 5000\n\n"
+            for event in subscription.events(EVENT_KEEPALIVE):
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: change\ndata: {app.json.dumps(event)}\n\n"
+        finally:
+            hub.unsubscribe(subscription)
+
+    response = app.response_class(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _tracker_summary() -> dict:
+    """Read the summary row maintained by tracker runs, reused for ``HEALTH_CACHE_TTL`` seconds."""
+    global _health_row, _health_checked_at
+    with _health_lock:
+        if _health_row is not None and time.monotonic() - _health_checked_at < HEALTH_CACHE_TTL:
+            return _health_row
+
+    with get_db() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT last_checked, last_change, active_results,
+                       pending_notifications, failed_notifications, dead_notifications, last_run
+                FROM tracker_status
+                WHERE name = %s
+                """,
+                (TRACKER_NAME,),
+            )
+            row = cursor.fetchone() or {
+                "last_checked": None,
+                "last_change": None,
+                "active_results": 0,
+                "pending_notifications": 0,
+                "failed_notifications": 0,
+                "dead_notifications": 0,
+                "last_run": None,
+            }
+
+    with _health_lock:
+        _health_row, _health_checked_at = row, time.monotonic()
+    return row
+
+
 @app.get("/api/health")
 def get_health():
     try:
-        with closing(get_db()) as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT COUNT(*) AS count, MAX(last_seen) AS last_seen
-                    FROM results
-                    """
-                )
-                results = cursor.fetchone()
-                cursor.execute(
-                    """
-                    SELECT MAX(created_at) AS last_change
-                    FROM results_history
-                    """
-                )
-                history = cursor.fetchone()
-                cursor.execute(
-                    """
-                    SELECT COUNT(*) AS count
-                    FROM results_history
-                    WHERE notification_sent = FALSE
-                    """
-                )
-                pending_count = cursor.fetchone()["count"]
-                cursor.execute(
-                    """
-                    SELECT COUNT(*) AS count
-                    FROM results_history
-                    WHERE notification_sent = FALSE
-                      AND notification_error IS NOT NULL
-                    """
-                )
-                failed_count = cursor.fetchone()["count"]
-
-        active_count = results["count"]
-        last_success = results["last_seen"]
+        summary = _tracker_summary()
+        last_success = summary["last_checked"]
         stale = True
         if last_success:
-            stale = (datetime.now(timezone.utc) - last_success).total_seconds() > 30 * 60
+            stale = (datetime.now(timezone.utc) - last_success).total_seconds() > STALE_AFTER_SECONDS
         payload = {
-            "status": "ok" if active_count else "empty",
+            "status": "ok" if summary["active_results"] else "empty",
             "last_success": last_success,
-            "last_change": history["last_change"],
+            "last_change": summary["last_change"],
             "stale": stale,
-            "active_results": active_count,
-            "pending_notifications": pending_count,
-            "failed_notifications": failed_count,
+            "active_results": summary["active_results"],
+            "pending_notifications": summary["pending_notifications"],
+            "failed_notifications": summary["failed_notifications"],
+            "dead_notifications": summary["dead_notifications"],
+            "last_run": summary["last_run"],
         }
         response = jsonify(payload)
         response.headers["Cache-Control"] = "no-store"
@@ -126,6 +441,22 @@ def get_health():
         return jsonify({"error": "Tracker health is temporarily unavailable"}), 503
 
 
+@app.get("/api/metrics")
+def get_metrics():
+    """The last tracker run's metrics in the Prometheus text format."""
+    try:
+        last_run = _tracker_summary()["last_run"]
+    except Exception:
+        app.logger.exception("Could not load tracker metrics")
+        return jsonify({"error": "Tracker metrics are temporarily unavailable"}), 503
+    if not last_run:
+        return jsonify({"error": "No tracker run has been recorded yet"}), 404
+    response = app.response_class(render_prometheus(last_run), mimetype="text/plain")
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
 @app.post("/api/trigger")
 def trigger_workflow():
     if not WORKFLOW_SECRET or not GH_API_TOKEN:
@@ -137,6 +468,11 @@ def trigger_workflow():
     if not hmac.compare_digest(supplied_key, WORKFLOW_SECRET):
         return jsonify({"error": "Unauthorized"}), 401
 
+    if ADAPTIVE_SCHEDULE and not data.get("force"):
+        skipped = _trigger_skip_reason()
+        if skipped:
+            return jsonify(skipped)
+
     headers = {
         "Authorization": f"Bearer {GH_API_TOKEN}",
         "Accept": "application/vnd.github+json",
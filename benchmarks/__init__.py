@@ -0,0 +1 @@
+"""Benchmarks for the tracker hot paths; see ``python -m benchmarks.run --help``."""
@@ -0,0 +1,107 @@
+"""Synthetic SPPU pages and result snapshots for benchmarks."""
+import json
+import random
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List, Tuple
+
+
+FIXTURES = Path(__file__).resolve().parent.parent / "tests"
+FIRST_DATE = date(2023, 1, 1)
+DATE_SPAN_DAYS = 3 * 365
+
+ROW_TEMPLATE = """                                    <tr style="width: 100%">
+                                        <td style="width: 5%; text-align: center; vertical-align: middle; font-size:medium">{number}</td>
+
+                                        <td style="vertical-align: middle; font-size: medium; width: 65%">
+                                            {name}
+                                        </td>
+
+                                        <td style="text-align: center; vertical-align: middle; width: 15% ">
+                                            {date}
+                                        </td>
+
+                                        <td style="text-align: center; width: 15%">
+                                            <a onclick="Enterdetails('{token}','VQwd6WkEi8YAlLr4UBJuPA==')">
+                                                <input type="button" value="Go for Result" name="Go for Result" class="btn btn-outline-info btn-sm mt-2 dashboardbtnwidth" />
+                                            </a>
+                                        </td>
+                                    </tr>
+"""
+
+Row = Tuple[str, date]
+
+
+def _subject_names() -> List[str]:
+    subjects = json.loads((FIXTURES / "sppu_subjects.json").read_text(encoding="utf-8"))
+    return [item["course_name"] for item in subjects]
+
+
+def _page_shell() -> Tuple[str, str]:
+    page = (FIXTURES / "sppu_result_page.html").read_text(encoding="utf-8")
+    body_start = page.index("<tbody>", page.index('id="tblRVList"')) + len("<tbody>")
+    body_end = page.index("</tbody>", body_start)
+    return page[:body_start] + "\n", page[body_end:]
+
+
+def format_result_date(value: date) -> str:
+    return f"{value.day:02d}- {value:%B}- {value.year}"
+
+
+def snapshot(rows: int, seed: int = 0) -> List[Row]:
+    """``rows`` unique course names built from real SPPU names, with random result dates."""
+    rng = random.Random(seed)
+    names = _subject_names()
+    return [
+        (
+            f"{names[index % len(names)]} (SET {index // len(names) + 1})",
+            FIRST_DATE + timedelta(days=rng.randrange(DATE_SPAN_DAYS)),
+        )
+        for index in range(rows)
+    ]
+
+
+def churn(rows: List[Row], rate: float, seed: int = 0) -> List[Row]:
+    """Change ``rate`` of the rows, split evenly between additions, date updates and removals."""
+    rng = random.Random(seed)
+    changes = max(1, round(len(rows) * rate))
+    positions = rng.sample(range(len(rows)), min(len(rows), changes - changes // 3))
+    updated = set(positions[: changes // 3])
+    removed = set(positions[changes // 3:])
+    result = []
+    for index, (name, result_date) in enumerate(rows):
+        if index in removed:
+            continue
+        if index in updated:
+            result_date += timedelta(days=1 + rng.randrange(30))
+        result.append((name, result_date))
+    result.extend(
+        (f"NEW COURSE {seed}-{index} (2024 PATTERN)", FIRST_DATE + timedelta(days=rng.randrange(DATE_SPAN_DAYS)))
+        for index in range(changes // 3)
+    )
+    return result
+
+
+def subscription_patterns(count: int, seed: int = 0) -> List[str]:
+    """``count`` patterns a student might type: a real course name up to its pattern year, some words cut short."""
+    rng = random.Random(seed)
+    names = [name.replace("(", " ").replace(")", " ").split() for name in _subject_names()]
+    patterns = []
+    for _ in range(count):
+        words = rng.choice(names)
+        end = next((index for index, word in enumerate(words) if word[:4].isdigit()), len(words) - 1)
+        chosen = words[: min(end, 6)] if rng.random() < 0.1 else words[: min(end + 1, 6)]
+        patterns.append(" ".join(
+            word[:4] if len(word) > 5 and word.isalpha() and rng.random() < 0.3 else word for word in chosen
+        ))
+    return patterns
+
+
+def page(rows: List[Row]) -> str:
+    """Render ``rows`` into the real SPPU page around the result table."""
+    head, tail = _page_shell()
+    body = "".join(
+        ROW_TEMPLATE.format(number=number, name=name, date=format_result_date(result_date), token=f"T{number:08d}")
+        for number, (name, result_date) in enumerate(rows, start=1)
+    )
+    return head + body + tail
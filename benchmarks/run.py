@@ -0,0 +1,318 @@
+"""Time the parse, classify and sync hot paths on synthetic pages and save the results as JSON.
+
+Usage:
+    python -m benchmarks.run [--sizes 1000 10000 100000] [--database-url postgresql://...]
+                             [--sync-sizes 1000 10000] [--subscriptions 1000 100000]
+                             [--output results.json]
+                             [--compare baseline.json]
+
+``sync_results`` is only measured with ``--database-url`` (or TEST_DATABASE_URL)
+pointing at a disposable PostgreSQL database initialized with src/schema.sql;
+its tables are truncated.
+"""
+import argparse
+import collections
+import gc
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Callable, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import generators  # noqa: E402
+from src import database, diff, parse  # noqa: E402
+from src.subscriptions import SubscriptionIndex  # noqa: E402
+
+
+CHURN_RATES = (0.001, 0.01, 0.1, 0.5)
+BS4_MAX_ROWS = 10000
+REGRESSION_THRESHOLD = 1.10
+FIXTURE_PAGE = Path(__file__).resolve().parent.parent / "tests" / "sppu_result_page.html"
+FIXTURE_LOOPS = 100
+MATCH_EVENTS = 1000
+
+
+def measure(
+    name: str,
+    params: dict,
+    items: int,
+    function: Callable[..., object],
+    repeats: int,
+    setup: Callable[[], tuple] = tuple,
+) -> dict:
+    """Median and best wall time over ``repeats`` runs, plus the peak traced allocation of one more."""
+    seconds = []
+    for _ in range(repeats):
+        arguments = setup()
+        gc.collect()
+        started = time.perf_counter()
+        function(*arguments)
+        seconds.append(time.perf_counter() - started)
+
+    arguments = setup()
+    gc.collect()
+    tracemalloc.start()
+    function(*arguments)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    median = statistics.median(seconds)
+    return {
+        "name": name,
+        "params": params,
+        "items": items,
+        "repeats": repeats,
+        "median_ms": median * 1000,
+        "min_ms": min(seconds) * 1000,
+        "items_per_second": items / median if median else None,
+        "peak_kib": peak / 1024,
+    }
+
+
+def records(rows: List[generators.Row]) -> List[dict]:
+    return [
+        {"course_key": parse.course_key(name), "course_name": name, "result_date": result_date}
+        for name, result_date in rows
+    ]
+
+
+def pairs(rows: List[generators.Row]) -> set:
+    return {(parse.course_key(name), result_date) for name, result_date in rows}
+
+
+def bench_parse(sizes: List[int], repeats: int) -> List[dict]:
+    results = []
+    for size in sizes:
+        html = generators.page(generators.snapshot(size))
+        params = {"rows": size, "page_kib": round(len(html.encode("utf-8")) / 1024)}
+        for backend in sorted(parse.PARSER_BACKENDS):
+            if backend == "bs4" and size > BS4_MAX_ROWS:
+                continue
+            results.append(measure(
+                "parse_html_content", {**params, "backend": backend}, size,
+                lambda: parse.parse_html_content(html, 1, backend), repeats,
+            ))
+        chunks = [html[index:index + 16384] for index in range(0, len(html), 16384)]
+        results.append(measure(
+            "parse_html_stream", params, size,
+            lambda: parse.parse_html_stream(iter(chunks), 1), repeats,
+        ))
+    return results
+
+
+def _cold_caches() -> tuple:
+    parse.clear_caches()
+    return ()
+
+
+def strptime_result_date(value: str) -> date:
+    """The strptime-based date parser the tokenizer replaced, kept for comparison."""
+    normalized = re.sub(r"\s*-\s*", "-", value.strip())
+    for pattern in ("%d-%B-%Y", "%d-%b-%Y"):
+        try:
+            return datetime.strptime(normalized, pattern).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unsupported result date: {value!r}")
+
+
+def bench_normalize(sizes: List[int], repeats: int) -> List[dict]:
+    size = max(sizes)
+    rows = generators.snapshot(size)
+    names = [f"  {name.replace(' ', '   ')} " for name, _date in rows]
+    dates = [generators.format_result_date(result_date) for _name, result_date in rows]
+    return [
+        measure(
+            "normalize_course_name", {"calls": size, "cache": "cold"}, size,
+            lambda: [parse.normalize_course_name(name) for name in names], repeats, setup=_cold_caches,
+        ),
+        measure(
+            "parse_result_date", {"calls": size, "cache": "cold"}, size,
+            lambda: [parse.parse_result_date(value) for value in dates], repeats, setup=_cold_caches,
+        ),
+    ]
+
+
+def bench_fixture(repeats: int) -> List[dict]:
+    """The saved SPPU page: first parse against every later one, and the date parsers without caches."""
+    html = FIXTURE_PAGE.read_text(encoding="utf-8")
+    rows = len(parse.parse_html_content(html, 1))
+    _header, cells = parse.PARSER_BACKENDS["lxml"](html)
+    dates = [row[2] for row in cells if len(row) > 2] * FIXTURE_LOOPS
+    tokenize = parse.parse_result_date.__wrapped__
+    return [
+        measure(
+            "parse_fixture_page", {"rows": rows, "cache": "cold"}, rows,
+            lambda: parse.parse_html_content(html, 1), repeats, setup=_cold_caches,
+        ),
+        measure(
+            "parse_fixture_page", {"rows": rows, "cache": "warm"}, rows,
+            lambda: parse.parse_html_content(html, 1), repeats,
+        ),
+        measure(
+            "fixture_dates", {"calls": len(dates), "parser": "strptime"}, len(dates),
+            lambda: [strptime_result_date(value) for value in dates], repeats,
+        ),
+        measure(
+            "fixture_dates", {"calls": len(dates), "parser": "tokenizer"}, len(dates),
+            lambda: [tokenize(value) for value in dates], repeats,
+        ),
+        measure(
+            "fixture_dates", {"calls": len(dates), "parser": "cached"}, len(dates),
+            lambda: [parse.parse_result_date(value) for value in dates], repeats,
+        ),
+    ]
+
+
+def bench_classify(sizes: List[int], repeats: int) -> List[dict]:
+    results = []
+    for size in sizes:
+        rows = generators.snapshot(size)
+        active = pairs(rows)
+        old_rows = sorted(diff.rows_from_records(records(rows)))
+        for rate in CHURN_RATES:
+            scraped = pairs(generators.churn(rows, rate))
+            new_rows = sorted(diff.rows_from_records(records(generators.churn(rows, rate))))
+            results.append(measure(
+                "classify_changes", {"rows": size, "churn": rate}, size,
+                lambda: database.classify_changes(active, scraped, {}), repeats,
+            ))
+            results.append(measure(
+                "diff_snapshots", {"rows": size, "churn": rate}, size,
+                lambda: collections.deque(diff.diff_snapshots(old_rows, new_rows), maxlen=0), repeats,
+            ))
+    return results
+
+
+def bench_match(sizes: List[int], repeats: int) -> List[dict]:
+    """Match a batch of changed course keys against ``sizes`` subscriptions; items are events."""
+    keys = [parse.course_key(name) for name, _date in generators.snapshot(MATCH_EVENTS, seed=1)]
+    results = []
+    for size in sizes:
+        index = SubscriptionIndex(
+            database.Subscription(number, pattern, "webhook", f"https://hooks.test/{number}")
+            for number, pattern in enumerate(generators.subscription_patterns(size))
+        )
+        results.append(measure(
+            "match_subscriptions", {"subscriptions": size, "events": len(keys)}, len(keys),
+            lambda: [index.match(database.DEFAULT_SOURCE, key) for key in keys], repeats,
+        ))
+    return results
+
+
+def _reset(database_url: str) -> None:
+    with database.connect(database_url) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("TRUNCATE results, results_history, notification_deliveries, subscriptions, tracker_status RESTART IDENTITY")
+    conn.close()
+
+
+def bench_sync(database_url: str, sizes: List[int], repeats: int) -> List[dict]:
+    results = []
+    for size in sizes:
+        rows = generators.snapshot(size)
+        baseline = records(rows)
+
+        def load_baseline() -> tuple:
+            _reset(database_url)
+            database.sync_results(database_url, baseline, 0.0)
+            return ()
+
+        results.append(measure(
+            "sync_results", {"rows": size, "churn": "baseline"}, size,
+            lambda: database.sync_results(database_url, baseline, 0.0), repeats,
+            setup=lambda: _reset(database_url) or (),
+        ))
+        for rate in CHURN_RATES:
+            scraped = records(generators.churn(rows, rate))
+            results.append(measure(
+                "sync_results", {"rows": size, "churn": rate}, size,
+                lambda: database.sync_results(database_url, scraped, 0.0), repeats,
+                setup=load_baseline,
+            ))
+    _reset(database_url)
+    return results
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _label(result: dict) -> str:
+    params = " ".join(f"{key}={value}" for key, value in result["params"].items())
+    return f"{result['name']} {params}"
+
+
+def compare(baseline: dict, current: dict) -> List[str]:
+    """Lines for every case present in both runs, marking slowdowns above the threshold."""
+    previous = {_label(result): result for result in baseline["results"]}
+    lines = []
+    for result in current["results"]:
+        before = previous.get(_label(result))
+        if before is None:
+            continue
+        ratio = result["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        flag = "  REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+        lines.append(
+            f"{_label(result):<60} {before['median_ms']:10.2f} -> {result['median_ms']:10.2f} ms  x{ratio:5.2f}{flag}"
+        )
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--sync-sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--subscriptions", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--database-url", default=os.getenv("TEST_DATABASE_URL", ""))
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    parser.add_argument("--compare", type=Path, help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    results = bench_parse(args.sizes, args.repeats)
+    results += bench_normalize(args.sizes, args.repeats)
+    results += bench_fixture(args.repeats)
+    results += bench_classify(args.sizes, args.repeats)
+    results += bench_match(args.subscriptions, args.repeats)
+    if args.database_url:
+        results += bench_sync(args.database_url, args.sync_sizes, args.repeats)
+
+    report = {
+        "commit": _commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    for result in results:
+        print(
+            f"{_label(result):<60} {result['median_ms']:10.2f} ms  "
+            f"{result['items_per_second']:12.0f} items/s  {result['peak_kib']:10.0f} KiB peak"
+        )
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if args.compare:
+        print()
+        print("\n".join(compare(json.loads(args.compare.read_text(encoding="utf-8")), report)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,426 @@
+"""Drive run_workflow end to end over a sequence of snapshots, against local PostgreSQL and a webhook sink.
+
+Usage:
+    python -m benchmarks.simulate [--database-url postgresql://...] [--rows 2000] [--runs 20]
+                                  [--churn 0.01] [--burst 10:0.2 ...] [--archive DIR]
+                                  [--rate-limit 5/2] [--channels webhook email] [--warm]
+                                  [--output report.json]
+
+Each run serves the next snapshot from a local page server as the result
+page and delivers notifications to a local sink that answers like a Discord
+webhook, X-RateLimit headers and 429s included; ``--channels`` adds a generic
+webhook sink and a local SMTP stand-in to the notification outbox. Snapshots are synthetic
+(``--rows``, ``--churn`` and ``--burst RUN:CHURN`` for result-season spikes)
+or the pages of a page archive (``--archive``). ``--warm`` reuses connections
+between runs like the daemon; otherwise every run starts cold like the
+Actions job.
+
+The database comes from ``--database-url`` or TEST_DATABASE_URL, or is an
+embedded pgserver instance when that package is installed. It is reset to
+src/schema.sql and truncated, so use a disposable one.
+"""
+import argparse
+import json
+import logging
+import os
+import socketserver
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import generators  # noqa: E402
+from benchmarks.run import _commit  # noqa: E402
+from src import actions, database, discord  # noqa: E402
+from src.archive import PageArchive  # noqa: E402
+from src.settings import Settings  # noqa: E402
+
+
+SCHEMA = Path(__file__).resolve().parent.parent / "src" / "schema.sql"
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    def log_message(self, *_args) -> None:
+        pass
+
+    def _reply(self, status: int, body: bytes, headers: Dict[str, str]) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _serve(handler_class) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class PageServer:
+    """Serve the current snapshot at every path."""
+
+    def __init__(self) -> None:
+        self.body = b""
+        pages = self
+
+        class Handler(_QuietHandler):
+            def do_GET(self) -> None:
+                self._reply(200, pages.body, {"Content-Type": "text/html; charset=utf-8"})
+
+        self.server = _serve(Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/Result/Dashboard/Default"
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class WebhookSink:
+    """Accept webhook posts within a fixed-window rate limit, answering 429 beyond it."""
+
+    def __init__(self, limit: int = 5, window: float = 2.0) -> None:
+        self.limit = limit
+        self.window = window
+        self.messages = self.embeds = self.rate_limited = 0
+        self._remaining = limit
+        self._reset_at = 0.0
+        self._lock = threading.Lock()
+        sink = self
+
+        class Handler(_QuietHandler):
+            def do_POST(self) -> None:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status, body, headers = sink.receive(payload)
+                self._reply(status, body, {"Content-Type": "application/json", **headers})
+
+        self.server = _serve(Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/webhooks/1/simulated"
+
+    def receive(self, payload: dict):
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._reset_at:
+                self._remaining, self._reset_at = self.limit, now + self.window
+            reset_after = f"{self._reset_at - now:.3f}"
+            if self._remaining == 0:
+                self.rate_limited += 1
+                body = json.dumps({"message": "You are being rate limited.", "retry_after": float(reset_after)})
+                return 429, body.encode("utf-8"), {"Retry-After": reset_after}
+            self._remaining -= 1
+            self.messages += 1
+            self.embeds += len(payload.get("embeds", payload.get("events", [])))
+            headers = {
+                "X-RateLimit-Limit": str(self.limit),
+                "X-RateLimit-Remaining": str(self._remaining),
+                "X-RateLimit-Reset-After": reset_after,
+            }
+            return 200, b"{}", headers
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {"messages": self.messages, "embeds": self.embeds, "rate_limited": self.rate_limited}
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SmtpSink:
+    """Accept every message over a minimal SMTP dialogue, standing in for a local mail relay."""
+
+    def __init__(self) -> None:
+        self.messages: List[bytes] = []
+        self._lock = threading.Lock()
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line: str) -> None:
+                self.wfile.write(line.encode("ascii") + b"\r\n")
+
+            def handle(self) -> None:
+                self.reply("220 simulate ESMTP")
+                data = None
+                for line in self.rfile:
+                    if data is not None:
+                        if line.rstrip(b"\r\n") == b".":
+                            sink.receive(b"".join(data))
+                            data = None
+                            self.reply("250 OK")
+                        else:
+                            data.append(line[1:] if line.startswith(b"..") else line)
+                        continue
+                    command = line[:4].upper()
+                    if command in (b"EHLO", b"HELO"):
+                        self.reply("250 simulate")
+                    elif command == b"DATA":
+                        data = []
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    elif command == b"QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("250 OK")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.host, self.port = self.server.server_address
+
+    def receive(self, message: bytes) -> None:
+        with self._lock:
+            self.messages.append(message)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {"emails": len(self.messages)}
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def synthetic_pages(rows: int, runs: int, churn: float, bursts: Dict[int, float], seed: int = 0) -> Iterator[str]:
+    """A baseline page, then one page per run with ``churn`` of it changed, or the burst rate on burst runs."""
+    current = generators.snapshot(rows, seed)
+    yield generators.page(current)
+    for run in range(1, runs):
+        rate = bursts.get(run, churn)
+        if rate:
+            current = generators.churn(current, rate, seed=seed + run)
+        yield generators.page(current)
+
+
+def archived_pages(archive_dir: str, source: str, runs: int) -> Iterator[str]:
+    """Pages of ``source`` that parsed when they were fetched, oldest first."""
+    pages = PageArchive(archive_dir, codec="gzip")
+    yielded = 0
+    for entry in pages.entries():
+        if yielded == runs:
+            return
+        if entry["source"] == source and entry.get("error") is None:
+            yield pages.load(entry["sha256"]).decode("utf-8", errors="replace")
+            yielded += 1
+
+
+def reset_database(database_url: str) -> None:
+    with database.connect(database_url) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(SCHEMA.read_text(encoding="utf-8"))
+            cursor.execute("TRUNCATE results, results_history, notification_deliveries, subscriptions, tracker_status RESTART IDENTITY")
+    conn.close()
+
+
+def _last_run(database_url: str) -> dict:
+    with database.connect(database_url) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT last_run FROM tracker_status WHERE name = %s", (database.TRACKER_NAME,))
+            [last_run] = cursor.fetchone()
+            cursor.execute(
+                "SELECT COUNT(*) FROM notification_deliveries WHERE sent_at IS NULL AND dead_at IS NULL"
+            )
+            [pending] = cursor.fetchone()
+    conn.close()
+    return {**last_run, "pending": pending}
+
+
+def _histogram(last_run: dict, name: str) -> dict:
+    return last_run["histograms"].get(name, {"count": 0, "sum": 0.0})
+
+
+def summarize_run(number: int, succeeded: bool, last_run: dict, sink_counts: Dict[str, int]) -> dict:
+    counters = last_run["counters"]
+    deliver_seconds = last_run["stages"].get("deliver", 0.0)
+    delivered = counters.get("notifications_delivered", 0)
+    transactions = _histogram(last_run, "db_transaction_seconds")
+    return {
+        "run": number,
+        "succeeded": succeeded,
+        "seconds": last_run["seconds"],
+        "stages": last_run["stages"],
+        "db_round_trips": counters.get("db_round_trips", 0),
+        "rows_written": counters.get("rows_written", 0),
+        "transactions": transactions["count"],
+        "transaction_seconds": transactions["sum"],
+        "lock_held_seconds": _histogram(last_run, "sync_lock_seconds")["sum"],
+        "notifications_delivered": delivered,
+        "notifications_per_second": delivered / deliver_seconds if delivered and deliver_seconds else None,
+        "rate_limit_wait_seconds": counters.get("rate_limit_wait_seconds", 0.0),
+        "pending_notifications": last_run["pending"],
+        **{f"sink_{name}": count for name, count in sink_counts.items()},
+    }
+
+
+def _spread(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    ordered = sorted(values)
+    return {
+        "p50": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))],
+        "max": ordered[-1],
+    }
+
+
+def summarize(runs: List[dict]) -> dict:
+    delivered = sum(run["notifications_delivered"] for run in runs)
+    deliver_seconds = sum(run["stages"].get("deliver", 0.0) for run in runs)
+    return {
+        "runs": len(runs),
+        "failed_runs": sum(1 for run in runs if not run["succeeded"]),
+        "run_seconds": _spread([run["seconds"] for run in runs]),
+        "db_round_trips": _spread([run["db_round_trips"] for run in runs]),
+        "transaction_seconds": _spread([run["transaction_seconds"] for run in runs]),
+        "lock_held_seconds": _spread([run["lock_held_seconds"] for run in runs if run["lock_held_seconds"]]),
+        "notifications_delivered": delivered,
+        "notifications_per_second": delivered / deliver_seconds if delivered and deliver_seconds else None,
+        "rate_limited_posts": sum(run["sink_rate_limited"] for run in runs),
+        "pending_notifications": runs[-1]["pending_notifications"] if runs else 0,
+    }
+
+
+def simulate(
+    database_url: str,
+    pages: Iterator[str],
+    sink: WebhookSink,
+    warm: bool = False,
+    webhook: Optional[WebhookSink] = None,
+    mail: Optional[SmtpSink] = None,
+) -> List[dict]:
+    """Run the tracker once per page and collect each run's metrics from tracker_status.last_run.
+
+    ``webhook`` and ``mail`` enable the generic webhook and email channels.
+    """
+    reset_database(database_url)
+    page_server = PageServer()
+    settings = Settings(
+        database_url=database_url,
+        discord_webhook_url=sink.url,
+        result_url=page_server.url,
+        minimum_result_count=1,
+        notify_webhook_url=webhook.url if webhook else "",
+        smtp_host=mail.host if mail else "",
+        smtp_port=mail.port if mail else Settings.smtp_port,
+        email_to=("results@example.test",) if mail else (),
+    )
+    clients = None
+    if warm:
+        clients = actions.Clients(
+            database.ConnectionPool(database_url, maxconn=2), requests.Session(), discord.DiscordDelivery()
+        )
+
+    def counts() -> Dict[str, int]:
+        merged = dict(sink.counts())
+        if webhook is not None:
+            merged.update({f"webhook_{name}": count for name, count in webhook.counts().items()})
+        if mail is not None:
+            merged.update(mail.counts())
+        return merged
+
+    runs = []
+    try:
+        for number, html in enumerate(pages):
+            page_server.body = html.encode("utf-8")
+            before = counts()
+            succeeded = actions.run_workflow(settings, clients)
+            after = counts()
+            sink_counts = {name: after[name] - before[name] for name in after}
+            runs.append(summarize_run(number, succeeded, _last_run(database_url), sink_counts))
+    finally:
+        page_server.close()
+        if clients is not None:
+            clients.delivery.close()
+            clients.session.close()
+            clients.database.close()
+    return runs
+
+
+def _embedded_database_url(directory: str) -> str:
+    try:
+        import pgserver
+    except ImportError:
+        raise SystemExit("Pass --database-url or set TEST_DATABASE_URL, or install pgserver for an embedded database")
+    return pgserver.get_server(directory).get_uri()
+
+
+def _burst(value: str):
+    run, _separator, rate = value.partition(":")
+    return int(run), float(rate)
+
+
+def _rate_limit(value: str):
+    limit, _separator, window = value.partition("/")
+    return int(limit), float(window or 1)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("TEST_DATABASE_URL", ""))
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--churn", type=float, default=0.01, help="share of rows changed between runs")
+    parser.add_argument("--burst", type=_burst, action="append", default=[], metavar="RUN:CHURN")
+    parser.add_argument("--archive", help="replay the pages of this page archive instead")
+    parser.add_argument("--source", default=database.DEFAULT_SOURCE, help="archive source to replay")
+    parser.add_argument("--rate-limit", type=_rate_limit, default=(5, 2.0), metavar="POSTS/SECONDS")
+    parser.add_argument(
+        "--channels", nargs="*", choices=("webhook", "email"), default=[],
+        help="also deliver to a generic webhook sink and a local SMTP stand-in",
+    )
+    parser.add_argument("--warm", action="store_true", help="reuse connections between runs like the daemon")
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    parser.add_argument("--verbose", action="store_true", help="show the tracker's own log")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    with tempfile.TemporaryDirectory() as embedded:
+        database_url = args.database_url or _embedded_database_url(embedded)
+        if args.archive:
+            pages = archived_pages(args.archive, args.source, args.runs)
+        else:
+            pages = synthetic_pages(args.rows, args.runs, args.churn, dict(args.burst))
+        sink = WebhookSink(*args.rate_limit)
+        webhook = WebhookSink(limit=1000, window=1.0) if "webhook" in args.channels else None
+        mail = SmtpSink() if "email" in args.channels else None
+        try:
+            runs = simulate(database_url, pages, sink, args.warm, webhook, mail)
+        finally:
+            for server in (sink, webhook, mail):
+                if server is not None:
+                    server.close()
+
+    for run in runs:
+        print(
+            f"run {run['run']:>3} {'ok  ' if run['succeeded'] else 'FAIL'} {run['seconds'] * 1000:8.1f} ms  "
+            f"{run['db_round_trips']:>4} round trips  txn {run['transaction_seconds'] * 1000:7.1f} ms  "
+            f"lock {run['lock_held_seconds'] * 1000:7.1f} ms  "
+            f"{run['notifications_delivered']:>4} delivered  {run['pending_notifications']:>5} pending  "
+            f"{run['sink_rate_limited']:>3} x 429"
+        )
+    summary = summarize(runs)
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        report = {
+            "commit": _commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "summary": summary,
+            "runs": runs,
+        }
+        args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 0 if not summary["failed_runs"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,135 @@
+"""Measure /api/results throughput with and without the connection pool and payload cache.
+
+Usage:
+    python scripts/load_test_api.py --database-url postgresql://... [--seed 1000]
+
+Point it at a disposable local PostgreSQL database initialized with
+src/schema.sql. ``--seed`` replaces the results table with synthetic rows.
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import psycopg2
+import requests
+from psycopg2.extras import RealDictCursor, execute_values
+from werkzeug.serving import make_server
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+from src.cache import PayloadCache  # noqa: E402
+from src.database import ConnectionPool  # noqa: E402
+
+
+MODES = {
+    "before": {"maxconn": 0, "ttl": 0.0},
+    "after": {"maxconn": 5, "ttl": 15.0},
+}
+
+
+def seed(database_url: str, count: int) -> None:
+    seen_at = datetime.now(timezone.utc)
+    rows = [
+        (f"course {index}", f"Course {index}", date(2026, 1, 1) + timedelta(days=index % 180), True, seen_at, seen_at)
+        for index in range(count)
+    ]
+    with psycopg2.connect(database_url) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("TRUNCATE results RESTART IDENTITY")
+            execute_values(
+                cursor,
+                """
+                INSERT INTO results
+                    (course_key, course_name, result_date, notification_sent, first_seen, last_seen)
+                VALUES %s
+                """,
+                rows,
+            )
+    conn.close()
+
+
+def run_mode(database_url: str, mode: str, concurrency: int, duration: float) -> dict:
+    config = MODES[mode]
+    app._pool = ConnectionPool(
+        database_url,
+        maxconn=config["maxconn"],
+        autocommit=True,
+        cursor_factory=RealDictCursor,
+        application_name="sppu-result-tracker-loadtest",
+    )
+    app.RESULTS_CACHE = PayloadCache(config["ttl"])
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/results"
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client() -> None:
+        nonlocal errors
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = session.get(url, timeout=30)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    app._pool.close()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("TEST_DATABASE_URL", ""))
+    parser.add_argument("--seed", type=int, default=0, help="replace results with this many synthetic rows")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or TEST_DATABASE_URL is required")
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    if args.seed:
+        seed(args.database_url, args.seed)
+    for mode in MODES:
+        result = run_mode(args.database_url, mode, args.concurrency, args.duration)
+        print(
+            f"{result['mode']:>6}: {result['rps']:8.1f} req/s  "
+            f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  "
+            f"({result['requests']} ok, {result['errors']} errors)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,148 @@
+"""Measure how many /api/events subscribers one web process can hold and how fast it fans out.
+
+Usage:
+    python scripts/load_test_sse.py --database-url postgresql://... [--subscribers 100 500 1000]
+
+Point it at a disposable local PostgreSQL database initialized with
+src/schema.sql; each round commits one synthetic result change.
+"""
+import argparse
+import logging
+import os
+import resource
+import selectors
+import socket
+import statistics
+import sys
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from werkzeug.serving import make_server
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app  # noqa: E402
+from src.database import ConnectionPool, sync_results  # noqa: E402
+
+
+APPLICATION_NAME = "sppu-result-tracker-sse-loadtest"
+
+
+def open_subscribers(port: int, count: int, selector: selectors.BaseSelector) -> list:
+    request = b"GET /api/events HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n\r\n"
+    sockets = []
+    for _ in range(count):
+        client = socket.create_connection(("127.0.0.1", port))
+        client.sendall(request)
+        client.setblocking(False)
+        selector.register(client, selectors.EVENT_READ, {"buffer": b"", "received_at": None})
+        sockets.append(client)
+    return sockets
+
+
+def read_until(selector: selectors.BaseSelector, marker: bytes, count: int, timeout: float) -> list:
+    """Read from every subscriber until ``count`` of them have seen ``marker``; return arrival times."""
+    arrivals = []
+    deadline = time.perf_counter() + timeout
+    while len(arrivals) < count and time.perf_counter() < deadline:
+        for key, _events in selector.select(timeout=0.5):
+            try:
+                chunk = key.fileobj.recv(65536)
+            except BlockingIOError:
+                continue
+            state = key.data
+            state["buffer"] += chunk
+            if state["received_at"] is None and marker in state["buffer"]:
+                state["received_at"] = time.perf_counter()
+                arrivals.append(state["received_at"])
+    for key in selector.get_map().values():
+        key.data["buffer"] = b""
+        key.data["received_at"] = None
+    return arrivals
+
+
+def backend_count(database_url: str) -> int:
+    with psycopg2.connect(database_url) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM pg_stat_activity WHERE application_name LIKE 'sppu-result-tracker%%'")
+            count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+
+def run_round(database_url: str, port: int, subscribers: int, round_number: int) -> dict:
+    selector = selectors.DefaultSelector()
+    sockets = open_subscribers(port, subscribers, selector)
+    connected = read_until(selector, b"retry:", subscribers, timeout=60)
+
+    base = [{"course_key": "base", "course_name": "Base", "result_date": date(2026, 1, 1)}]
+    change = {"course_key": f"round {round_number}", "course_name": f"Round {round_number}", "result_date": date(2026, 1, 2)}
+    started = time.perf_counter()
+    sync_results(database_url, base + [change], 0.0)
+    arrivals = read_until(selector, b"event: change", subscribers, timeout=30)
+    latencies = sorted(arrival - started for arrival in arrivals)
+    backends = backend_count(database_url)
+
+    for client in sockets:
+        selector.unregister(client)
+        client.close()
+    selector.close()
+    return {
+        "subscribers": subscribers,
+        "connected": len(connected),
+        "delivered": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "max_ms": latencies[-1] * 1000 if latencies else None,
+        "backends": backends,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=os.getenv("TEST_DATABASE_URL", ""))
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[100, 500, 1000])
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("--database-url or TEST_DATABASE_URL is required")
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 4 * max(args.subscribers) + 256)), hard))
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    with psycopg2.connect(args.database_url) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("TRUNCATE results, results_history, notification_deliveries, subscriptions, tracker_status RESTART IDENTITY")
+    conn.close()
+    sync_results(args.database_url, [{"course_key": "base", "course_name": "Base", "result_date": date(2026, 1, 1)}], 0.0)
+
+    app._pool = ConnectionPool(
+        args.database_url,
+        maxconn=5,
+        autocommit=True,
+        cursor_factory=RealDictCursor,
+        application_name=APPLICATION_NAME,
+    )
+    app._event_hub = None
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app.get_event_hub().start()
+
+    for round_number, subscribers in enumerate(args.subscribers, start=1):
+        result = run_round(args.database_url, server.server_port, subscribers, round_number)
+        print(
+            f"{result['subscribers']:>6} subscribers: {result['connected']} connected, "
+            f"{result['delivered']} received the change  "
+            f"p50 {result['p50_ms']:7.1f} ms  max {result['max_ms']:7.1f} ms  "
+            f"database backends {result['backends']}"
+        )
+    server.shutdown()
+    app._event_hub.stop()
+    app._pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,18 +1,51 @@
+import argparse
+import contextvars
 import logging
+import os
+import random
+import signal
 import sys
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+import requests
 
 
 if __package__ in (None, ""):
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from src import database, discord, extract, parse
-from src.settings import Settings
+from src import database, discord, extract, metrics, outbox, parse
+from src.archive import PageArchive
+from src.outbox import OutboxWorker
+from src.schedule import PollSchedule
+from src.settings import Settings, Source
+from src.subscriptions import SubscriptionCache
 
 
 LOGGER = logging.getLogger("sppu_tracker")
 NOTIFICATION_LIMIT = 100
+POLL_JITTER = 0.2
+MAX_BACKOFF_SECONDS = 30 * 60
+SCHEDULE_REFRESH_SECONDS = 3600.0
+SOURCE_FAILURES = (extract.FetchError, parse.ParseError)
+
+
+@dataclass(frozen=True)
+class Clients:
+    """Connections shared by consecutive runs; a one-shot run opens its own."""
+
+    database: database.Database
+    session: Optional[requests.Session] = None
+    delivery: Optional[discord.DiscordDelivery] = None
+    archive: Optional[PageArchive] = None
+    outbox: Optional[OutboxWorker] = None
+    subscriptions: Optional[SubscriptionCache] = None
 
 
 def _configure_logging() -> None:
@@ -22,29 +55,223 @@ def _configure_logging() -> None:
     )
 
 
-def _send_pending_notifications(settings: Settings) -> discord.DeliverySummary:
-    delivered = failed = 0
-    events = database.pending_notifications(settings.database_url, NOTIFICATION_LIMIT)
+def _send_pending_notifications(settings: Settings, clients: Optional[Clients] = None) -> discord.DeliverySummary:
+    """Deliver one batch of due notifications on every channel, the channels in parallel."""
+    clients = clients or Clients(settings.database_url)
+    return outbox.deliver_due(
+        clients.database,
+        outbox.build_channels(settings, clients.delivery),
+        NOTIFICATION_LIMIT,
+        settings.notify_max_attempts,
+    )
+
+
+def _open_archive(settings: Settings) -> Optional[PageArchive]:
+    if not settings.archive_dir:
+        return None
+    return PageArchive(
+        settings.archive_dir,
+        delta=settings.archive_delta,
+        retention_days=settings.archive_retention_days,
+    )
+
+
+class _Tee:
+    """Keep every chunk the parser reads.
+
+    It has no ``close``, so a parser stopping after the result table does not
+    end the download; ``body`` reads the rest so the whole page is archived.
+    """
+
+    def __init__(self, chunks) -> None:
+        self._chunks = iter(chunks)
+        self._received: List[bytes] = []
+
+    def __iter__(self) -> "_Tee":
+        return self
+
+    def __next__(self):
+        chunk = next(self._chunks)
+        self._received.append(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        return chunk
+
+    def body(self) -> bytes:
+        try:
+            for _chunk in self:
+                pass
+        finally:
+            if hasattr(self._chunks, "close"):
+                self._chunks.close()
+        return b"".join(self._received)
+
+
+def _archive_page(clients: Clients, source: Source, body: Callable[[], bytes], **outcome) -> None:
+    """Keep the fetched page and its parse outcome; archive errors never fail a run."""
+    with metrics.stage("archive"):
+        try:
+            clients.archive.store(
+                source.name, source.url, body(), minimum_result_count=source.minimum_result_count, **outcome
+            )
+            clients.archive.prune_if_due()
+        except Exception as exc:
+            LOGGER.warning("Could not archive the %s page: %s", source.name, exc)
+
+
+def _sync_page(
+    source: Source,
+    page: extract.FetchResult,
+    clients: Clients,
+    channels: Sequence[str] = database.DEFAULT_CHANNELS,
+) -> None:
+    chunks = page.chunks
+    if chunks is not None and clients.archive is not None:
+        chunks = _Tee(chunks)
 
-    for event in events:
-        result = discord.send_event(settings.discord_webhook_url, event)
-        if result.sent:
-            database.mark_notification_sent(settings.database_url, event.history_id, event.result_id)
-            delivered += 1
-            continue
+    def body() -> bytes:
+        return chunks.body() if page.chunks is not None else page.html.encode("utf-8")
 
-        failed += 1
-        database.mark_notification_failed(
-            settings.database_url,
-            event.history_id,
-            result.error or "Discord notification failed",
+    # A streamed page is downloaded while it is parsed, so its transfer counts toward "parse".
+    try:
+        with metrics.stage("parse"):
+            if chunks is not None:
+                scraped = parse.parse_html_stream(chunks, source.minimum_result_count)
+            else:
+                scraped = parse.parse_html_content(page.html, source.minimum_result_count, source.parser_backend)
+            fingerprint = parse.result_fingerprint(scraped)
+    except parse.ParseError as exc:
+        if clients.archive is not None:
+            _archive_page(clients, source, body, error=str(exc))
+        raise
+    if clients.archive is not None:
+        _archive_page(clients, source, body, rows=len(scraped), fingerprint=fingerprint)
+    metrics.increment("rows_parsed", len(scraped))
+    LOGGER.info("Validated %s unique results from %s", len(scraped), source.name)
+
+    with metrics.stage("sync"):
+        if database.record_heartbeat(clients.database, fingerprint, page.validators, source=source.name):
+            LOGGER.info("%s results are unchanged since the last sync; recorded heartbeat", source.name)
+            return
+
+        subscribers = None
+        if clients.subscriptions is not None:
+            subscribers = clients.subscriptions.current(clients.database)
+        outcome = database.sync_results(
+            clients.database,
+            scraped,
+            source.suspicious_count_ratio,
+            fingerprint,
+            page.validators,
+            source=source.name,
+            channels=channels,
+            subscribers=subscribers,
+        )
+    LOGGER.info(
+        "Database sync source=%s status=%s baseline=%s added=%s updated=%s removed=%s",
+        source.name,
+        outcome.status,
+        outcome.baseline_created,
+        outcome.added,
+        outcome.updated,
+        outcome.removed,
+    )
+
+
+def _check_source(source: Source, clients: Clients, channels: Sequence[str] = database.DEFAULT_CHANNELS) -> None:
+    """Fetch and sync one source; errors propagate to the caller."""
+    with metrics.stage("fetch"):
+        status = database.load_tracker_status(clients.database, source.name)
+        fetch = extract.stream_page if source.stream_parsing else extract.fetch_page
+        page = fetch(
+            source.url,
+            extract.PageValidators(status.etag, status.last_modified, status.body_hash),
+            session=clients.session,
         )
+    if page.not_modified:
+        with metrics.stage("sync"):
+            if not database.record_heartbeat(clients.database, status.fingerprint, page.validators, source=source.name):
+                raise RuntimeError(f"Tracker status changed while checking an unmodified {source.name} page")
+        LOGGER.info("%s page is not modified since the last sync; recorded heartbeat", source.name)
+    else:
+        _sync_page(source, page, clients, channels)
+
+
+def _check_sources(settings: Settings, clients: Clients) -> List[Exception]:
+    """Check every source, at most ``max_parallel_sources`` at a time; return their errors.
+
+    A lone source is checked on the calling thread and its error propagates.
+    """
+    sources = settings.tracked_sources()
+    channels = settings.notification_channels()
+    if len(sources) == 1:
+        _check_source(sources[0], clients, channels)
+        return []
+
+    def check(source: Source) -> Optional[Exception]:
+        try:
+            _check_source(source, clients, channels)
+        except Exception as exc:
+            LOGGER.error("Checking source %s failed: %s", source.name, exc)
+            LOGGER.debug(traceback.format_exc())
+            return exc
+        return None
+
+    with ThreadPoolExecutor(max_workers=_parallel_sources(settings)) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, check, source) for source in sources]
+        errors = [future.result() for future in futures]
+    failures = [error for error in errors if error is not None]
+    if len(failures) == len(sources):
+        raise failures[0]
+    return failures
+
+
+def _parallel_sources(settings: Settings) -> int:
+    return max(1, min(settings.max_parallel_sources, len(settings.tracked_sources())))
+
+
+def _check(settings: Settings, clients: Clients) -> bool:
+    """Check every source, then notify once; errors propagate when no source succeeds.
 
-    remaining = len(database.pending_notifications(settings.database_url, NOTIFICATION_LIMIT))
-    return discord.DeliverySummary(delivered=delivered, failed=failed, remaining=remaining)
+    With an outbox worker the run only wakes it, so delivery never delays the next check.
+    """
+    failures = _check_sources(settings, clients)
+    if clients.outbox is not None:
+        clients.outbox.wake()
+        return not failures
+
+    with metrics.stage("deliver"):
+        delivery = _send_pending_notifications(settings, clients)
+    LOGGER.info(
+        "Notification delivery: delivered=%s failed=%s dead=%s remaining=%s",
+        delivery.delivered,
+        delivery.failed,
+        delivery.dead,
+        delivery.remaining,
+    )
+    return delivery.failed == 0 and not failures
+
+
+def _write_prometheus(path: str, snapshot: dict) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as handle:
+        handle.write(metrics.render_prometheus(snapshot))
+    os.replace(temporary, path)
+
+
+def _report_metrics(settings: Settings, clients: Clients, snapshot: dict) -> None:
+    """Log the run's metrics as JSON, export them and keep them for /api/health."""
+    metrics.log_run(snapshot)
+    if settings.metrics_file:
+        try:
+            _write_prometheus(settings.metrics_file, snapshot)
+        except OSError as exc:
+            LOGGER.warning("Could not write run metrics to %s: %s", settings.metrics_file, exc)
+    try:
+        database.save_run_metrics(clients.database, snapshot)
+    except Exception as exc:
+        LOGGER.warning("Could not save run metrics: %s", exc)
 
 
-def run_workflow(settings: Settings = None) -> bool:
+def run_workflow(settings: Settings = None, clients: Optional[Clients] = None) -> bool:
     _configure_logging()
 
     try:
@@ -54,38 +281,137 @@ def run_workflow(settings: Settings = None) -> bool:
         return False
 
     LOGGER.info("Starting tracker run")
+    pool = None
+    if clients is None and len(settings.tracked_sources()) > 1:
+        pool = database.ConnectionPool(settings.database_url, maxconn=_parallel_sources(settings))
+    clients = clients or Clients(
+        pool or settings.database_url, archive=_open_archive(settings), subscriptions=SubscriptionCache()
+    )
+    run_metrics = metrics.RunMetrics()
+    succeeded, error = False, None
     try:
-        html = extract.fetch_html(settings.result_url)
-        scraped = parse.parse_html_content(html, settings.minimum_result_count)
-        LOGGER.info("Validated %s unique SPPU results", len(scraped))
-
-        outcome = database.sync_results(
-            settings.database_url,
-            scraped,
-            settings.suspicious_count_ratio,
-        )
-        LOGGER.info(
-            "Database sync status=%s baseline=%s added=%s updated=%s removed=%s",
-            outcome.status,
-            outcome.baseline_created,
-            outcome.added,
-            outcome.updated,
-            outcome.removed,
-        )
-
-        delivery = _send_pending_notifications(settings)
-        LOGGER.info(
-            "Discord delivery: delivered=%s failed=%s remaining=%s",
-            delivery.delivered,
-            delivery.failed,
-            delivery.remaining,
-        )
-        return delivery.failed == 0
+        with run_metrics.activate():
+            succeeded = _check(settings, clients)
+        return succeeded
     except Exception as exc:
+        error = str(exc)
         LOGGER.error("Tracker run failed: %s", exc)
         LOGGER.debug(traceback.format_exc())
         return False
+    finally:
+        _report_metrics(settings, clients, run_metrics.snapshot(succeeded, error))
+        if pool is not None:
+            pool.close()
+
+
+def next_delay(
+    interval: float,
+    source_failures: int = 0,
+    jitter: float = POLL_JITTER,
+    max_backoff: float = MAX_BACKOFF_SECONDS,
+    uniform: Callable[[float, float], float] = random.uniform,
+) -> float:
+    """Seconds until the next check, doubling after each consecutive SPPU failure."""
+    delay = interval
+    if source_failures:
+        delay = min(interval * 2 ** min(source_failures, 16), max(max_backoff, interval))
+    return delay * uniform(1.0 - jitter, 1.0 + jitter)
+
+
+def _load_schedule(settings: Settings, clients: Clients, current: PollSchedule) -> PollSchedule:
+    try:
+        activity = database.load_change_activity(clients.database)
+    except Exception as exc:
+        LOGGER.warning("Could not rebuild the polling schedule; keeping the previous one: %s", exc)
+        return current
+    schedule = PollSchedule.from_activity(activity, settings.poll_interval)
+    LOGGER.info(
+        "Polling schedule rebuilt from %s change runs: %.0fs to %.0fs between checks",
+        sum(activity.values()),
+        min(schedule.intervals),
+        max(schedule.intervals),
+    )
+    return schedule
+
+
+def run_daemon(settings: Settings = None, stop: Optional[threading.Event] = None) -> int:
+    """Check SPPU on a jittered interval with warm connections until SIGTERM or SIGINT."""
+    _configure_logging()
+    try:
+        settings = settings or Settings.from_env()
+    except Exception as exc:
+        LOGGER.error("Configuration error: %s", exc)
+        return 1
+    if settings.poll_interval <= 0:
+        LOGGER.error("Configuration error: SPPU_POLL_INTERVAL must be positive")
+        return 1
+
+    stop = stop or threading.Event()
+    previous_handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous_handlers[signum] = signal.signal(signum, lambda *_args: stop.set())
+
+    # One connection per concurrently checked source, plus the outbox worker's.
+    pool = database.ConnectionPool(settings.database_url, maxconn=_parallel_sources(settings) + 1)
+    delivery = discord.DiscordDelivery()
+    worker = OutboxWorker(pool, outbox.build_channels(settings, delivery), settings.notify_max_attempts).start()
+    clients = Clients(pool, requests.Session(), delivery, _open_archive(settings), worker, SubscriptionCache())
+    source_failures = 0
+    schedule = PollSchedule.fixed(settings.poll_interval)
+    schedule_built_at = None
+    LOGGER.info(
+        "Tracker daemon started; checking %s source(s) every %ss",
+        len(settings.tracked_sources()),
+        settings.poll_interval,
+    )
+    try:
+        while not stop.is_set():
+            if settings.adaptive_schedule and (
+                schedule_built_at is None or time.monotonic() - schedule_built_at >= SCHEDULE_REFRESH_SECONDS
+            ):
+                schedule = _load_schedule(settings, clients, schedule)
+                schedule_built_at = time.monotonic()
+            run_metrics = metrics.RunMetrics()
+            succeeded, error = False, None
+            try:
+                with run_metrics.activate():
+                    succeeded = _check(settings, clients)
+                source_failures = 0
+            except SOURCE_FAILURES as exc:
+                error = str(exc)
+                source_failures += 1
+                LOGGER.warning("SPPU check failed %s time(s) in a row: %s", source_failures, exc)
+            except Exception as exc:
+                error = str(exc)
+                LOGGER.error("Tracker run failed: %s", exc)
+                LOGGER.debug(traceback.format_exc())
+            _report_metrics(settings, clients, run_metrics.snapshot(succeeded, error))
+            interval = schedule.interval_at(datetime.now(timezone.utc))
+            stop.wait(next_delay(interval, source_failures))
+    finally:
+        worker.stop(timeout=30)
+        clients.delivery.close()
+        clients.session.close()
+        pool.close()
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+    LOGGER.info("Tracker daemon stopped")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check the SPPU result page and notify Discord.")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and check every SPPU_POLL_INTERVAL seconds",
+    )
+    args = parser.parse_args(argv)
+    if args.daemon:
+        return run_daemon()
+    return 0 if run_workflow() else 1
 
 
 if __name__ == "__main__":
-    raise SystemExit(0 if run_workflow() else 1)
+    raise SystemExit(main())
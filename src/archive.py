@@ -0,0 +1,423 @@
+"""Content-addressed archive of fetched result pages, and a CLI to replay or prune it.
+
+Layout of the archive directory:
+
+``objects/ab/abcdef...``
+    One compressed page per SHA-256 of its body, stored once however often
+    the same body is fetched. The first line is a JSON header naming the
+    codec and, for a delta, the page it was compressed against.
+``refs/<source>``
+    Hash of the source's latest page, the base of its next delta.
+``index.jsonl``
+    One line per archived fetch: time, source, URL, hash and parse outcome.
+
+Usage:
+    python -m src.archive replay [--archive DIR] [--source NAME] [--since 2026-01-01]
+                                 [--backend lxml] [--workers N]
+    python -m src.archive prune [--archive DIR] [--retention-days 90]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; gzip is always available.
+    zstandard = None
+
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import diff, parse
+from src.settings import Settings, Source
+
+
+LOGGER = logging.getLogger("sppu_tracker.archive")
+CODECS = ("zstd", "gzip")
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+KEYFRAME_INTERVAL = 16
+CACHED_BODIES = 4
+PRUNE_INTERVAL_SECONDS = 24 * 3600
+
+
+class ArchiveError(Exception):
+    """Raised when an archived page is missing or does not match its hash."""
+
+
+def _zstd_dict(base: bytes):
+    return zstandard.ZstdCompressionDict(base, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+
+def _compress(codec: str, body: bytes, base: Optional[bytes] = None) -> bytes:
+    if codec == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    dict_data = _zstd_dict(base) if base is not None else None
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data).compress(body)
+
+
+def _decompress(codec: str, payload: bytes, base: Optional[bytes] = None) -> bytes:
+    if codec == "gzip":
+        return gzip.decompress(payload)
+    if zstandard is None:
+        raise ArchiveError("Install zstandard to read zstd-compressed pages")
+    dict_data = _zstd_dict(base) if base is not None else None
+    return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(payload)
+
+
+class PageArchive:
+    """Store each distinct page body once, optionally as a zstd delta against the source's previous page.
+
+    A delta chain is cut after ``keyframe_interval`` pages so a read never
+    decompresses more than that many objects. ``retention_days`` of 0 keeps
+    every page; otherwise ``prune_if_due`` drops older fetches. Appends are thread-safe within
+    a process; objects and refs are replaced atomically. Reading decodes
+    every page with the codec it was stored with, whatever ``codec`` is.
+    """
+
+    def __init__(
+        self,
+        root,
+        codec: Optional[str] = None,
+        delta: bool = False,
+        retention_days: float = 0.0,
+        keyframe_interval: int = KEYFRAME_INTERVAL,
+    ) -> None:
+        codec = codec or ("zstd" if zstandard is not None else "gzip")
+        if codec not in CODECS:
+            raise ValueError(f"Unsupported archive codec {codec!r}; use one of {', '.join(CODECS)}")
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("The zstd archive codec needs the zstandard package")
+        self.root = Path(root)
+        self.codec = codec
+        self.delta = delta and codec == "zstd"
+        self.retention_days = retention_days
+        self.keyframe_interval = keyframe_interval
+        self._lock = threading.Lock()
+        self._bodies: "OrderedDict[str, bytes]" = OrderedDict()
+
+    @property
+    def index_path(self) -> Path:
+        return self.root / "index.jsonl"
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / digest
+
+    def _ref_path(self, source: str) -> Path:
+        return self.root / "refs" / source
+
+    def _header(self, digest: str) -> dict:
+        try:
+            with open(self.object_path(digest), "rb") as handle:
+                return json.loads(handle.readline())
+        except FileNotFoundError as exc:
+            raise ArchiveError(f"Archived page {digest} is missing") from exc
+
+    def load(self, digest: str) -> bytes:
+        """The page body stored under ``digest``, checked against its hash."""
+        body = self._bodies.get(digest)
+        if body is not None:
+            self._bodies.move_to_end(digest)
+            return body
+        try:
+            with open(self.object_path(digest), "rb") as handle:
+                header = json.loads(handle.readline())
+                payload = handle.read()
+        except FileNotFoundError as exc:
+            raise ArchiveError(f"Archived page {digest} is missing") from exc
+        base = self.load(header["base"]) if header.get("base") else None
+        body = _decompress(header["codec"], payload, base)
+        if hashlib.sha256(body).hexdigest() != digest:
+            raise ArchiveError(f"Archived page {digest} does not match its hash")
+        self._bodies[digest] = body
+        while len(self._bodies) > CACHED_BODIES:
+            self._bodies.popitem(last=False)
+        return body
+
+    def _write_atomic(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+
+    def _write_object(self, digest: str, body: bytes, source: str) -> None:
+        base = depth = None
+        if self.delta:
+            try:
+                previous = self._ref_path(source).read_text(encoding="utf-8").strip()
+                depth = self._header(previous).get("depth", 0) + 1
+                if depth < self.keyframe_interval:
+                    base = previous
+            except (OSError, ArchiveError, ValueError):
+                base = None
+        base_body = self.load(base) if base else None
+        header = {"codec": self.codec, "base": base, "depth": depth if base else 0}
+        payload = _compress(self.codec, body, base_body)
+        self._write_atomic(self.object_path(digest), json.dumps(header).encode("utf-8") + b"\n" + payload)
+
+    def store(
+        self,
+        source: str,
+        url: str,
+        body: bytes,
+        rows: Optional[int] = None,
+        fingerprint: Optional[str] = None,
+        error: Optional[str] = None,
+        minimum_result_count: Optional[int] = None,
+        fetched_at: Optional[datetime] = None,
+    ) -> str:
+        """Archive one fetched page with its parse outcome and return its hash."""
+        digest = hashlib.sha256(body).hexdigest()
+        entry = {
+            "fetched_at": (fetched_at or datetime.now(timezone.utc)).isoformat(),
+            "source": source,
+            "url": url,
+            "sha256": digest,
+            "bytes": len(body),
+            "rows": rows,
+            "fingerprint": fingerprint,
+            "error": error,
+            "minimum_result_count": minimum_result_count,
+        }
+        with self._lock:
+            if not self.object_path(digest).exists():
+                self._write_object(digest, body, source)
+            self._write_atomic(self._ref_path(source), digest.encode("utf-8"))
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.index_path, "a", encoding="utf-8") as handle:
+                handle.write(json.dumps(entry) + "\n")
+        return digest
+
+    def entries(self) -> Iterator[dict]:
+        """Archived fetches, oldest first; a torn last line is skipped."""
+        try:
+            handle = open(self.index_path, encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with handle:
+            for line in handle:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    LOGGER.warning("Skipping an unreadable archive index line")
+
+    def prune(self, retention_days: float, now: Optional[datetime] = None) -> Tuple[int, int]:
+        """Forget fetches older than ``retention_days`` and delete pages nothing refers to.
+
+        Returns the number of index entries and objects removed. Pages that
+        a kept delta or a source's latest ref depends on are kept.
+        """
+        cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=retention_days)
+        with self._lock:
+            entries = list(self.entries())
+            kept = [entry for entry in entries if datetime.fromisoformat(entry["fetched_at"]) >= cutoff]
+            live = {entry["sha256"] for entry in kept}
+            refs = self.root / "refs"
+            if refs.is_dir():
+                live.update(path.read_text(encoding="utf-8").strip() for path in refs.iterdir())
+            pending = list(live)
+            while pending:
+                try:
+                    base = self._header(pending.pop()).get("base")
+                except ArchiveError:
+                    continue
+                if base and base not in live:
+                    live.add(base)
+                    pending.append(base)
+
+            if len(kept) < len(entries):
+                self._write_atomic(self.index_path, "".join(json.dumps(entry) + "\n" for entry in kept).encode("utf-8"))
+            removed = 0
+            objects = self.root / "objects"
+            for path in objects.glob("*/*") if objects.is_dir() else ():
+                if path.name not in live and not path.name.startswith("."):
+                    path.unlink()
+                    self._bodies.pop(path.name, None)
+                    removed += 1
+            for directory in objects.glob("*") if objects.is_dir() else ():
+                if directory.is_dir() and not any(directory.iterdir()):
+                    directory.rmdir()
+        return len(entries) - len(kept), removed
+
+    def prune_if_due(self, interval: float = PRUNE_INTERVAL_SECONDS) -> None:
+        """Apply the retention period at most once per ``interval`` seconds, tracked by a stamp file's mtime."""
+        if not self.retention_days:
+            return
+        stamp = self.root / "pruned"
+        try:
+            if time.time() - stamp.stat().st_mtime < interval:
+                return
+        except FileNotFoundError:
+            pass
+        entries, objects = self.prune(self.retention_days)
+        stamp.parent.mkdir(parents=True, exist_ok=True)
+        stamp.touch()
+        if entries or objects:
+            LOGGER.info(
+                "Pruned %s archived fetches and %s pages older than %s days", entries, objects, self.retention_days
+            )
+
+
+@dataclass(frozen=True)
+class ReplayedPage:
+    rows: Optional[List[diff.Row]]
+    fingerprint: Optional[str]
+    error: Optional[str]
+
+
+_worker_archive: Optional[PageArchive] = None
+
+
+def _open_worker_archive(root: str) -> None:
+    global _worker_archive
+    _worker_archive = PageArchive(root, codec="gzip")
+
+
+Job = Tuple[str, int]
+
+
+def _replay_page(job: Job, backend: str, archive: Optional[PageArchive] = None) -> ReplayedPage:
+    digest, minimum_count = job
+    body = (archive or _worker_archive).load(digest)
+    try:
+        records = parse.parse_html_content(body.decode("utf-8", errors="replace"), minimum_count, backend)
+    except parse.ParseError as exc:
+        return ReplayedPage(None, None, str(exc))
+    rows = sorted(diff.rows_from_records(records))
+    return ReplayedPage(rows, parse.result_fingerprint(records), None)
+
+
+def _replay_all(archive: PageArchive, jobs: Sequence[Job], backend: str, workers: int) -> Dict[Job, ReplayedPage]:
+    """Parse each distinct page once, in worker processes when ``workers`` > 1."""
+    if workers <= 1 or len(jobs) < 2:
+        return {job: _replay_page(job, backend, archive) for job in jobs}
+    # Contiguous chunks keep a delta chain in one worker, whose cache then decodes each object once.
+    chunksize = max(1, min(KEYFRAME_INTERVAL, len(jobs) // workers))
+    with ProcessPoolExecutor(workers, initializer=_open_worker_archive, initargs=(str(archive.root),)) as pool:
+        return dict(zip(jobs, pool.map(_replay_page, jobs, [backend] * len(jobs), chunksize=chunksize)))
+
+
+def replay(
+    archive: PageArchive,
+    sources: Sequence[str] = (),
+    since: Optional[datetime] = None,
+    backend: str = parse.DEFAULT_PARSER_BACKEND,
+    minimum_count: Optional[int] = None,
+    workers: int = 1,
+) -> dict:
+    """Re-parse archived pages and classify each source's consecutive snapshots.
+
+    Pages are checked against the minimum result count recorded with each
+    fetch unless ``minimum_count`` overrides it. ``mismatches`` lists
+    fetches whose fingerprint or parse error now differs from what the
+    tracker recorded when it fetched them.
+    """
+    started = time.perf_counter()
+    entries = [
+        entry
+        for entry in archive.entries()
+        if (not sources or entry["source"] in sources)
+        and (since is None or datetime.fromisoformat(entry["fetched_at"]) >= since)
+    ]
+    default_minimum = Source.minimum_result_count
+
+    def job(entry: dict) -> Job:
+        if minimum_count is not None:
+            return entry["sha256"], minimum_count
+        return entry["sha256"], entry.get("minimum_result_count") or default_minimum
+
+    jobs = list(dict.fromkeys(job(entry) for entry in entries))
+    pages = _replay_all(archive, jobs, backend, workers)
+
+    changes: Counter = Counter()
+    mismatches = []
+    previous: Dict[str, ReplayedPage] = {}
+    for entry in entries:
+        page = pages[job(entry)]
+        if (page.fingerprint, page.error) != (entry.get("fingerprint"), entry.get("error")):
+            mismatches.append({
+                "fetched_at": entry["fetched_at"],
+                "source": entry["source"],
+                "sha256": entry["sha256"],
+                "recorded": entry.get("error") or entry.get("fingerprint"),
+                "replayed": page.error or page.fingerprint,
+            })
+        if page.rows is None:
+            continue
+        last = previous.get(entry["source"])
+        if last is not None and last is not page:
+            changes.update(
+                change.change_type
+                for change in diff.diff_snapshots(last.rows, page.rows)
+                if change.change_type != "unchanged"
+            )
+        previous[entry["source"]] = page
+
+    seconds = time.perf_counter() - started
+    replayed_bytes = sum(entry["bytes"] for entry in entries)
+    return {
+        "fetches": len(entries),
+        "pages": len({digest for digest, _minimum in jobs}),
+        "rows": sum(len(page.rows) for page in pages.values() if page.rows is not None),
+        "parse_errors": sum(1 for page in pages.values() if page.error is not None),
+        "changes": dict(sorted(changes.items())),
+        "mismatches": mismatches,
+        "seconds": seconds,
+        "fetches_per_second": len(entries) / seconds if seconds else None,
+        "megabytes_per_second": replayed_bytes / seconds / 1e6 if seconds else None,
+    }
+
+
+def main(argv=None) -> int:
+    archive_dir = os.getenv("SPPU_ARCHIVE_DIR", "").strip()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser("replay", help="re-parse archived pages and report changes and regressions")
+    replay_parser.add_argument("--archive", default=archive_dir, required=not archive_dir)
+    replay_parser.add_argument("--source", action="append", default=[], help="replay only this source (repeatable)")
+    replay_parser.add_argument("--since", type=datetime.fromisoformat, help="replay fetches from this time on")
+    replay_parser.add_argument("--backend", choices=sorted(parse.PARSER_BACKENDS), default=Settings.parser_backend)
+    replay_parser.add_argument(
+        "--minimum-result-count", type=int, help="override the minimum recorded with each fetch"
+    )
+    replay_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    prune_parser = commands.add_parser("prune", help="delete archived pages older than the retention period")
+    prune_parser.add_argument("--archive", default=archive_dir, required=not archive_dir)
+    prune_parser.add_argument("--retention-days", type=float, default=Settings.archive_retention_days)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    archive = PageArchive(args.archive, codec="gzip")
+    if args.command == "prune":
+        entries, objects = archive.prune(args.retention_days)
+        print(f"Removed {entries} archived fetches and {objects} pages")
+        return 0
+
+    since = args.since
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    report = replay(archive, args.source, since, args.backend, args.minimum_result_count, args.workers)
+    for mismatch in report["mismatches"]:
+        print(
+            f"MISMATCH {mismatch['fetched_at']} {mismatch['source']} {mismatch['sha256'][:12]}: "
+            f"recorded {mismatch['recorded']!r}, replayed {mismatch['replayed']!r}"
+        )
+    print(json.dumps({**report, "mismatches": len(report["mismatches"])}, indent=2))
+    return 1 if report["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,78 @@
+import gzip
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available.
+    brotli = None
+
+
+def version_etag(version: Hashable) -> str:
+    return hashlib.sha256(repr(version).encode("utf-8")).hexdigest()[:32]
+
+
+def _encode(body: bytes) -> Dict[str, bytes]:
+    encoded = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(body)
+    return encoded
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    version: Hashable
+    body: bytes
+    checked_at: float
+    etag: str = ""
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+
+class PayloadCache:
+    """Serialized response bodies reused until the data version they were built from changes.
+
+    Within ``ttl`` seconds of the last version check an entry is served without
+    touching the database; after that the caller re-reads the version and
+    either confirms the entry or stores a rebuilt body. Compressed variants and
+    the ETag are built once per stored version. ``ttl <= 0`` disables caching.
+    """
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: Dict[str, CacheEntry] = {}
+
+    def fresh(self, key: str) -> Optional[CacheEntry]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and self._clock() - entry.checked_at < self.ttl:
+            return entry
+        return None
+
+    def lookup(self, key: str, version: Hashable) -> Optional[CacheEntry]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            entry = CacheEntry(entry.version, entry.body, self._clock(), entry.etag, entry.encoded)
+            self._entries[key] = entry
+            return entry
+
+    def store(self, key: str, version: Hashable, body: bytes) -> CacheEntry:
+        entry = CacheEntry(version, body, self._clock(), version_etag(version), _encode(body))
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = entry
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -1,15 +1,27 @@
+import io
 import logging
+import threading
 import time
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import date, datetime, timezone
-from typing import Dict, List, Optional, Set, Tuple
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import psycopg2
-from psycopg2.extras import RealDictCursor, execute_batch, execute_values
+import psycopg2.extensions
+from psycopg2.extras import Json, RealDictCursor, execute_values
+
+from src import metrics
+from src.diff import Row, diff_snapshots
+from src.settings import DEFAULT_SOURCE
 
 
 LOGGER = logging.getLogger(__name__)
 ResultPair = Tuple[str, date]
+TRACKER_NAME = "sppu-result-tracker"
+HISTORY_CHANNEL = "results_history"
+DEFAULT_CHANNELS = ("discord",)
 
 
 @dataclass(frozen=True)
@@ -44,17 +56,100 @@ class NotificationEvent:
     course_name: str
     result_date: Optional[date]
     previous_date: Optional[date]
+    source: str = DEFAULT_SOURCE
+
+
+@dataclass(frozen=True)
+class Subscription:
+    id: int
+    pattern: str
+    channel: str
+    target: str
+    source: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class TrackerStatus:
+    fingerprint: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    body_hash: Optional[str] = None
+
+
+@lru_cache(maxsize=None)
+def _metered_cursor(cursor_class):
+    class MeteredCursor(cursor_class):
+        def execute(self, query, vars=None):
+            self.connection._begin()
+            with metrics.timed("db_statement_seconds", "db_round_trips"):
+                return super().execute(query, vars)
+
+        def executemany(self, query, vars_list):
+            self.connection._begin()
+            with metrics.timed("db_statement_seconds", "db_round_trips"):
+                return super().executemany(query, vars_list)
+
+        def copy_expert(self, sql, file, size=8192):
+            self.connection._begin()
+            with metrics.timed("db_statement_seconds", "db_round_trips"):
+                return super().copy_expert(sql, file, size)
+
+    MeteredCursor.__name__ = f"Metered{cursor_class.__name__}"
+    return MeteredCursor
+
+
+class MeteredConnection(psycopg2.extensions.connection):
+    """Connection whose statements, commits and transactions count toward the active run's metrics.
+
+    A transaction is timed from its first statement to its commit or rollback.
+    """
+
+    _transaction_started: Optional[float] = None
+
+    def _begin(self) -> None:
+        if self._transaction_started is None and not self.autocommit:
+            self._transaction_started = time.perf_counter()
+
+    def _end(self) -> None:
+        if self._transaction_started is not None:
+            metrics.observe("db_transaction_seconds", time.perf_counter() - self._transaction_started)
+            self._transaction_started = None
+
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _metered_cursor(cursor_class)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        try:
+            with metrics.timed("db_statement_seconds", "db_round_trips"):
+                return super().commit()
+        finally:
+            self._end()
 
+    def rollback(self):
+        try:
+            return super().rollback()
+        finally:
+            self._end()
+
+
+def status_name(source: str) -> str:
+    """Name of a source's tracker_status row; the SPPU dashboard keeps the original one."""
+    return TRACKER_NAME if source == DEFAULT_SOURCE else f"{TRACKER_NAME}:{source}"
 
-def connect(database_url: str, attempts: int = 3):
+
+def connect(database_url: str, attempts: int = 3, **connect_kwargs):
+    options = {
+        "connect_timeout": 10,
+        "application_name": "sppu-result-tracker",
+        "connection_factory": MeteredConnection,
+        **connect_kwargs,
+    }
     last_error = None
     for attempt in range(1, attempts + 1):
         try:
-            return psycopg2.connect(
-                database_url,
-                connect_timeout=10,
-                application_name="sppu-result-tracker",
-            )
+            return psycopg2.connect(database_url, **options)
         except psycopg2.OperationalError as exc:
             last_error = exc
             if attempt == attempts:
@@ -65,118 +160,489 @@ def connect(database_url: str, attempts: int = 3):
     raise last_error
 
 
+class ConnectionPool:
+    """Thread-safe pool of reusable connections, checked before they are handed out.
+
+    Idle connections older than ``check_after`` seconds are pinged with
+    ``SELECT 1`` and replaced if the server dropped them. ``maxconn=0`` turns
+    pooling off and opens a fresh connection for every checkout.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        maxconn: int = 5,
+        autocommit: bool = False,
+        check_after: float = 30.0,
+        wait_timeout: float = 10.0,
+        **connect_kwargs,
+    ) -> None:
+        self.database_url = database_url
+        self.maxconn = maxconn
+        self.autocommit = autocommit
+        self.check_after = check_after
+        self.wait_timeout = wait_timeout
+        self.connect_kwargs = connect_kwargs
+        self._idle: List[Tuple[object, float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn) if maxconn > 0 else None
+
+    def _open(self):
+        conn = connect(self.database_url, attempts=1, **self.connect_kwargs)
+        conn.autocommit = self.autocommit
+        return conn
+
+    @staticmethod
+    def _ping(conn) -> bool:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            if not conn.autocommit:
+                conn.rollback()
+            return True
+        except psycopg2.Error:
+            conn.close()
+            return False
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, returned_at = self._idle.pop()
+            if conn.closed:
+                continue
+            if time.monotonic() - returned_at >= self.check_after and not self._ping(conn):
+                LOGGER.warning("Discarded a stale pooled database connection")
+                continue
+            return conn
+        return self._open()
+
+    def _release(self, conn, broken: bool) -> None:
+        if not broken and not conn.closed and not conn.autocommit:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken or conn.closed:
+            conn.close()
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self) -> Iterator:
+        if self._slots is None:
+            conn = self._open()
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise RuntimeError("Timed out waiting for a pooled database connection")
+        conn = None
+        broken = False
+        try:
+            conn = self._checkout()
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if conn is not None:
+                self._release(conn, broken)
+            self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _returned_at in idle:
+            conn.close()
+
+
+Database = Union[str, ConnectionPool]
+
+
+@contextmanager
+def _connection(database: Database) -> Iterator:
+    """Check out a pooled connection, or open one for a single call from a URL."""
+    if isinstance(database, ConnectionPool):
+        with database.connection() as conn:
+            yield conn
+        return
+
+    conn = connect(database)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
 def classify_changes(
     active_pairs: Set[ResultPair],
     scraped_pairs: Set[ResultPair],
     display_names: Dict[str, str],
 ) -> ChangeSet:
-    active_by_course: Dict[str, Set[date]] = {}
-    scraped_by_course: Dict[str, Set[date]] = {}
-    for key, result_date in active_pairs:
-        active_by_course.setdefault(key, set()).add(result_date)
-    for key, result_date in scraped_pairs:
-        scraped_by_course.setdefault(key, set()).add(result_date)
+    """Classify two sets of result pairs with the merge diff; APPLY_CHANGES_SQL does the same in SQL."""
+    def rows(pairs: Set[ResultPair]) -> Iterator[Row]:
+        for key, result_date in sorted(pairs):
+            yield key, result_date, display_names.get(key, key)
 
     additions: Set[ResultPair] = set()
     destructive = []
-
-    for key in active_by_course.keys() | scraped_by_course.keys():
-        old_dates = active_by_course.get(key, set())
-        new_dates = scraped_by_course.get(key, set())
-        name = display_names.get(key, key)
-
-        if len(old_dates) == 1 and len(new_dates) == 1 and old_dates != new_dates:
+    for change in diff_snapshots(rows(active_pairs), rows(scraped_pairs)):
+        if change.change_type == "added":
+            additions.add((change.course_key, change.new_date))
+        elif change.change_type != "unchanged":
             destructive.append(
                 ChangeCandidate(
-                    change_type="updated",
-                    course_key=key,
-                    course_name=name,
-                    old_date=next(iter(old_dates)),
-                    new_date=next(iter(new_dates)),
+                    change_type=change.change_type,
+                    course_key=change.course_key,
+                    course_name=change.course_name,
+                    old_date=change.old_date,
+                    new_date=change.new_date,
                 )
             )
-            continue
-
-        additions.update((key, value) for value in new_dates - old_dates)
-        destructive.extend(
-            ChangeCandidate(
-                change_type="removed",
-                course_key=key,
-                course_name=name,
-                old_date=value,
-                new_date=None,
-            )
-            for value in old_dates - new_dates
-        )
-
     return ChangeSet(additions=additions, destructive=tuple(destructive))
 
 
-def _insert_baseline(cursor, scraped_by_pair: Dict[ResultPair, str], seen_at: datetime) -> None:
-    execute_values(
-        cursor,
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, date):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_rows(cursor, table: str, rows: Iterable[Tuple]) -> None:
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} FROM STDIN", buffer)
+
+
+def _stage_scraped(cursor, scraped_by_pair: Dict[ResultPair, str]) -> None:
+    cursor.execute(
         """
-        INSERT INTO results
-            (course_key, course_name, result_date, notification_sent, first_seen, last_seen)
-        VALUES %s
-        ON CONFLICT (course_key, result_date) DO UPDATE SET
-            course_name = EXCLUDED.course_name,
-            notification_sent = TRUE,
-            last_seen = EXCLUDED.last_seen,
-            updated_at = NOW()
-        """,
-        [
-            (key, name, result_date, True, seen_at, seen_at)
-            for (key, result_date), name in scraped_by_pair.items()
-        ],
-        page_size=250,
+        CREATE TEMPORARY TABLE scraped_results (
+            course_key text not null,
+            course_name text not null,
+            result_date date not null,
+            primary key (course_key, result_date)
+        ) ON COMMIT DROP
+        """
+    )
+    _copy_rows(
+        cursor,
+        "scraped_results (course_key, course_name, result_date)",
+        ((key, name, result_date) for (key, result_date), name in scraped_by_pair.items()),
     )
 
 
-def _upsert_added_result(cursor, key: str, name: str, result_date: date, seen_at: datetime) -> int:
+def _insert_baseline(cursor, seen_at: datetime, source: str) -> None:
     cursor.execute(
         """
         INSERT INTO results
-            (course_key, course_name, result_date, notification_sent, first_seen, last_seen)
-        VALUES (%s, %s, %s, FALSE, %s, %s)
-        ON CONFLICT (course_key, result_date) DO UPDATE SET
+            (source, course_key, course_name, result_date, notification_sent, first_seen, last_seen)
+        SELECT %(source)s, course_key, course_name, result_date, TRUE, %(seen_at)s, %(seen_at)s
+        FROM scraped_results
+        ORDER BY course_key, result_date
+        ON CONFLICT (source, course_key, result_date) DO UPDATE SET
             course_name = EXCLUDED.course_name,
-            notification_sent = FALSE,
+            notification_sent = TRUE,
             last_seen = EXCLUDED.last_seen,
             updated_at = NOW()
-        RETURNING id
         """,
-        (key, name, result_date, seen_at, seen_at),
+        {"seen_at": seen_at, "source": source},
     )
-    return int(cursor.fetchone()["id"])
 
 
-def _record_history(
+# The SQL form of diff_snapshots: one full join pairs every stored result of the
+# source with the scraped row of the same course and date, and per-course counts classify
+# the unmatched rows. A course whose single date moved to another single date
+# is an update; every other difference is an exact-pair addition or removal.
+APPLY_CHANGES_SQL = """
+WITH diff AS (
+    SELECT r.id,
+           COALESCE(r.course_key, s.course_key) AS course_key,
+           r.result_date AS old_date,
+           s.result_date AS new_date,
+           r.course_name AS old_name,
+           s.course_name AS new_name,
+           COUNT(r.id) OVER course = 1 AND COUNT(s.course_key) OVER course = 1
+               AND COUNT(*) OVER course = 2 AS moved,
+           MAX(s.result_date) OVER course AS moved_to,
+           MAX(s.course_name) OVER course AS scraped_name
+    FROM (SELECT * FROM results WHERE source = %(source)s) r
+    FULL JOIN scraped_results s
+        ON s.course_key = r.course_key AND s.result_date = r.result_date
+    WINDOW course AS (PARTITION BY COALESCE(r.course_key, s.course_key))
+),
+added AS (
+    INSERT INTO results
+        (source, course_key, course_name, result_date, notification_sent, first_seen, last_seen)
+    SELECT %(source)s, course_key, new_name, new_date, FALSE, %(seen_at)s, %(seen_at)s
+    FROM diff
+    WHERE old_date IS NULL AND NOT moved
+    ORDER BY course_key, new_date
+    ON CONFLICT (source, course_key, result_date) DO UPDATE SET
+        course_name = EXCLUDED.course_name,
+        notification_sent = FALSE,
+        last_seen = EXCLUDED.last_seen,
+        updated_at = NOW()
+    RETURNING id, course_key, course_name, NULL::date AS old_date, result_date AS new_date
+),
+updated AS (
+    UPDATE results r
+    SET course_name = d.scraped_name,
+        result_date = d.moved_to,
+        notification_sent = FALSE,
+        first_seen = %(seen_at)s,
+        last_seen = %(seen_at)s,
+        updated_at = NOW()
+    FROM diff d
+    WHERE r.id = d.id AND d.new_date IS NULL AND d.moved
+    RETURNING r.id, r.course_key, r.course_name, d.old_date, d.moved_to AS new_date
+),
+removed AS (
+    DELETE FROM results r
+    USING diff d
+    WHERE r.id = d.id AND d.new_date IS NULL AND NOT d.moved
+    RETURNING r.id, r.course_key, COALESCE(d.scraped_name, r.course_name) AS course_name,
+              r.result_date AS old_date, NULL::date AS new_date
+),
+seen AS (
+    UPDATE results r
+    SET last_seen = %(seen_at)s, course_name = d.new_name
+    FROM diff d
+    WHERE r.id = d.id AND d.new_date IS NOT NULL
+    RETURNING r.id
+),
+history AS (
+    INSERT INTO results_history
+        (result_id, source, course_key, course_name, change_type, old_result_date, new_result_date)
+    SELECT id, %(source)s, course_key, course_name, change_type, old_date, new_date
+    FROM (
+        SELECT 1 AS batch, 'added' AS change_type, * FROM added
+        UNION ALL
+        SELECT 2, 'updated', * FROM updated
+        UNION ALL
+        SELECT 3, 'removed', * FROM removed
+    ) changes
+    ORDER BY batch, course_key, COALESCE(new_date, old_date)
+    RETURNING id, course_key
+),
+deliveries AS (
+    INSERT INTO notification_deliveries (history_id, channel)
+    SELECT history.id, channel
+    FROM history CROSS JOIN unnest(%(channels)s::text[]) AS channel
+)
+SELECT
+    (SELECT COUNT(*) FROM added) AS added,
+    (SELECT COUNT(*) FROM updated) AS updated,
+    (SELECT COUNT(*) FROM removed) AS removed,
+    (SELECT COUNT(*) FROM seen) AS seen,
+    ARRAY(SELECT id FROM history ORDER BY id) AS history_ids,
+    ARRAY(SELECT course_key FROM history ORDER BY id) AS history_keys
+"""
+
+
+# Per source, broadcast deliveries only: events with a delivery still to send, events with a
+# retrying delivery and events with a dead one. A subscriber's broken target must not mark the
+# tracker unhealthy.
+NOTIFICATION_COUNTS_SQL = """
+    SELECT h.source,
+           COUNT(DISTINCT d.history_id) FILTER (WHERE d.dead_at IS NULL) AS pending,
+           COUNT(DISTINCT d.history_id) FILTER (WHERE d.dead_at IS NULL AND d.last_error IS NOT NULL) AS failed,
+           COUNT(DISTINCT d.history_id) FILTER (WHERE d.dead_at IS NOT NULL) AS dead
+    FROM notification_deliveries d
+    JOIN results_history h ON h.id = d.history_id
+    WHERE d.sent_at IS NULL AND d.subscription_id IS NULL
+    GROUP BY h.source
+"""
+
+
+def _queue_targeted(cursor, subscribers, source: str, history_ids: List[int], course_keys: List[str]) -> int:
+    """Queue one delivery per subscription matching each new history event, in bulk."""
+    rows = [
+        (history_id, channel, subscription_id)
+        for history_id, key in zip(history_ids, course_keys)
+        for subscription_id, channel in subscribers.match(source, key)
+    ]
+    if rows:
+        execute_values(
+            cursor,
+            """
+            INSERT INTO notification_deliveries (history_id, channel, subscription_id)
+            VALUES %s
+            ON CONFLICT DO NOTHING
+            """,
+            rows,
+            template="(%s::bigint, %s::text, %s::bigint)",
+            page_size=1000,
+        )
+    metrics.increment("notifications_targeted", len(rows))
+    return len(rows)
+
+
+def _save_status(
     cursor,
-    event_type: str,
-    result_id: Optional[int],
-    course_key: str,
-    course_name: str,
-    old_date: Optional[date],
-    new_date: Optional[date],
-) -> int:
+    source: str,
+    seen_at: datetime,
+    active_results: int,
+    changed: bool,
+    fingerprint: Optional[str] = None,
+    validators=None,
+) -> None:
+    """Refresh the summary row read by /api/health inside the sync transaction."""
     cursor.execute(
-        """
-        INSERT INTO results_history
-            (result_id, course_key, course_name, change_type, old_result_date, new_result_date)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        RETURNING id
+        f"""
+        INSERT INTO tracker_status (
+            name, source, fingerprint, etag, last_modified, body_hash, last_checked, last_synced,
+            last_change, active_results, pending_notifications, failed_notifications, dead_notifications
+        )
+        SELECT %(name)s, %(source)s, %(fingerprint)s, %(etag)s, %(last_modified)s, %(body_hash)s,
+               %(seen_at)s, %(seen_at)s, %(last_change)s, %(active_results)s,
+               COALESCE(counts.pending, 0), COALESCE(counts.failed, 0), COALESCE(counts.dead, 0)
+        FROM (SELECT %(source)s AS source) this
+        LEFT JOIN ({NOTIFICATION_COUNTS_SQL}) AS counts USING (source)
+        ON CONFLICT (name) DO UPDATE SET
+            fingerprint = EXCLUDED.fingerprint,
+            etag = EXCLUDED.etag,
+            last_modified = EXCLUDED.last_modified,
+            body_hash = EXCLUDED.body_hash,
+            last_checked = EXCLUDED.last_checked,
+            last_synced = EXCLUDED.last_synced,
+            last_change = COALESCE(EXCLUDED.last_change, tracker_status.last_change),
+            active_results = EXCLUDED.active_results,
+            pending_notifications = EXCLUDED.pending_notifications,
+            failed_notifications = EXCLUDED.failed_notifications,
+            dead_notifications = EXCLUDED.dead_notifications
         """,
-        (result_id, course_key, course_name, event_type, old_date, new_date),
+        {
+            "name": status_name(source),
+            "source": source,
+            "fingerprint": fingerprint,
+            "etag": getattr(validators, "etag", None),
+            "last_modified": getattr(validators, "last_modified", None),
+            "body_hash": getattr(validators, "body_hash", None),
+            "seen_at": seen_at,
+            "last_change": seen_at if changed else None,
+            "active_results": active_results,
+        },
     )
-    return int(cursor.fetchone()["id"])
+
+
+def load_tracker_status(database: Database, source: str = DEFAULT_SOURCE) -> TrackerStatus:
+    with _connection(database) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                """
+                SELECT fingerprint, etag, last_modified, body_hash
+                FROM tracker_status
+                WHERE name = %s
+                """,
+                (status_name(source),),
+            )
+            row = cursor.fetchone()
+        return TrackerStatus(**row) if row else TrackerStatus()
+
+
+def load_change_activity(
+    database: Database,
+    days: int = 180,
+    source: str = DEFAULT_SOURCE,
+) -> Dict[Tuple[int, int], int]:
+    """Count one source's change-bearing sync runs per ``(weekday, hour)`` in IST, Monday being 0."""
+    with _connection(database) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                """
+                SELECT EXTRACT(ISODOW FROM local_time)::int - 1 AS weekday,
+                       EXTRACT(HOUR FROM local_time)::int AS hour,
+                       COUNT(DISTINCT created_at) AS runs
+                FROM (
+                    SELECT created_at, created_at AT TIME ZONE 'Asia/Kolkata' AS local_time
+                    FROM results_history
+                    WHERE source = %s AND created_at >= NOW() - make_interval(days => %s)
+                ) recent
+                GROUP BY 1, 2
+                """,
+                (source, days),
+            )
+            return {(row["weekday"], row["hour"]): int(row["runs"]) for row in cursor.fetchall()}
+
+
+def record_heartbeat(database: Database, fingerprint: str, validators=None, source: str = DEFAULT_SOURCE) -> bool:
+    """Touch the status row if the scraped table matches the last synchronized one."""
+    with _connection(database) as conn, conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE tracker_status
+                SET last_checked = NOW()
+                WHERE name = %s AND fingerprint = %s
+                """,
+                (status_name(source), fingerprint),
+            )
+            matched = cursor.rowcount == 1
+            if matched and validators is not None:
+                cursor.execute(
+                    """
+                    UPDATE tracker_status
+                    SET etag = %s, last_modified = %s, body_hash = %s
+                    WHERE name = %s
+                    """,
+                    (validators.etag, validators.last_modified, validators.body_hash, status_name(source)),
+                )
+            return matched
+
+
+class _LockTimer:
+    """Observe how long a transaction-level advisory lock is held: from acquisition to commit or rollback."""
+
+    started: Optional[float] = None
+
+    def __enter__(self) -> "_LockTimer":
+        return self
+
+    def acquired(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *_exc) -> None:
+        if self.started is not None:
+            metrics.observe("sync_lock_seconds", time.perf_counter() - self.started)
 
 
 def sync_results(
-    database_url: str,
+    database: Database,
     scraped: List[Dict[str, object]],
     suspicious_count_ratio: float = 0.70,
+    fingerprint: Optional[str] = None,
+    validators=None,
+    source: str = DEFAULT_SOURCE,
+    channels: Iterable[str] = DEFAULT_CHANNELS,
+    subscribers=None,
 ) -> SyncOutcome:
+    """Apply one source's scraped snapshot with a constant number of set-based statements.
+
+    Each source syncs under its own advisory lock, so different sources can
+    stage their snapshots concurrently. Applying the changes also takes the
+    tracker-wide lock, so history ids commit in id order and readers paging
+    by ``id > last_id`` never skip a row. Every change queues one delivery
+    per notification channel in the same transaction, plus one per
+    subscription that ``subscribers.match(source, course_key)`` returns for it.
+    """
     if not scraped:
         raise ValueError("Cannot synchronize an empty result list")
 
@@ -185,198 +651,311 @@ def sync_results(
         (str(item["course_key"]), item["result_date"]): str(item["course_name"])
         for item in scraped
     }
-    scraped_pairs = set(scraped_by_pair)
-    conn = connect(database_url)
 
-    try:
-        with conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("SELECT pg_advisory_xact_lock(hashtext('sppu-result-tracker'))")
-                cursor.execute(
-                    """
-                    SELECT id, course_key, course_name, result_date
-                    FROM results
-                    """
-                )
-                active_rows = cursor.fetchall()
-
-                if not active_rows:
-                    _insert_baseline(cursor, scraped_by_pair, seen_at)
-                    return SyncOutcome(status="success", baseline_created=True)
-
-                if len(scraped) < len(active_rows) * suspicious_count_ratio:
-                    raise RuntimeError(
-                        f"Suspicious result count: {len(scraped)} instead of approximately {len(active_rows)}"
-                    )
-
-                active_pairs = {(row["course_key"], row["result_date"]) for row in active_rows}
-                result_ids = {
-                    (row["course_key"], row["result_date"]): int(row["id"])
-                    for row in active_rows
-                }
-                display_names = {row["course_key"]: row["course_name"] for row in active_rows}
-                display_names.update({key: name for (key, _), name in scraped_by_pair.items()})
-                changes = classify_changes(active_pairs, scraped_pairs, display_names)
-
-                added = updated = removed = 0
-                for key, result_date in sorted(changes.additions):
-                    name = scraped_by_pair[(key, result_date)]
-                    result_id = _upsert_added_result(cursor, key, name, result_date, seen_at)
-                    _record_history(cursor, "added", result_id, key, name, None, result_date)
-                    added += 1
-
-                for candidate in changes.destructive:
-                    if candidate.change_type == "updated":
-                        cursor.execute(
-                            """
-                            UPDATE results
-                            SET course_name = %s,
-                                result_date = %s,
-                                notification_sent = FALSE,
-                                first_seen = %s,
-                                last_seen = %s,
-                                updated_at = NOW()
-                            WHERE course_key = %s AND result_date = %s
-                            RETURNING id
-                            """,
-                            (
-                                candidate.course_name,
-                                candidate.new_date,
-                                seen_at,
-                                seen_at,
-                                candidate.course_key,
-                                candidate.old_date,
-                            ),
-                        )
-                        row = cursor.fetchone()
-                        if row:
-                            _record_history(
-                                cursor,
-                                "updated",
-                                int(row["id"]),
-                                candidate.course_key,
-                                candidate.course_name,
-                                candidate.old_date,
-                                candidate.new_date,
-                            )
-                            updated += 1
-                        continue
-
-                    result_id = result_ids.get((candidate.course_key, candidate.old_date))
-                    cursor.execute(
-                        """
-                        DELETE FROM results
-                        WHERE course_key = %s AND result_date = %s
-                        """,
-                        (candidate.course_key, candidate.old_date),
-                    )
-                    if cursor.rowcount:
-                        _record_history(
-                            cursor,
-                            "removed",
-                            result_id,
-                            candidate.course_key,
-                            candidate.course_name,
-                            candidate.old_date,
-                            None,
-                        )
-                        removed += 1
-
-                exact_seen = [
-                    (seen_at, scraped_by_pair[(key, result_date)], key, result_date)
-                    for key, result_date in scraped_pairs & active_pairs
-                ]
-                if exact_seen:
-                    execute_batch(
-                        cursor,
-                        """
-                        UPDATE results
-                        SET last_seen = %s, course_name = %s
-                        WHERE course_key = %s AND result_date = %s
-                        """,
-                        exact_seen,
-                        page_size=250,
-                    )
-
-                return SyncOutcome(
-                    status="success",
-                    added=added,
-                    updated=updated,
-                    removed=removed,
+    with _connection(database) as conn, _LockTimer() as lock, conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (status_name(source),))
+            lock.acquired()
+            _stage_scraped(cursor, scraped_by_pair)
+            cursor.execute("SELECT COUNT(*) AS count FROM results WHERE source = %s", (source,))
+            active_count = int(cursor.fetchone()["count"])
+
+            if not active_count:
+                _insert_baseline(cursor, seen_at, source)
+                metrics.increment("rows_written", cursor.rowcount)
+                _save_status(cursor, source, seen_at, len(scraped_by_pair), False, fingerprint, validators)
+                return SyncOutcome(status="success", baseline_created=True)
+
+            if len(scraped) < active_count * suspicious_count_ratio:
+                raise RuntimeError(
+                    f"Suspicious result count: {len(scraped)} instead of approximately {active_count}"
                 )
-    finally:
-        conn.close()
+
+            # History ids are assigned under this lock and committed before it is released.
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (TRACKER_NAME,))
+            cursor.execute(
+                APPLY_CHANGES_SQL, {"seen_at": seen_at, "source": source, "channels": list(channels)}
+            )
+            counts = cursor.fetchone()
+            outcome = SyncOutcome(
+                status="success",
+                added=int(counts["added"]),
+                updated=int(counts["updated"]),
+                removed=int(counts["removed"]),
+            )
+            changes = outcome.added + outcome.updated + outcome.removed
+            if changes and subscribers is not None:
+                _queue_targeted(cursor, subscribers, source, counts["history_ids"], counts["history_keys"])
+            # Changed results rows, their history rows and the last_seen refreshes.
+            metrics.increment("rows_written", 2 * changes + int(counts["seen"]))
+            changed = bool(changes)
+            _save_status(
+                cursor,
+                source,
+                seen_at,
+                active_count + outcome.added - outcome.removed,
+                changed,
+                fingerprint,
+                validators,
+            )
+            if changed:
+                # Delivered on commit; listeners then read the new history rows.
+                cursor.execute("SELECT pg_notify(%s, '')", (HISTORY_CHANNEL,))
+            return outcome
 
 
-def pending_notifications(database_url: str, limit: int = 100) -> List[NotificationEvent]:
-    conn = connect(database_url)
-    try:
+def save_run_metrics(database: Database, snapshot: dict) -> None:
+    """Keep the last run's metrics on the summary row for /api/health."""
+    with _connection(database) as conn, conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO tracker_status (name, last_run)
+                VALUES (%s, %s)
+                ON CONFLICT (name) DO UPDATE SET last_run = EXCLUDED.last_run
+                """,
+                (TRACKER_NAME, Json(snapshot)),
+            )
+
+
+def load_subscriptions(database: Database) -> List[Subscription]:
+    with _connection(database) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("SELECT id, pattern, channel, target, source FROM subscriptions ORDER BY id")
+            return [Subscription(**row) for row in cursor.fetchall()]
+
+
+def subscriptions_version(database: Database) -> Tuple:
+    """Changes whenever a subscription is added, removed or edited."""
+    with _connection(database) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*), MAX(id), MAX(updated_at) FROM subscriptions")
+            return tuple(cursor.fetchone())
+
+
+def add_subscription(
+    database: Database,
+    pattern: str,
+    channel: str,
+    target: str,
+    source: Optional[str] = None,
+) -> int:
+    """Store a subscription, or return the id of the identical one already stored."""
+    with _connection(database) as conn, conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO subscriptions (source, pattern, channel, target)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (COALESCE(source, ''), pattern, channel, target)
+                DO UPDATE SET updated_at = subscriptions.updated_at
+                RETURNING id
+                """,
+                (source, pattern, channel, target),
+            )
+            return int(cursor.fetchone()[0])
+
+
+def remove_subscription(database: Database, subscription_id: int) -> bool:
+    """Delete a subscription and the deliveries still queued for it."""
+    with _connection(database) as conn, conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM notification_deliveries WHERE subscription_id = %s AND sent_at IS NULL",
+                (subscription_id,),
+            )
+            cursor.execute("DELETE FROM subscriptions WHERE id = %s", (subscription_id,))
+            return cursor.rowcount == 1
+
+
+def latest_history_id(database: Database, source: str = DEFAULT_SOURCE) -> int:
+    with _connection(database) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) AS id FROM results_history WHERE source = %s", (source,))
+            return int(cursor.fetchone()["id"])
+
+
+def load_history_after(
+    database: Database,
+    after_id: int,
+    limit: int = 1000,
+    source: str = DEFAULT_SOURCE,
+) -> List[dict]:
+    """Return up to ``limit`` history events of ``source`` with ids above ``after_id``, oldest first."""
+    with _connection(database) as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(
                 """
-                SELECT id, result_id, change_type, course_name, old_result_date, new_result_date
+                SELECT id, source, course_key, course_name, change_type,
+                       old_result_date, new_result_date, created_at
                 FROM results_history
-                WHERE notification_sent = FALSE
-                ORDER BY created_at, id
+                WHERE source = %s AND id > %s
+                ORDER BY id
                 LIMIT %s
                 """,
-                (limit,),
-            )
-            rows = cursor.fetchall()
-        return [
-            NotificationEvent(
-                history_id=int(row["id"]),
-                result_id=int(row["result_id"]) if row["result_id"] is not None else None,
-                event_type=row["change_type"],
-                course_name=row["course_name"],
-                result_date=row["new_result_date"],
-                previous_date=row["old_result_date"],
+                (source, after_id, limit),
             )
-            for row in rows
-        ]
-    finally:
-        conn.close()
+            return [dict(row) for row in cursor.fetchall()]
+
+
+def _notification_event(row) -> NotificationEvent:
+    return NotificationEvent(
+        history_id=int(row["id"]),
+        result_id=int(row["result_id"]) if row["result_id"] is not None else None,
+        event_type=row["change_type"],
+        course_name=row["course_name"],
+        result_date=row["new_result_date"],
+        previous_date=row["old_result_date"],
+        source=row["source"],
+    )
 
 
-def mark_notification_sent(database_url: str, history_id: int, result_id: Optional[int]) -> None:
-    conn = connect(database_url)
-    try:
-        with conn:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    UPDATE results_history
-                    SET notification_sent = TRUE,
-                        notification_error = NULL
-                    WHERE id = %s
-                    """,
-                    (history_id,),
+@dataclass(frozen=True)
+class Delivery:
+    id: int
+    channel: str
+    attempts: int
+    event: NotificationEvent
+    subscription_id: Optional[int] = None
+    target: Optional[str] = None
+
+
+def lease_deliveries(
+    database: Database,
+    channel: str,
+    limit: int = 100,
+    lease_seconds: float = 300.0,
+) -> List[Delivery]:
+    """Take up to ``limit`` due deliveries of one channel, oldest events first.
+
+    The lease is committed at once: it counts the attempt and pushes
+    ``next_attempt_at`` past the lease, so concurrent workers skip these rows
+    and a worker that dies mid-send only delays them. No transaction stays
+    open while the channel sends.
+    """
+    with _connection(database) as conn, conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                """
+                UPDATE notification_deliveries d
+                SET attempts = d.attempts + 1,
+                    next_attempt_at = NOW() + make_interval(secs => %(lease)s)
+                FROM results_history h
+                WHERE h.id = d.history_id AND d.id IN (
+                    SELECT id
+                    FROM notification_deliveries
+                    WHERE channel = %(channel)s AND sent_at IS NULL AND dead_at IS NULL
+                      AND next_attempt_at <= NOW()
+                    ORDER BY next_attempt_at, id
+                    LIMIT %(limit)s
+                    FOR UPDATE SKIP LOCKED
                 )
-                if result_id is not None:
-                    cursor.execute(
-                        """
-                        UPDATE results
-                        SET notification_sent = TRUE
-                        WHERE id = %s
-                        """,
-                        (result_id,),
-                    )
-    finally:
-        conn.close()
+                RETURNING d.id AS delivery_id, d.attempts, d.subscription_id,
+                          (SELECT target FROM subscriptions s WHERE s.id = d.subscription_id) AS target,
+                          h.id, h.result_id, h.source, h.change_type,
+                          h.course_name, h.old_result_date, h.new_result_date
+                """,
+                {"channel": channel, "limit": limit, "lease": lease_seconds},
+            )
+            rows = sorted(cursor.fetchall(), key=lambda row: row["id"])
+    return [
+        Delivery(
+            int(row["delivery_id"]),
+            channel,
+            int(row["attempts"]),
+            _notification_event(row),
+            row["subscription_id"],
+            row["target"],
+        )
+        for row in rows
+    ]
+
+
+def record_deliveries(database: Database, outcomes: List[Tuple[Delivery, Optional[str], float]]) -> None:
+    """Store ``(delivery, error, retry_after)`` outcomes and refresh their events.
+
+    A delivery without an error is sent. A failed one is retried after
+    ``retry_after`` seconds, or dead-lettered when ``retry_after`` is None.
+    An event is sent once all of its broadcast deliveries are, and keeps the
+    first broadcast delivery error it has; subscriber deliveries do not
+    change it.
+    """
+    if not outcomes:
+        return
+    rows = [
+        (delivery.id, error[:1000] if error else None, retry_after is None, retry_after or 0.0)
+        for delivery, error, retry_after in outcomes
+    ]
+    history_ids = sorted({delivery.event.history_id for delivery, _error, _retry in outcomes})
+    with _connection(database) as conn, conn:
+        with conn.cursor() as cursor:
+            execute_values(
+                cursor,
+                """
+                WITH acks (id, error, dead, retry_after) AS (VALUES %s)
+                UPDATE notification_deliveries d
+                SET sent_at = CASE WHEN acks.error IS NULL THEN NOW() END,
+                    dead_at = CASE WHEN acks.error IS NOT NULL AND acks.dead THEN NOW() END,
+                    last_error = acks.error,
+                    next_attempt_at = NOW() + make_interval(secs => acks.retry_after)
+                FROM acks
+                WHERE d.id = acks.id
+                """,
+                rows,
+                template="(%s::bigint, %s::text, %s::boolean, %s::float8)",
+                page_size=len(rows),
+            )
+            # Channels acknowledge the same events concurrently: the row locks make
+            # the next statement see every delivery committed before it.
+            cursor.execute(
+                "SELECT id FROM results_history WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+                (history_ids,),
+            )
+            cursor.execute(
+                """
+                WITH events AS (
+                    SELECT h.id, h.result_id,
+                           bool_and(d.sent_at IS NOT NULL) AS sent,
+                           (array_agg(d.last_error ORDER BY d.id) FILTER (WHERE d.last_error IS NOT NULL))[1]
+                               AS error
+                    FROM results_history h
+                    JOIN notification_deliveries d ON d.history_id = h.id AND d.subscription_id IS NULL
+                    WHERE h.id = ANY(%s)
+                    GROUP BY h.id
+                ),
+                history AS (
+                    UPDATE results_history h
+                    SET notification_sent = events.sent,
+                        notification_error = events.error
+                    FROM events
+                    WHERE h.id = events.id
+                )
+                UPDATE results r
+                SET notification_sent = TRUE
+                FROM events
+                WHERE events.sent AND r.id = events.result_id
+                """,
+                (history_ids,),
+            )
 
 
-def mark_notification_failed(database_url: str, history_id: int, error: str) -> None:
-    conn = connect(database_url)
-    try:
-        with conn:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    UPDATE results_history
-                    SET notification_error = %s
-                    WHERE id = %s
-                    """,
-                    (error[:1000], history_id),
+def refresh_notification_counts(database: Database) -> int:
+    """Refresh every source's broadcast notification counts and return the events still pending."""
+    with _connection(database) as conn, conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH counts AS ({NOTIFICATION_COUNTS_SQL}),
+                status AS (
+                    UPDATE tracker_status t
+                    SET pending_notifications = COALESCE(counts.pending, 0),
+                        failed_notifications = COALESCE(counts.failed, 0),
+                        dead_notifications = COALESCE(counts.dead, 0)
+                    FROM tracker_status s
+                    LEFT JOIN counts ON counts.source = s.source
+                    WHERE t.name = s.name
                 )
-    finally:
-        conn.close()
+                SELECT COALESCE(SUM(pending), 0) FROM counts
+                """
+            )
+            return int(cursor.fetchone()[0])
@@ -0,0 +1,114 @@
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+Row = Tuple[str, date, str]
+CHANGE_TYPES = ("added", "updated", "removed", "unchanged")
+
+
+class Change:
+    """One result pair's fate between two snapshots."""
+
+    __slots__ = ("change_type", "course_key", "course_name", "old_date", "new_date")
+
+    def __init__(
+        self,
+        change_type: str,
+        course_key: str,
+        course_name: str,
+        old_date: Optional[date],
+        new_date: Optional[date],
+    ) -> None:
+        self.change_type = change_type
+        self.course_key = course_key
+        self.course_name = course_name
+        self.old_date = old_date
+        self.new_date = new_date
+
+    def _fields(self) -> Tuple:
+        return (self.change_type, self.course_key, self.course_name, self.old_date, self.new_date)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Change) and self._fields() == other._fields()
+
+    def __repr__(self) -> str:
+        return "Change({!r}, {!r}, {!r}, {!r}, {!r})".format(*self._fields())
+
+
+def rows_from_records(records: Iterable[Dict[str, object]]) -> Iterator[Row]:
+    """``(course_key, result_date, course_name)`` rows of parsed records, in their order."""
+    for record in records:
+        yield record["course_key"], record["result_date"], record["course_name"]
+
+
+def _courses(rows: Iterable[Row], side: str) -> Iterator[Tuple[str, List[Tuple[date, str]]]]:
+    """Group sorted rows by course, rejecting rows that are out of order or repeated."""
+    key = None
+    dates: List[Tuple[date, str]] = []
+    previous = None
+    for row_key, result_date, name in rows:
+        if row_key != key:
+            if previous is not None and row_key < key:
+                raise ValueError(f"The {side} snapshot is not sorted by course_key at {row_key!r}")
+            if dates:
+                yield key, dates
+            key, dates, previous = row_key, [], None
+        if previous is not None and result_date <= previous:
+            raise ValueError(f"The {side} snapshot repeats or misorders dates of {row_key!r}")
+        previous = result_date
+        dates.append((result_date, name))
+    if dates:
+        yield key, dates
+
+
+def _diff_course(key: str, old: List[Tuple[date, str]], new: List[Tuple[date, str]]) -> Iterator[Change]:
+    name = max(new_name for _date, new_name in new)
+    if len(old) == 1 and len(new) == 1 and old[0][0] != new[0][0]:
+        yield Change("updated", key, name, old[0][0], new[0][0])
+        return
+
+    old_index = new_index = 0
+    while old_index < len(old) or new_index < len(new):
+        if new_index == len(new) or (old_index < len(old) and old[old_index][0] < new[new_index][0]):
+            yield Change("removed", key, name, old[old_index][0], None)
+            old_index += 1
+        elif old_index == len(old) or new[new_index][0] < old[old_index][0]:
+            new_date, new_name = new[new_index]
+            yield Change("added", key, new_name, None, new_date)
+            new_index += 1
+        else:
+            new_date, new_name = new[new_index]
+            yield Change("unchanged", key, new_name, new_date, new_date)
+            old_index += 1
+            new_index += 1
+
+
+def diff_snapshots(old: Iterable[Row], new: Iterable[Row]) -> Iterator[Change]:
+    """Merge-join two snapshots sorted by course key and date in one pass.
+
+    A course whose single date moved to another single date is ``updated``;
+    every other difference is an exact-pair ``added`` or ``removed``, and
+    pairs in both snapshots are ``unchanged``. Updated and removed rows of a
+    course still on the page take its new name (the greatest, if it differs
+    between dates), as ``sync_results`` does. Changes come out in key and
+    date order, and only the rows of one course are held at a time.
+    """
+    old_courses = _courses(old, "old")
+    new_courses = _courses(new, "new")
+    old_course = next(old_courses, None)
+    new_course = next(new_courses, None)
+    while old_course is not None or new_course is not None:
+        if new_course is None or (old_course is not None and old_course[0] < new_course[0]):
+            key, dates = old_course
+            for old_date, name in dates:
+                yield Change("removed", key, name, old_date, None)
+            old_course = next(old_courses, None)
+        elif old_course is None or new_course[0] < old_course[0]:
+            key, dates = new_course
+            for new_date, name in dates:
+                yield Change("added", key, name, None, new_date)
+            new_course = next(new_courses, None)
+        else:
+            yield from _diff_course(old_course[0], old_course[1], new_course[1])
+            old_course = next(old_courses, None)
+            new_course = next(new_courses, None)
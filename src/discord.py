@@ -1,10 +1,17 @@
+import contextvars
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 import requests
+import requests.adapters
+
+from src import metrics
+from src.settings import DEFAULT_SOURCE
 
 
 COLORS = {
@@ -12,6 +19,10 @@ COLORS = {
     "updated": 0xD29922,
     "removed": 0xDA3633,
 }
+MAX_EMBEDS = 10
+MAX_MESSAGE_CHARACTERS = 6000
+MAX_DESCRIPTION_CHARACTERS = 4096
+DIGEST_THRESHOLD = 50
 
 
 @dataclass(frozen=True)
@@ -25,6 +36,7 @@ class DeliverySummary:
     delivered: int
     failed: int
     remaining: int
+    dead: int = 0
 
 
 def _webhook_with_wait(webhook_url: str) -> str:
@@ -34,7 +46,7 @@ def _webhook_with_wait(webhook_url: str) -> str:
     return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
 
 
-def _format_payload(event) -> dict:
+def _format_embed(event) -> dict:
     course_name = str(event.course_name or "")[:256]
     result_date = event.result_date.isoformat() if event.result_date else None
     previous_date = event.previous_date.isoformat() if event.previous_date else None
@@ -53,38 +65,289 @@ def _format_payload(event) -> dict:
         title = "📌 Result Removed"
         description = f"**{course_name}**\nPrevious date: `{previous_date}`"
 
+    return {
+        "title": title,
+        "description": description,
+        "color": COLORS.get(event.event_type, 0x57606A),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "footer": {"text": f"{_source_label(event)}History {event.history_id}"},
+    }
+
+
+def _source_label(event) -> str:
+    """``"<source> · "`` for events of any source but the default SPPU dashboard."""
+    source = getattr(event, "source", DEFAULT_SOURCE)
+    return "" if source == DEFAULT_SOURCE else f"{source} · "
+
+
+def _message(embeds: List[dict]) -> dict:
     return {
         "username": "SPPU Result Tracker",
         "allowed_mentions": {"parse": []},
-        "embeds": [
+        "embeds": embeds,
+    }
+
+
+def _format_payload(event) -> dict:
+    return _message([_format_embed(event)])
+
+
+def _embed_characters(embed: dict) -> int:
+    return len(embed.get("title", "")) + len(embed.get("description", "")) + len(embed["footer"]["text"])
+
+
+def pack_events(events: Sequence, max_embeds: int = MAX_EMBEDS) -> List[List]:
+    """Group events, in order, into messages within Discord's embed count and size limits."""
+    messages: List[List] = []
+    current: List = []
+    characters = 0
+    for event in events:
+        size = _embed_characters(_format_embed(event))
+        if current and (len(current) >= max_embeds or characters + size > MAX_MESSAGE_CHARACTERS):
+            messages.append(current)
+            current, characters = [], 0
+        current.append(event)
+        characters += size
+    if current:
+        messages.append(current)
+    return messages
+
+
+def _digest_line(event) -> str:
+    course_name = _source_label(event) + str(event.course_name or "")[:120]
+    if event.event_type == "updated":
+        return f"📢 **{course_name}** `{event.previous_date}` → `{event.result_date}`"
+    if event.event_type == "removed":
+        return f"📌 ~~{course_name}~~ `{event.previous_date}`"
+    return f"🎓 **{course_name}** `{event.result_date}`"
+
+
+def _format_digest(events: Sequence) -> dict:
+    counts: Dict[str, int] = {}
+    for event in events:
+        counts[event.event_type] = counts.get(event.event_type, 0) + 1
+    summary = ", ".join(f"{count} {event_type}" for event_type, count in sorted(counts.items()))
+
+    lines: List[str] = []
+    length = 0
+    for index, event in enumerate(events):
+        line = _digest_line(event)
+        more = f"…and {len(events) - index} more"
+        if length + len(line) + 1 > MAX_DESCRIPTION_CHARACTERS - len(more) - 1:
+            lines.append(more)
+            break
+        lines.append(line)
+        length += len(line) + 1
+
+    return _message(
+        [
             {
-                "title": title,
-                "description": description,
-                "color": COLORS.get(event.event_type, 0x57606A),
+                "title": f"📚 {len(events)} SPPU result updates ({summary})",
+                "description": "\n".join(lines),
+                "color": COLORS["added"],
                 "timestamp": datetime.now(timezone.utc).isoformat(),
-                "footer": {"text": f"History {event.history_id}"},
+                "footer": {"text": f"History {events[0].history_id}-{events[-1].history_id}"},
             }
-        ],
-    }
+        ]
+    )
+
+
+@dataclass
+class _Bucket:
+    limit: int
+    remaining: int
+    reset_at: float
+
+
+class RateLimiter:
+    """Token buckets per webhook, refilled from Discord's X-RateLimit-* response headers."""
 
+    def __init__(self, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, _Bucket] = {}
+        self.waited = 0.0
 
-def send_event(webhook_url: str, event, session: Optional[requests.Session] = None) -> SendResult:
+    def acquire(self, key: str) -> float:
+        """Take a token for ``key``, sleeping until the bucket resets if it is empty."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                now = self._clock()
+                if bucket is not None and now >= bucket.reset_at:
+                    bucket.remaining = bucket.limit
+                if bucket is None or bucket.remaining > 0:
+                    if bucket is not None:
+                        bucket.remaining -= 1
+                    self.waited += waited
+                    if waited:
+                        metrics.increment("rate_limit_wait_seconds", waited)
+                    return waited
+                delay = bucket.reset_at - now
+            self._sleep(delay)
+            waited += delay
+
+    def update(self, key: str, headers) -> None:
+        try:
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_after = float(headers["X-RateLimit-Reset-After"])
+            limit = int(headers.get("X-RateLimit-Limit", remaining + 1))
+        except (KeyError, TypeError, ValueError):
+            return
+        with self._lock:
+            self._buckets[key] = _Bucket(limit=max(limit, 1), remaining=remaining, reset_at=self._clock() + reset_after)
+
+    def block(self, key: str, retry_after: float) -> None:
+        with self._lock:
+            bucket = self._buckets.get(key) or _Bucket(limit=1, remaining=0, reset_at=0.0)
+            bucket.remaining = 0
+            bucket.reset_at = self._clock() + retry_after
+            self._buckets[key] = bucket
+
+
+def _retry_after(response: requests.Response) -> float:
+    try:
+        return float(response.json().get("retry_after", 1.0))
+    except (ValueError, TypeError, AttributeError, requests.JSONDecodeError):
+        return 1.0
+
+
+def _post_message(
+    webhook_url: str,
+    payload: dict,
+    session: Optional[requests.Session],
+    limiter: Optional[RateLimiter],
+) -> SendResult:
     client = session or requests.Session()
+    limiter = limiter or RateLimiter()
     endpoint = _webhook_with_wait(webhook_url)
 
     try:
-        response = client.post(endpoint, json=_format_payload(event), timeout=(10, 15))
+        limiter.acquire(endpoint)
+        with metrics.timed("discord_request_seconds", "discord_requests"):
+            response = client.post(endpoint, json=payload, timeout=(10, 15))
+        limiter.update(endpoint, response.headers)
         if response.status_code == 429:
-            try:
-                retry_after = float(response.json().get("retry_after", 1.0))
-            except (ValueError, TypeError, requests.JSONDecodeError):
-                retry_after = 1.0
+            retry_after = _retry_after(response)
             if retry_after <= 10:
-                time.sleep(max(0.1, retry_after))
-                response = client.post(endpoint, json=_format_payload(event), timeout=(10, 15))
+                limiter.block(endpoint, max(0.1, retry_after))
+                limiter.acquire(endpoint)
+                with metrics.timed("discord_request_seconds", "discord_requests"):
+                    response = client.post(endpoint, json=payload, timeout=(10, 15))
+                limiter.update(endpoint, response.headers)
 
         if response.status_code in (200, 204):
             return SendResult(sent=True)
         return SendResult(sent=False, error=f"Discord HTTP {response.status_code}: {response.text[:500]}")
     except requests.RequestException as exc:
         return SendResult(sent=False, error=f"{type(exc).__name__}: {exc}")
+
+
+def send_event(
+    webhook_url: str,
+    event,
+    session: Optional[requests.Session] = None,
+    limiter: Optional[RateLimiter] = None,
+) -> SendResult:
+    return _post_message(webhook_url, _format_payload(event), session, limiter)
+
+
+def send_message(
+    webhook_url: str,
+    events: Sequence,
+    session: Optional[requests.Session] = None,
+    limiter: Optional[RateLimiter] = None,
+) -> SendResult:
+    """Post several events as the embeds of one webhook message."""
+    return _post_message(webhook_url, _message([_format_embed(event) for event in events]), session, limiter)
+
+
+def send_digest(
+    webhook_url: str,
+    events: Sequence,
+    session: Optional[requests.Session] = None,
+    limiter: Optional[RateLimiter] = None,
+) -> SendResult:
+    """Post one summary message standing in for a large burst of events."""
+    return _post_message(webhook_url, _format_digest(events), session, limiter)
+
+
+class DiscordDelivery:
+    """Keep-alive delivery engine shared by every event of a run.
+
+    Discord shows webhook messages in the order it receives them, so each
+    webhook's messages are posted sequentially; different webhooks are served
+    concurrently from a thread pool. Events are packed up to ``max_embeds`` per
+    message, and a webhook with ``digest_threshold`` or more events gets a
+    single summary message instead. Every event gets the result of the
+    message that carried it.
+    """
+
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        limiter: Optional[RateLimiter] = None,
+        max_workers: int = 4,
+        max_embeds: int = MAX_EMBEDS,
+        digest_threshold: int = DIGEST_THRESHOLD,
+    ):
+        self.session = session or _keep_alive_session(max_workers)
+        self.limiter = limiter or RateLimiter()
+        self.max_workers = max_workers
+        self.max_embeds = max_embeds
+        self.digest_threshold = digest_threshold
+
+    def _drain(self, webhook_url: str, events: List) -> List[SendResult]:
+        if self.digest_threshold and len(events) >= self.digest_threshold:
+            result = send_digest(webhook_url, events, self.session, self.limiter)
+            return [result] * len(events)
+
+        results: List[SendResult] = []
+        for message in pack_events(events, self.max_embeds):
+            if len(message) == 1:
+                result = send_event(webhook_url, message[0], self.session, self.limiter)
+            else:
+                result = send_message(webhook_url, message, self.session, self.limiter)
+            results.extend([result] * len(message))
+        return results
+
+    def send_all(self, deliveries: Sequence[Tuple[str, object]]) -> List[SendResult]:
+        """Send ``(webhook_url, event)`` pairs and return one result per pair, in order."""
+        queues: Dict[str, List[int]] = {}
+        for index, (webhook_url, _event) in enumerate(deliveries):
+            queues.setdefault(webhook_url, []).append(index)
+
+        results: List[Optional[SendResult]] = [None] * len(deliveries)
+
+        def drain(webhook_url: str, indexes: List[int]) -> None:
+            sent = self._drain(webhook_url, [deliveries[index][1] for index in indexes])
+            for index, result in zip(indexes, sent):
+                results[index] = result
+
+        if len(queues) <= 1:
+            for webhook_url, indexes in queues.items():
+                drain(webhook_url, indexes)
+            return results
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(queues))) as pool:
+            # Each worker records into the caller's run metrics.
+            futures = [
+                pool.submit(contextvars.copy_context().run, drain, url, indexes)
+                for url, indexes in queues.items()
+            ]
+            for future in futures:
+                future.result()
+        return results
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def _keep_alive_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,154 @@
+import logging
+import queue
+import select
+import threading
+from collections import deque
+from typing import Deque, Iterator, List, Optional, Set
+
+from src import database
+
+
+LOGGER = logging.getLogger(__name__)
+BUFFER_SIZE = 1000
+QUEUE_SIZE = 256
+POLL_TIMEOUT = 5.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+class Subscription:
+    """One client's queue of history events; closed when the client falls too far behind."""
+
+    def __init__(self, backlog: List[dict], last_event_id: Optional[int]) -> None:
+        self.backlog = backlog
+        self.last_event_id = last_event_id
+        self.closed = False
+        self._queue: "queue.Queue[dict]" = queue.Queue(QUEUE_SIZE)
+
+    def _offer(self, event: dict) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.closed = True
+
+    def events(self, keepalive: float) -> Iterator[Optional[dict]]:
+        """Yield events in id order, or ``None`` after ``keepalive`` seconds without one."""
+        pending = iter(self.backlog)
+        while not self.closed:
+            event = next(pending, None)
+            if event is None:
+                try:
+                    event = self._queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield None
+                    continue
+            if self.last_event_id is not None and event["id"] <= self.last_event_id:
+                continue
+            self.last_event_id = event["id"]
+            yield event
+
+
+class EventHub:
+    """Fan out new ``results_history`` rows from one LISTEN connection to every subscriber.
+
+    ``sync_results`` notifies ``HISTORY_CHANNEL`` when it commits changes; the
+    hub then reads the new rows once and hands them to each subscription. Recent
+    events stay in a ring buffer so reconnecting clients resume from their last
+    event id without a query; older resumes replay up to ``BUFFER_SIZE`` events
+    from ``database_source``.
+    """
+
+    def __init__(self, listen_url: str, database_source: database.Database = None) -> None:
+        self.listen_url = listen_url
+        self.database = database_source or listen_url
+        self.last_id: Optional[int] = None
+        self._buffer: Deque[dict] = deque(maxlen=BUFFER_SIZE)
+        self._subscribers: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-hub", daemon=True)
+                self._thread.start()
+        if not self._ready.wait(timeout):
+            raise RuntimeError("Timed out waiting for the history listener")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscription:
+        self.start()
+        with self._lock:
+            backlog = []
+            replay = last_event_id is not None and last_event_id < self.last_id
+            if replay and self._buffer and last_event_id >= self._buffer[0]["id"] - 1:
+                backlog = [event for event in self._buffer if event["id"] > last_event_id]
+                replay = False
+            subscription = Subscription(backlog, last_event_id)
+            self._subscribers.add(subscription)
+        if replay:
+            # Events committed meanwhile also reach the queue; Subscription drops duplicates.
+            subscription.backlog = database.load_history_after(self.database, last_event_id, BUFFER_SIZE)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _publish(self, events: List[dict]) -> None:
+        with self._lock:
+            self._buffer.extend(events)
+            self.last_id = events[-1]["id"]
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            for event in events:
+                subscription._offer(event)
+            if subscription.closed:
+                self.unsubscribe(subscription)
+
+    def _catch_up(self) -> None:
+        if self.last_id is None:
+            self.last_id = database.latest_history_id(self.database)
+            return
+        while True:
+            events = database.load_history_after(self.database, self.last_id, BUFFER_SIZE)
+            if events:
+                self._publish(events)
+            if len(events) < BUFFER_SIZE:
+                return
+
+    def _run(self) -> None:
+        delay = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = database.connect(self.listen_url, attempts=1)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {database.HISTORY_CHANNEL}")
+                # Rows committed while the listener was down are read before waiting again.
+                self._catch_up()
+                self._ready.set()
+                delay = 1.0
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], POLL_TIMEOUT)[0]:
+                        conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self._catch_up()
+            except Exception as exc:
+                LOGGER.warning("History listener failed; reconnecting in %.0fs: %s", delay, exc)
+                self._stop.wait(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            finally:
+                if conn is not None:
+                    conn.close()
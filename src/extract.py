@@ -1,11 +1,15 @@
+import hashlib
 import logging
 import random
 import time
+from dataclasses import dataclass
 from email.utils import parsedate_to_datetime
-from typing import Optional
+from typing import Iterator, Optional, Union
 
 import requests
 
+from src import metrics
+
 
 LOGGER = logging.getLogger(__name__)
 RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
@@ -15,6 +19,21 @@ class FetchError(RuntimeError):
     """Raised when the SPPU result page cannot be fetched safely."""
 
 
+@dataclass(frozen=True)
+class PageValidators:
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    body_hash: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class FetchResult:
+    html: Optional[str]
+    validators: PageValidators
+    not_modified: bool = False
+    chunks: Optional[Iterator[Union[str, bytes]]] = None
+
+
 def _retry_after_seconds(response: requests.Response) -> Optional[float]:
     value = response.headers.get("Retry-After")
     if not value:
@@ -29,14 +48,16 @@ def _retry_after_seconds(response: requests.Response) -> Optional[float]:
             return None
 
 
-def fetch_html(
+def _get_with_retries(
     url: str,
-    attempts: int = 4,
-    connect_timeout: int = 10,
-    read_timeout: int = 30,
-    session: Optional[requests.Session] = None,
-) -> str:
-    """Fetch the SPPU page with bounded retries and TLS verification."""
+    previous: PageValidators,
+    attempts: int,
+    connect_timeout: int,
+    read_timeout: int,
+    session: Optional[requests.Session],
+    stream: bool = False,
+) -> requests.Response:
+    """Return a 200 or 304 response, retrying temporary failures."""
     client = session or requests.Session()
     headers = {
         "User-Agent": (
@@ -46,22 +67,32 @@ def fetch_html(
         ),
         "Accept": "text/html,application/xhtml+xml",
     }
+    if previous.etag:
+        headers["If-None-Match"] = previous.etag
+    if previous.last_modified:
+        headers["If-Modified-Since"] = previous.last_modified
     last_error = "unknown error"
 
     for attempt in range(1, attempts + 1):
         try:
-            response = client.get(
-                url,
-                headers=headers,
-                timeout=(connect_timeout, read_timeout),
-                verify=True,
-            )
+            with metrics.timed("sppu_request_seconds", "http_attempts"):
+                response = client.get(
+                    url,
+                    headers=headers,
+                    timeout=(connect_timeout, read_timeout),
+                    verify=True,
+                    stream=stream,
+                )
+            if response.status_code == 304:
+                if not (previous.etag or previous.last_modified):
+                    raise FetchError("SPPU returned 304 for an unconditional request")
+                LOGGER.info("SPPU page not modified on attempt %s", attempt)
+                return response
             if response.status_code == 200:
-                if not response.text.strip():
-                    raise FetchError("SPPU returned an empty response body")
-                LOGGER.info("Fetched SPPU page on attempt %s (%s bytes)", attempt, len(response.content))
-                return response.text
+                LOGGER.info("SPPU responded on attempt %s", attempt)
+                return response
 
+            response.close()
             last_error = f"HTTP {response.status_code}"
             if response.status_code not in RETRYABLE_STATUS_CODES:
                 raise FetchError(f"SPPU request failed with {last_error}")
@@ -79,6 +110,104 @@ def fetch_html(
         if delay is None:
             delay = min(2 ** (attempt - 1), 8) + random.uniform(0.0, 0.5)
         LOGGER.warning("SPPU fetch attempt %s failed (%s); retrying in %.1fs", attempt, last_error, delay)
+        metrics.increment("http_retry_wait_seconds", delay)
         time.sleep(delay)
 
     raise FetchError(f"SPPU page could not be fetched after {attempts} attempts: {last_error}")
+
+
+def _not_modified(response: requests.Response, previous: PageValidators) -> FetchResult:
+    return FetchResult(
+        html=None,
+        validators=PageValidators(
+            etag=response.headers.get("ETag") or previous.etag,
+            last_modified=response.headers.get("Last-Modified") or previous.last_modified,
+            body_hash=previous.body_hash,
+        ),
+        not_modified=True,
+    )
+
+
+def fetch_page(
+    url: str,
+    validators: Optional[PageValidators] = None,
+    attempts: int = 4,
+    connect_timeout: int = 10,
+    read_timeout: int = 30,
+    session: Optional[requests.Session] = None,
+) -> FetchResult:
+    """Fetch the SPPU page conditionally, reporting when it matches the previous validators."""
+    previous = validators or PageValidators()
+    response = _get_with_retries(url, previous, attempts, connect_timeout, read_timeout, session)
+    if response.status_code == 304:
+        return _not_modified(response, previous)
+
+    if not response.content.strip():
+        raise FetchError("SPPU returned an empty response body")
+    LOGGER.info("Fetched SPPU page (%s bytes)", len(response.content))
+    metrics.increment("http_bytes", len(response.content))
+    current = PageValidators(
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        body_hash=hashlib.sha256(response.content).hexdigest(),
+    )
+    if previous.body_hash and current.body_hash == previous.body_hash:
+        LOGGER.info("SPPU page body is identical to the last synchronized page")
+        return FetchResult(html=None, validators=current, not_modified=True)
+    return FetchResult(html=response.text, validators=current)
+
+
+def _iter_body(response: requests.Response, chunk_size: int) -> Iterator[Union[str, bytes]]:
+    received = 0
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size, decode_unicode=True):
+            if chunk:
+                received += len(chunk)
+                metrics.increment("http_bytes", len(chunk.encode("utf-8") if isinstance(chunk, str) else chunk))
+                yield chunk
+    except requests.RequestException as exc:
+        # A dropped connection or read timeout mid-body is a source failure like any other fetch error.
+        raise FetchError(f"The SPPU page stream failed after {received} characters: {exc}") from exc
+    finally:
+        response.close()
+        LOGGER.info("Closed SPPU page stream after %s characters", received)
+
+
+def stream_page(
+    url: str,
+    validators: Optional[PageValidators] = None,
+    chunk_size: int = 16 * 1024,
+    attempts: int = 4,
+    connect_timeout: int = 10,
+    read_timeout: int = 30,
+    session: Optional[requests.Session] = None,
+) -> FetchResult:
+    """Open the SPPU page as a chunk stream; closing the stream closes the socket."""
+    previous = validators or PageValidators()
+    response = _get_with_retries(url, previous, attempts, connect_timeout, read_timeout, session, stream=True)
+    if response.status_code == 304:
+        response.close()
+        return _not_modified(response, previous)
+
+    current = PageValidators(
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+    )
+    return FetchResult(html=None, validators=current, chunks=_iter_body(response, chunk_size))
+
+
+def fetch_html(
+    url: str,
+    attempts: int = 4,
+    connect_timeout: int = 10,
+    read_timeout: int = 30,
+    session: Optional[requests.Session] = None,
+) -> str:
+    """Fetch the SPPU page with bounded retries and TLS verification."""
+    return fetch_page(
+        url,
+        attempts=attempts,
+        connect_timeout=connect_timeout,
+        read_timeout=read_timeout,
+        session=session,
+    ).html
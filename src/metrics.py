@@ -0,0 +1,203 @@
+"""Per-run timings, counters and histograms for the tracker.
+
+A run activates one ``RunMetrics``; the fetch, parse, sync and deliver code
+records into whichever collector is active in its context and does nothing
+when none is. Counters:
+
+``http_attempts``, ``http_bytes``, ``http_retry_wait_seconds``
+    SPPU requests, response bytes and time slept between retries.
+``db_round_trips``, ``rows_written``
+    Statements and commits sent to PostgreSQL; results and history rows
+    inserted, updated or deleted (including ``last_seen`` refreshes).
+``rows_parsed``, ``notifications_delivered``, ``notifications_failed``,
+``notifications_dead``, ``notifications_targeted``, ``discord_requests``,
+``rate_limit_wait_seconds``
+    Parsed results, delivery outcomes (failures include dead-lettered
+    deliveries), deliveries queued for matching subscriptions, Discord
+    webhook posts and time spent waiting for Discord rate limits.
+
+Histograms: ``sppu_request_seconds``, ``db_statement_seconds``,
+``db_transaction_seconds`` (first statement to commit or rollback),
+``sync_lock_seconds`` (time a sync holds its advisory lock) and
+``discord_request_seconds``.
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+LOGGER = logging.getLogger("sppu_tracker.metrics")
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+PROMETHEUS_PREFIX = "sppu_tracker"
+
+_active: ContextVar[Optional["RunMetrics"]] = ContextVar("run_metrics", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            cumulative[repr(bound)] = running
+        cumulative["+Inf"] = self.count
+        return {"count": self.count, "sum": self.sum, "buckets": cumulative}
+
+
+class RunMetrics:
+    """Monotonic stage timers, counters and histograms for one tracker run."""
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.clock = clock
+        self.started_at = datetime.now(timezone.utc)
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._started = clock()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self) -> Iterator["RunMetrics"]:
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - started
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            LOGGER.info(json.dumps({"event": "stage", "stage": name, "seconds": round(elapsed, 6)}))
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def snapshot(self, succeeded: Optional[bool] = None, error: Optional[str] = None) -> dict:
+        with self._lock:
+            return {
+                "started_at": self.started_at.isoformat(),
+                "seconds": self.clock() - self._started,
+                "succeeded": succeeded,
+                "error": error,
+                "stages": dict(self.stages),
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+            }
+
+
+def current() -> Optional[RunMetrics]:
+    return _active.get()
+
+
+def increment(name: str, amount: float = 1) -> None:
+    metrics = _active.get()
+    if metrics is not None:
+        metrics.increment(name, amount)
+
+
+def observe(name: str, value: float) -> None:
+    metrics = _active.get()
+    if metrics is not None:
+        metrics.observe(name, value)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    metrics = _active.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.stage(name):
+        yield
+
+
+@contextmanager
+def timed(histogram: str, counter: Optional[str] = None) -> Iterator[None]:
+    """Observe the block's duration in ``histogram`` and count it in ``counter``."""
+    metrics = _active.get()
+    if metrics is None:
+        yield
+        return
+    started = metrics.clock()
+    try:
+        yield
+    finally:
+        metrics.observe(histogram, metrics.clock() - started)
+        if counter:
+            metrics.increment(counter)
+
+
+def log_run(snapshot: dict) -> None:
+    LOGGER.info(json.dumps({"event": "run", **snapshot}, default=str))
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(snapshot: dict) -> str:
+    """Prometheus text exposition of a run snapshot, as saved by ``RunMetrics.snapshot``."""
+    prefix = PROMETHEUS_PREFIX
+    lines: List[str] = []
+
+    def gauge(name: str, value, help_text: str) -> None:
+        lines.extend([f"# HELP {prefix}_{name} {help_text}", f"# TYPE {prefix}_{name} gauge"])
+        lines.append(f"{prefix}_{name} {float(value)!r}")
+
+    started_at = datetime.fromisoformat(snapshot["started_at"])
+    gauge("last_run_timestamp_seconds", started_at.timestamp(), "Start of the last tracker run.")
+    gauge("last_run_seconds", snapshot["seconds"], "Duration of the last tracker run.")
+    if snapshot.get("succeeded") is not None:
+        gauge("last_run_success", int(snapshot["succeeded"]), "1 if the last tracker run succeeded.")
+
+    lines.extend([
+        f"# HELP {prefix}_stage_seconds Time spent in each stage of the last run.",
+        f"# TYPE {prefix}_stage_seconds gauge",
+    ])
+    for name, seconds in sorted(snapshot["stages"].items()):
+        lines.append(f'{prefix}_stage_seconds{{stage="{_label(name)}"}} {float(seconds)!r}')
+
+    for name, value in sorted(snapshot["counters"].items()):
+        gauge(name, value, f"{name.replace('_', ' ').capitalize()} in the last run.")
+
+    for name, histogram in sorted(snapshot["histograms"].items()):
+        lines.extend([
+            f"# HELP {prefix}_{name} {name.replace('_', ' ').capitalize()} in the last run.",
+            f"# TYPE {prefix}_{name} histogram",
+        ])
+        for bound, count in histogram["buckets"].items():
+            lines.append(f'{prefix}_{name}_bucket{{le="{bound}"}} {count}')
+        lines.append(f"{prefix}_{name}_sum {float(histogram['sum'])!r}")
+        lines.append(f"{prefix}_{name}_count {histogram['count']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,392 @@
+"""Durable notification outbox: per-channel deliveries with retries and dead letters.
+
+``sync_results`` queues one ``notification_deliveries`` row per history event
+and channel in the sync transaction. ``deliver_due`` leases each channel's due
+rows with ``FOR UPDATE SKIP LOCKED``, sends every channel's batch on its own
+thread and records each outcome: sent, retried after an exponential backoff,
+or dead after ``max_attempts``. Leases commit before anything is sent, so a
+slow channel holds no transaction and no other channel.
+
+Usage:
+    python -m src.outbox [--once]
+"""
+import argparse
+import contextvars
+import logging
+import signal
+import smtplib
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, nullcontext
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import database, discord, metrics
+from src.discord import DeliverySummary, SendResult
+from src.settings import Settings
+
+
+LOGGER = logging.getLogger("sppu_tracker.outbox")
+BATCH_SIZE = 100
+LEASE_SECONDS = 300.0
+RETRY_BASE_SECONDS = 30.0
+MAX_RETRY_SECONDS = 6 * 3600.0
+POLL_SECONDS = 30.0
+
+
+def retry_delay(attempts: int, base: float = RETRY_BASE_SECONDS, maximum: float = MAX_RETRY_SECONDS) -> float:
+    """Seconds before the next try of a delivery that failed its ``attempts``-th try."""
+    return min(maximum, base * 2 ** min(max(attempts - 1, 0), 32))
+
+
+def _event_json(event) -> dict:
+    return {
+        "source": event.source,
+        "history_id": event.history_id,
+        "event_type": event.event_type,
+        "course_name": event.course_name,
+        "result_date": event.result_date.isoformat() if event.result_date else None,
+        "previous_date": event.previous_date.isoformat() if event.previous_date else None,
+    }
+
+
+def _by_target(deliveries: Sequence[Tuple[Optional[str], object]]) -> Dict[Optional[str], List[int]]:
+    """Positions of ``(target, event)`` pairs grouped by target, in order."""
+    groups: Dict[Optional[str], List[int]] = {}
+    for index, (target, _event) in enumerate(deliveries):
+        groups.setdefault(target, []).append(index)
+    return groups
+
+
+class DiscordChannel:
+    """Discord webhooks, one per source or subscriber, through a shared or per-batch ``DiscordDelivery``.
+
+    Every channel's ``send_all`` takes ``(target, event)`` pairs, the target
+    being a subscriber's webhook or address or None for the configured one,
+    and returns one ``SendResult`` per pair.
+    """
+
+    name = "discord"
+
+    def __init__(
+        self,
+        webhooks: Dict[str, str],
+        default_url: str,
+        delivery: Optional[discord.DiscordDelivery] = None,
+    ) -> None:
+        self.webhooks = webhooks
+        self.default_url = default_url
+        self.delivery = delivery
+
+    def send_all(self, deliveries: Sequence[Tuple[Optional[str], object]]) -> List[SendResult]:
+        if self.delivery is None:
+            delivery_context = closing(discord.DiscordDelivery())
+        else:
+            delivery_context = nullcontext(self.delivery)
+        with delivery_context as delivery:
+            return delivery.send_all([
+                (target or self.webhooks.get(event.source, self.default_url), event)
+                for target, event in deliveries
+            ])
+
+
+class WebhookChannel:
+    """A generic HTTP endpoint that receives ``{"events": [...]}`` JSON batches."""
+
+    name = "webhook"
+
+    def __init__(
+        self,
+        url: str,
+        session: Optional[requests.Session] = None,
+        batch_size: int = BATCH_SIZE,
+    ) -> None:
+        self.url = url
+        self.session = session
+        self.batch_size = batch_size
+
+    def send_all(self, deliveries: Sequence[Tuple[Optional[str], object]]) -> List[SendResult]:
+        results: List[Optional[SendResult]] = [None] * len(deliveries)
+        session_context = closing(requests.Session()) if self.session is None else nullcontext(self.session)
+        with session_context as session:
+            for target, indexes in _by_target(deliveries).items():
+                for start in range(0, len(indexes), self.batch_size):
+                    batch = indexes[start:start + self.batch_size]
+                    result = self._post(session, target or self.url, [deliveries[index][1] for index in batch])
+                    for index in batch:
+                        results[index] = result
+        return results
+
+    def _post(self, session: requests.Session, url: str, events: Sequence) -> SendResult:
+        try:
+            response = session.post(url, json={"events": [_event_json(event) for event in events]}, timeout=(10, 15))
+        except requests.RequestException as exc:
+            return SendResult(sent=False, error=f"{type(exc).__name__}: {exc}")
+        if 200 <= response.status_code < 300:
+            return SendResult(sent=True)
+        return SendResult(sent=False, error=f"Webhook HTTP {response.status_code}: {response.text[:500]}")
+
+
+class EmailChannel:
+    """One plain-text digest per batch through an SMTP relay."""
+
+    name = "email"
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        sender: str,
+        recipients: Sequence[str],
+        timeout: float = 15.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.timeout = timeout
+
+    def _message(self, recipients: Sequence[str], events: Sequence) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = ", ".join(recipients)
+        message["Subject"] = f"{len(events)} SPPU result update(s)"
+        lines = []
+        for event in events:
+            if event.event_type == "updated":
+                detail = f"{event.previous_date} -> {event.result_date}"
+            elif event.event_type == "removed":
+                detail = f"removed, was {event.previous_date}"
+            else:
+                detail = str(event.result_date)
+            lines.append(f"[{event.source}] {event.course_name}: {detail}")
+        message.set_content("\n".join(lines) + "\n")
+        return message
+
+    def send_all(self, deliveries: Sequence[Tuple[Optional[str], object]]) -> List[SendResult]:
+        """One message per recipient list: the configured one, and each subscriber's address."""
+        results: List[Optional[SendResult]] = [None] * len(deliveries)
+        for target, indexes in _by_target(deliveries).items():
+            recipients = [target] if target else self.recipients
+            try:
+                with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+                    smtp.send_message(self._message(recipients, [deliveries[index][1] for index in indexes]))
+                result = SendResult(sent=True)
+            except (smtplib.SMTPException, OSError) as exc:
+                result = SendResult(sent=False, error=f"{type(exc).__name__}: {exc}")
+            for index in indexes:
+                results[index] = result
+        return results
+
+
+def build_channels(
+    settings: Settings,
+    delivery: Optional[discord.DiscordDelivery] = None,
+    session: Optional[requests.Session] = None,
+) -> list:
+    """Every channel that can deliver: Discord, webhooks, and email when an SMTP relay is set.
+
+    Subscribers may use the webhook and email channels even when
+    ``settings.notification_channels()`` broadcasts on neither.
+    """
+    webhooks = {
+        source.name: source.discord_webhook_url or settings.discord_webhook_url
+        for source in settings.tracked_sources()
+    }
+    channels = [
+        DiscordChannel(webhooks, settings.discord_webhook_url, delivery),
+        WebhookChannel(settings.notify_webhook_url, session),
+    ]
+    if settings.smtp_host:
+        channels.append(EmailChannel(settings.smtp_host, settings.smtp_port, settings.email_from, settings.email_to))
+    return channels
+
+
+def _deliver_channel(
+    database_source: database.Database,
+    channel,
+    limit: int,
+    max_attempts: int,
+    lease_seconds: float,
+) -> Tuple[int, int, int]:
+    """Lease, send and record one batch of a channel; return delivered, failed and dead counts."""
+    deliveries = database.lease_deliveries(database_source, channel.name, limit, lease_seconds)
+    if not deliveries:
+        return 0, 0, 0
+    # A subscription removed after its delivery was leased has no target left.
+    orphaned = [delivery for delivery in deliveries if delivery.subscription_id is not None and delivery.target is None]
+    deliveries = [delivery for delivery in deliveries if delivery.subscription_id is None or delivery.target]
+    try:
+        results = channel.send_all([(delivery.target, delivery.event) for delivery in deliveries])
+    except Exception as exc:
+        LOGGER.error("The %s channel failed: %s", channel.name, exc)
+        LOGGER.debug(traceback.format_exc())
+        results = [SendResult(sent=False, error=f"{type(exc).__name__}: {exc}")] * len(deliveries)
+
+    outcomes = [(delivery, "The subscription was removed", None) for delivery in orphaned]
+    delivered = failed = 0
+    dead = len(orphaned)
+    for delivery, result in zip(deliveries, results):
+        if result.sent:
+            delivered += 1
+            outcomes.append((delivery, None, 0.0))
+            continue
+        error = result.error or f"{channel.name} delivery failed"
+        if delivery.attempts >= max_attempts:
+            dead += 1
+            outcomes.append((delivery, error, None))
+        else:
+            failed += 1
+            outcomes.append((delivery, error, retry_delay(delivery.attempts)))
+    database.record_deliveries(database_source, outcomes)
+    if dead:
+        LOGGER.warning("Dead-lettered %s %s deliveries", dead, channel.name)
+    return delivered, failed, dead
+
+
+def deliver_due(
+    database_source: database.Database,
+    channels: Sequence,
+    limit: int = BATCH_SIZE,
+    max_attempts: int = 8,
+    lease_seconds: float = LEASE_SECONDS,
+) -> DeliverySummary:
+    """Send one batch of due deliveries per channel, the channels in parallel."""
+    def deliver(channel) -> Tuple[int, int, int]:
+        try:
+            return _deliver_channel(database_source, channel, limit, max_attempts, lease_seconds)
+        except Exception as exc:
+            LOGGER.error("Delivering %s notifications failed: %s", channel.name, exc)
+            LOGGER.debug(traceback.format_exc())
+            return 0, 0, 0
+
+    if len(channels) <= 1:
+        counts = [deliver(channel) for channel in channels]
+    else:
+        with ThreadPoolExecutor(max_workers=len(channels)) as executor:
+            # Each channel records into the caller's run metrics.
+            futures = [
+                executor.submit(contextvars.copy_context().run, deliver, channel) for channel in channels
+            ]
+            counts = [future.result() for future in futures]
+
+    delivered = sum(count[0] for count in counts)
+    failed = sum(count[1] for count in counts)
+    dead = sum(count[2] for count in counts)
+    remaining = database.refresh_notification_counts(database_source)
+    metrics.increment("notifications_delivered", delivered)
+    metrics.increment("notifications_failed", failed + dead)
+    metrics.increment("notifications_dead", dead)
+    return DeliverySummary(delivered=delivered, failed=failed + dead, remaining=remaining, dead=dead)
+
+
+class OutboxWorker:
+    """Drain the outbox on a background thread, woken after each sync or every ``poll_interval``."""
+
+    def __init__(
+        self,
+        database_source: database.Database,
+        channels: Sequence,
+        max_attempts: int = 8,
+        poll_interval: float = POLL_SECONDS,
+    ) -> None:
+        self.database = database_source
+        self.channels = list(channels)
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "OutboxWorker":
+        self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+        self._thread.start()
+        return self
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def drain(self) -> DeliverySummary:
+        """Deliver batches until no channel has a due delivery left."""
+        total = DeliverySummary(delivered=0, failed=0, remaining=0)
+        while not self._stop.is_set():
+            summary = deliver_due(self.database, self.channels, max_attempts=self.max_attempts)
+            total = DeliverySummary(
+                delivered=total.delivered + summary.delivered,
+                failed=total.failed + summary.failed,
+                remaining=summary.remaining,
+                dead=total.dead + summary.dead,
+            )
+            if not summary.delivered and not summary.failed:
+                break
+        return total
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                summary = self.drain()
+            except Exception as exc:
+                LOGGER.error("Outbox delivery failed: %s", exc)
+                LOGGER.debug(traceback.format_exc())
+                continue
+            if summary.delivered or summary.failed:
+                LOGGER.info(
+                    "Outbox delivery: delivered=%s failed=%s dead=%s remaining=%s",
+                    summary.delivered,
+                    summary.failed,
+                    summary.dead,
+                    summary.remaining,
+                )
+
+
+def main(argv=None, stop: Optional[threading.Event] = None) -> int:
+    parser = argparse.ArgumentParser(description="Deliver queued result notifications.")
+    parser.add_argument("--once", action="store_true", help="deliver what is due and exit")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    settings = Settings.from_env()
+    channels = build_channels(settings)
+    if args.once:
+        summary = OutboxWorker(settings.database_url, channels, settings.notify_max_attempts).drain()
+        LOGGER.info("Outbox delivery: %s", summary)
+        return 0
+
+    stop = stop or threading.Event()
+    previous_handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            previous_handlers[signum] = signal.signal(signum, lambda *_args: stop.set())
+
+    worker = OutboxWorker(settings.database_url, channels, settings.notify_max_attempts).start()
+    worker.wake()
+    try:
+        stop.wait()
+    finally:
+        worker.stop(timeout=30)
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+    LOGGER.info("Outbox worker stopped")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,92 +1,364 @@
+import hashlib
 import re
 import unicodedata
-from datetime import date, datetime
-from typing import Dict, List, Tuple
+from datetime import date
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from bs4 import BeautifulSoup
+from lxml import etree
 
 
 class ParseError(RuntimeError):
     """Raised when a response is not a trustworthy SPPU result page."""
 
 
+# Almost every course name and date string repeats from one check to the next,
+# so the daemon keeps their parsed forms between iterations.
+NAME_CACHE_SIZE = 8192
+DATE_CACHE_SIZE = 2048
+
+MONTHS = {
+    name: number
+    for number, month in enumerate(
+        (
+            "january", "february", "march", "april", "may", "june",
+            "july", "august", "september", "october", "november", "december",
+        ),
+        start=1,
+    )
+    for name in (month, month[:3])
+}
+
+_WHITESPACE = re.compile(r"\s+")
+_CELL_TAGS = ("td", "th")
+_SCRIPT_TAGS = ("script", "style")
+NESTED_TABLE_ERROR = "The SPPU result table contains a nested table"
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
 def normalize_course_name(value: str) -> str:
     normalized = unicodedata.normalize("NFKC", value)
-    return re.sub(r"\s+", " ", normalized).strip()
+    return _WHITESPACE.sub(" ", normalized).strip()
 
 
+@lru_cache(maxsize=NAME_CACHE_SIZE)
 def course_key(value: str) -> str:
     return normalize_course_name(value).casefold()
 
 
+@lru_cache(maxsize=DATE_CACHE_SIZE)
 def parse_result_date(value: str) -> date:
-    normalized = re.sub(r"\s*-\s*", "-", value.strip())
-    for pattern in ("%d-%B-%Y", "%d-%b-%Y"):
-        try:
-            return datetime.strptime(normalized, pattern).date()
-        except ValueError:
-            continue
+    """Parse ``DD-Month-YYYY`` or ``DD-Mon-YYYY`` with English month names, spaces allowed around dashes."""
+    parts = value.split("-")
+    if len(parts) == 3:
+        day, month, year = (part.strip() for part in parts)
+        number = MONTHS.get(month.lower())
+        if (
+            number
+            and 1 <= len(day) <= 2 and day.isascii() and day.isdigit()
+            and len(year) == 4 and year.isascii() and year.isdigit()
+        ):
+            try:
+                return date(int(year), number, int(day))
+            except ValueError:
+                pass
     raise ValueError(f"Unsupported result date: {value!r}")
 
 
-def parse_html_content(html_content: str, minimum_count: int = 25) -> List[Dict[str, object]]:
-    """Parse and validate the result table into normalized result records."""
-    if not html_content or not html_content.strip():
-        raise ParseError("The downloaded page is empty")
+def clear_caches() -> None:
+    for function in (normalize_course_name, course_key, parse_result_date):
+        function.cache_clear()
+
+
+class _TableTarget:
+    """lxml parser target that only keeps the text of the tblRVList table.
+
+    Script and style text is dropped, and a table nested inside it sets
+    ``nested_table`` instead of adding rows, matching the bs4 backend.
+    """
+
+    def __init__(self) -> None:
+        self.found = False
+        self.depth = 0
+        self.nested_table = False
+        self.headers: List[str] = []
+        self.rows: List[List[str]] = []
+        self.completed_rows = 0
+        self._cell = None
+        self._cell_tag = None
+        self._cell_depth = 0
+        self._script_depth = 0
+        self._text: List[str] = []
+
+    def _flush_text(self) -> None:
+        if self._cell is not None and self._text:
+            text = "".join(self._text).strip()
+            if text:
+                self._cell.append(text)
+        self._text = []
+
+    def start(self, tag: str, attrib) -> None:
+        self._flush_text()
+        if not self.depth:
+            if tag == "table" and attrib.get("id") == "tblRVList" and not self.found:
+                self.found = True
+                self.depth = 1
+            return
+        if tag == "table":
+            self.depth += 1
+            self.nested_table = True
+        elif tag in _SCRIPT_TAGS:
+            self._script_depth += 1
+        elif self.depth > 1:
+            return
+        elif tag == "tr":
+            self.rows.append([])
+        elif tag in _CELL_TAGS:
+            self._cell_depth += 1
+            if self._cell is None:
+                self._cell = []
+                self._cell_tag = tag
+
+    def end(self, tag: str) -> None:
+        self._flush_text()
+        if not self.depth:
+            return
+        if tag == "table":
+            self.depth -= 1
+            if not self.depth:
+                self.completed_rows = len(self.rows)
+        elif tag in _SCRIPT_TAGS:
+            self._script_depth = max(self._script_depth - 1, 0)
+        elif self.depth > 1:
+            return
+        elif tag == "tr":
+            self.completed_rows = len(self.rows)
+        elif tag in _CELL_TAGS and self._cell_depth:
+            self._cell_depth -= 1
+            if self._cell_depth or self._cell is None:
+                return
+            text = " ".join(self._cell)
+            if tag == "th":
+                self.headers.append(text)
+            elif self.rows:
+                self.rows[-1].append(text)
+            self._cell = None
+            self._cell_tag = None
 
+    def data(self, text: str) -> None:
+        if self._cell is not None and not self._script_depth and self.depth == 1:
+            self._text.append(text)
+
+    def comment(self, _text: str) -> None:
+        self._flush_text()
+
+    def close(self) -> "_TableTarget":
+        return self
+
+    @property
+    def closed(self) -> bool:
+        return self.found and not self.depth
+
+    def pop_completed_rows(self) -> List[List[str]]:
+        rows = self.rows[: self.completed_rows]
+        del self.rows[: self.completed_rows]
+        self.completed_rows = 0
+        return rows
+
+
+def _cell_text(cell) -> str:
+    """The cell's own text: an unclosed cell ends where the next one starts, as in HTML."""
+    if cell.find(_CELL_TAGS) is None:
+        return cell.get_text(" ", strip=True)
+    return " ".join(
+        text
+        for text in (
+            string.strip()
+            for string in cell.find_all(string=True)
+            if type(string) in cell.interesting_string_types and string.find_parent(_CELL_TAGS) is cell
+        )
+        if text
+    )
+
+
+def _extract_bs4(html_content: str) -> Tuple[List[str], List[List[str]]]:
     soup = BeautifulSoup(html_content, "html.parser")
     table = soup.find("table", id="tblRVList")
     if table is None:
         raise ParseError("The expected SPPU result table (tblRVList) is missing")
+    if table.find("table") is not None:
+        raise ParseError(NESTED_TABLE_ERROR)
 
-    header_cells = table.find_all("th")
-    headers = [normalize_course_name(cell.get_text(" ", strip=True)).casefold() for cell in header_cells]
-    try:
-        course_index = headers.index("course name")
-        date_index = headers.index("result date")
-    except ValueError as exc:
-        raise ParseError("The SPPU result table headers have changed") from exc
-
-    records: Dict[Tuple[str, date], Dict[str, object]] = {}
-    malformed_rows = []
-    data_rows = 0
-
-    for row_number, row in enumerate(table.find_all("tr"), start=1):
-        cells = row.find_all("td")
-        if not cells:
-            continue
-        data_rows += 1
-        if max(course_index, date_index) >= len(cells):
-            malformed_rows.append(f"row {row_number}: missing columns")
-            continue
-
-        name = normalize_course_name(cells[course_index].get_text(" ", strip=True))
-        raw_date = cells[date_index].get_text(" ", strip=True)
+    headers = [_cell_text(cell) for cell in table.find_all("th")]
+    rows = [[_cell_text(cell) for cell in row.find_all("td")] for row in table.find_all("tr")]
+    return headers, rows
+
+
+def _extract_lxml(html_content: str) -> Tuple[List[str], List[List[str]]]:
+    parser = etree.HTMLParser(target=_TableTarget())
+    parser.feed(html_content)
+    target = parser.close()
+    if not target.found:
+        raise ParseError("The expected SPPU result table (tblRVList) is missing")
+    if target.nested_table:
+        raise ParseError(NESTED_TABLE_ERROR)
+    return target.headers, target.rows
+
+
+PARSER_BACKENDS: Dict[str, Callable[[str], Tuple[List[str], List[List[str]]]]] = {
+    "bs4": _extract_bs4,
+    "lxml": _extract_lxml,
+}
+# bs4 stays the reference; lxml is faster and must agree with it on every page.
+DEFAULT_PARSER_BACKEND = "bs4"
+
+
+class _RecordCollector:
+    """Validate table rows one at a time and collect the unique result records."""
+
+    def __init__(self, header_texts: List[str]) -> None:
+        headers = [normalize_course_name(text).casefold() for text in header_texts]
+        try:
+            self.course_index = headers.index("course name")
+            self.date_index = headers.index("result date")
+        except ValueError as exc:
+            raise ParseError("The SPPU result table headers have changed") from exc
+        self.records: Dict[Tuple[str, date], Dict[str, object]] = {}
+        self.malformed_rows: List[str] = []
+        self.data_rows = 0
+
+    def add(self, row_number: int, cells: List[str]) -> Optional[Dict[str, object]]:
+        self.data_rows += 1
+        if max(self.course_index, self.date_index) >= len(cells):
+            self.malformed_rows.append(f"row {row_number}: missing columns")
+            return None
+
+        name = normalize_course_name(cells[self.course_index])
+        raw_date = cells[self.date_index]
         try:
             parsed_date = parse_result_date(raw_date)
         except ValueError as exc:
-            malformed_rows.append(f"row {row_number}: {exc}")
-            continue
+            self.malformed_rows.append(f"row {row_number}: {exc}")
+            return None
 
         if not name:
-            malformed_rows.append(f"row {row_number}: empty course name")
-            continue
+            self.malformed_rows.append(f"row {row_number}: empty course name")
+            return None
 
         key = course_key(name)
-        records[(key, parsed_date)] = {
+        record = {
             "course_key": key,
             "course_name": name,
             "result_date": parsed_date,
         }
+        self.records[(key, parsed_date)] = record
+        return record
+
+    def finish(self, minimum_count: int) -> List[Dict[str, object]]:
+        if self.malformed_rows:
+            sample = "; ".join(self.malformed_rows[:3])
+            raise ParseError(f"Found {len(self.malformed_rows)} malformed result rows: {sample}")
+        if len(self.records) < minimum_count:
+            raise ParseError(
+                f"Only {len(self.records)} valid results were found; expected at least {minimum_count}"
+            )
+
+        duplicate_count = self.data_rows - len(self.records)
+        if self.data_rows and duplicate_count / self.data_rows > 0.02:
+            raise ParseError(f"Duplicate result ratio is too high ({duplicate_count}/{self.data_rows})")
+
+        return sorted(self.records.values(), key=lambda item: (item["course_key"], item["result_date"]))
+
+
+def _build_records(
+    header_texts: List[str],
+    rows: Iterable[List[str]],
+    minimum_count: int,
+) -> List[Dict[str, object]]:
+    collector = _RecordCollector(header_texts)
+    for row_number, cells in enumerate(rows, start=1):
+        if cells:
+            collector.add(row_number, cells)
+    return collector.finish(minimum_count)
+
+
+def parse_html_content(
+    html_content: str,
+    minimum_count: int = 25,
+    backend: str = DEFAULT_PARSER_BACKEND,
+) -> List[Dict[str, object]]:
+    """Parse and validate the result table into normalized result records."""
+    if not html_content or not html_content.strip():
+        raise ParseError("The downloaded page is empty")
+    try:
+        extract_table = PARSER_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown parser backend: {backend!r}") from None
+
+    header_texts, rows = extract_table(html_content)
+    return _build_records(header_texts, rows, minimum_count)
+
+
+def iter_html_records(
+    chunks: Iterable[Union[str, bytes]],
+    minimum_count: int = 25,
+) -> Iterator[Dict[str, object]]:
+    """Yield result records while the page streams in, stopping after the result table closes.
 
-    if malformed_rows:
-        sample = "; ".join(malformed_rows[:3])
-        raise ParseError(f"Found {len(malformed_rows)} malformed result rows: {sample}")
-    if len(records) < minimum_count:
-        raise ParseError(f"Only {len(records)} valid results were found; expected at least {minimum_count}")
+    Every valid row is yielded as soon as it completes, including duplicates; the
+    whole table is validated once it closes and a ParseError is raised then.
+    """
+    target = _TableTarget()
+    parser = etree.HTMLParser(target=target)
+    collector = None
+    row_number = 0
+    received_content = False
 
-    duplicate_count = data_rows - len(records)
-    if data_rows and duplicate_count / data_rows > 0.02:
-        raise ParseError(f"Duplicate result ratio is too high ({duplicate_count}/{data_rows})")
+    try:
+        for chunk in chunks:
+            received_content = received_content or bool(chunk.strip())
+            parser.feed(chunk)
+            if target.nested_table:
+                raise ParseError(NESTED_TABLE_ERROR)
+            for cells in target.pop_completed_rows():
+                row_number += 1
+                if not cells:
+                    continue
+                collector = collector or _RecordCollector(target.headers)
+                record = collector.add(row_number, cells)
+                if record is not None:
+                    yield record
+            if target.closed:
+                break
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+    if not received_content:
+        raise ParseError("The downloaded page is empty")
+    if not target.found:
+        raise ParseError("The expected SPPU result table (tblRVList) is missing")
+    collector = collector or _RecordCollector(target.headers)
+    collector.finish(minimum_count)
 
+
+def parse_html_stream(
+    chunks: Iterable[Union[str, bytes]],
+    minimum_count: int = 25,
+) -> List[Dict[str, object]]:
+    """Parse a streamed page into the same validated records as parse_html_content."""
+    records = {
+        (record["course_key"], record["result_date"]): record
+        for record in iter_html_records(chunks, minimum_count)
+    }
     return sorted(records.values(), key=lambda item: (item["course_key"], item["result_date"]))
+
+
+def result_fingerprint(records: List[Dict[str, object]]) -> str:
+    """Return a stable hash of the normalized result table."""
+    digest = hashlib.sha256()
+    for item in sorted(records, key=lambda item: (item["course_key"], item["result_date"])):
+        line = f"{item['course_key']}\t{item['result_date'].isoformat()}\t{item['course_name']}\n"
+        digest.update(line.encode("utf-8"))
+    return digest.hexdigest()
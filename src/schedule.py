@@ -0,0 +1,104 @@
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+
+# SPPU publishes on Indian Standard Time, which has no daylight saving.
+IST = timezone(timedelta(hours=5, minutes=30))
+SLOTS = 7 * 24
+ACTIVITY_DAYS = 180
+MIN_INTERVAL_SECONDS = 30.0
+MAX_INTERVAL_SECONDS = 20 * 60.0
+DUE_TOLERANCE_SECONDS = 30.0
+# /api/health calls the tracker stale after this long without a check. The
+# longest interval plus cron drift and the daemon's jitter stays well below it.
+STALE_AFTER_SECONDS = 30 * 60.0
+
+Slot = Tuple[int, int]
+
+
+def slot_of(when: datetime) -> Slot:
+    """Return the ``(weekday, hour)`` slot of ``when`` in IST, Monday being 0."""
+    local = when.astimezone(IST)
+    return local.weekday(), local.hour
+
+
+def _smoothed_weights(activity: Dict[Slot, int]) -> list:
+    """Blend each slot with its neighbouring hours and with the same hour on other days."""
+    counts = [0.0] * SLOTS
+    for (weekday, hour), runs in activity.items():
+        counts[weekday * 24 + hour] += runs
+
+    by_hour = [sum(counts[day * 24 + hour] for day in range(7)) / 7 for hour in range(24)]
+    weights = []
+    for index in range(SLOTS):
+        neighbours = counts[index - 1] + counts[(index + 1) % SLOTS]
+        weights.append(0.5 * counts[index] + 0.25 * neighbours + 0.5 * by_hour[index % 24])
+    return weights
+
+
+@dataclass(frozen=True)
+class PollSchedule:
+    """Check interval for every IST hour of the week.
+
+    Built from past change runs so that checks cluster where results usually
+    land while the weekly number of checks stays at the fixed-interval budget.
+    """
+
+    intervals: Tuple[float, ...]
+
+    @classmethod
+    def fixed(cls, interval: float) -> "PollSchedule":
+        return cls((float(interval),) * SLOTS)
+
+    @classmethod
+    def from_activity(
+        cls,
+        activity: Dict[Slot, int],
+        baseline_interval: float,
+        min_interval: float = MIN_INTERVAL_SECONDS,
+        max_interval: float = MAX_INTERVAL_SECONDS,
+    ) -> "PollSchedule":
+        """Spread the checks of a ``baseline_interval`` cadence over the observed activity.
+
+        Check rates follow the square root of each slot's smoothed change rate,
+        which minimises the mean detection delay for a fixed number of checks.
+        A small floor keeps quiet slots polled at ``max_interval`` or better.
+        """
+        weights = _smoothed_weights(activity)
+        if not any(weights):
+            return cls.fixed(baseline_interval)
+
+        floor = max(weights) * 0.01
+        shares = [math.sqrt(weight + floor) for weight in weights]
+        longest = max(max_interval, baseline_interval)
+        budget = SLOTS * 3600.0 / baseline_interval
+        checks_per_share = budget / sum(shares)
+        for _ in range(20):
+            schedule = cls(tuple(
+                min(max(3600.0 / (share * checks_per_share), min_interval), longest)
+                for share in shares
+            ))
+            planned = schedule.checks_per_week()
+            # Quiet slots capped at ``longest`` gain checks; take them back from the rest.
+            if planned <= budget * 1.001:
+                break
+            checks_per_share *= budget / planned
+        return schedule
+
+    def interval_at(self, when: datetime) -> float:
+        weekday, hour = slot_of(when)
+        return self.intervals[weekday * 24 + hour]
+
+    def next_check(self, last_checked: Optional[datetime], now: datetime) -> datetime:
+        if last_checked is None:
+            return now
+        return last_checked + timedelta(seconds=self.interval_at(now))
+
+    def due(self, last_checked: Optional[datetime], now: datetime) -> bool:
+        """True when a trigger at ``now`` should dispatch, allowing for cron drift."""
+        return self.next_check(last_checked, now) - timedelta(seconds=DUE_TOLERANCE_SECONDS) <= now
+
+    def checks_per_week(self) -> float:
+        return sum(3600.0 / interval for interval in self.intervals)
@@ -8,6 +8,7 @@ drop table if exists public.tracker_runs;
 
 create table if not exists public.results (
     id bigserial primary key,
+    source text not null default 'sppu',
     course_key text not null,
     course_name text not null,
     result_date date not null,
@@ -18,6 +19,7 @@ create table if not exists public.results (
 );
 
 alter table public.results add column if not exists course_key text;
+alter table public.results add column if not exists source text not null default 'sppu';
 alter table public.results add column if not exists notification_sent boolean default true;
 alter table public.results alter column notification_sent set default false;
 alter table public.results alter column notification_sent set not null;
@@ -41,8 +43,9 @@ end $$;
 
 alter table public.results alter column course_key set not null;
 
-create unique index if not exists results_course_key_date_unique
-    on public.results (course_key, result_date);
+drop index if exists public.results_course_key_date_unique;
+create unique index if not exists results_source_course_key_date_unique
+    on public.results (source, course_key, result_date);
 create index if not exists idx_results_date
     on public.results (result_date desc);
 create index if not exists idx_results_last_seen
@@ -54,6 +57,7 @@ create index if not exists idx_results_unsent
 create table if not exists public.results_history (
     id bigserial primary key,
     result_id bigint,
+    source text not null default 'sppu',
     course_key text not null,
     course_name text not null,
     change_type text not null check (change_type in ('added', 'updated', 'removed')),
@@ -66,6 +70,7 @@ create table if not exists public.results_history (
 
 alter table public.results_history add column if not exists result_id bigint;
 alter table public.results_history add column if not exists course_key text;
+alter table public.results_history add column if not exists source text not null default 'sppu';
 alter table public.results_history add column if not exists old_result_date date;
 alter table public.results_history add column if not exists new_result_date date;
 alter table public.results_history add column if not exists notification_sent boolean default true;
@@ -115,9 +120,106 @@ create index if not exists idx_results_history_created
     on public.results_history (created_at desc);
 create index if not exists idx_results_history_course
     on public.results_history (course_key, created_at desc);
+create index if not exists idx_results_history_source
+    on public.results_history (source, id desc);
+create index if not exists idx_results_history_timeline
+    on public.results_history (source, course_key, id);
 create index if not exists idx_results_history_unsent
     on public.results_history (created_at, id)
     where notification_sent = false;
 
-comment on table public.results is 'Current SPPU result page mirror.';
+-- One row per history event and notification channel; see src/outbox.py.
+create table if not exists public.notification_deliveries (
+    id bigserial primary key,
+    history_id bigint not null,
+    channel text not null,
+    attempts integer not null default 0,
+    next_attempt_at timestamptz not null default now(),
+    last_error text,
+    sent_at timestamptz,
+    dead_at timestamptz,
+    created_at timestamptz not null default now()
+);
+
+-- Targeted deliveries name the subscription they were matched for.
+alter table public.notification_deliveries
+    add column if not exists subscription_id bigint;
+alter table public.notification_deliveries
+    drop constraint if exists notification_deliveries_history_id_channel_key;
+create unique index if not exists idx_notification_deliveries_event_channel
+    on public.notification_deliveries (history_id, channel, coalesce(subscription_id, 0));
+
+create index if not exists idx_notification_deliveries_due
+    on public.notification_deliveries (channel, next_attempt_at, id)
+    where sent_at is null and dead_at is null;
+create index if not exists idx_notification_deliveries_unsent
+    on public.notification_deliveries (history_id)
+    where sent_at is null;
+
+-- Queue Discord deliveries for events that were still unsent before the outbox existed.
+insert into public.notification_deliveries (history_id, channel, attempts, last_error)
+select id, 'discord', case when notification_error is null then 0 else 1 end, notification_error
+from public.results_history
+where notification_sent = false
+on conflict do nothing;
+
+-- Course patterns students subscribe to; see src/subscriptions.py.
+create table if not exists public.subscriptions (
+    id bigserial primary key,
+    source text,
+    pattern text not null,
+    channel text not null check (channel in ('discord', 'webhook', 'email')),
+    target text not null,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+create unique index if not exists idx_subscriptions_unique
+    on public.subscriptions (coalesce(source, ''), pattern, channel, target);
+
+create table if not exists public.tracker_status (
+    name text primary key,
+    source text not null default 'sppu',
+    fingerprint text,
+    etag text,
+    last_modified text,
+    body_hash text,
+    last_checked timestamptz,
+    last_synced timestamptz,
+    last_change timestamptz,
+    active_results integer not null default 0,
+    pending_notifications integer not null default 0,
+    failed_notifications integer not null default 0,
+    dead_notifications integer not null default 0,
+    last_run jsonb
+);
+
+alter table public.tracker_status add column if not exists etag text;
+alter table public.tracker_status add column if not exists last_modified text;
+alter table public.tracker_status add column if not exists body_hash text;
+alter table public.tracker_status add column if not exists last_change timestamptz;
+alter table public.tracker_status add column if not exists active_results integer not null default 0;
+alter table public.tracker_status add column if not exists pending_notifications integer not null default 0;
+alter table public.tracker_status add column if not exists failed_notifications integer not null default 0;
+alter table public.tracker_status add column if not exists dead_notifications integer not null default 0;
+alter table public.tracker_status add column if not exists last_run jsonb;
+alter table public.tracker_status add column if not exists source text not null default 'sppu';
+
+create unique index if not exists tracker_status_source_unique
+    on public.tracker_status (source);
+
+-- Backfill the health summary once; tracker runs keep it current afterwards.
+insert into public.tracker_status (name, last_checked, last_change, active_results, pending_notifications, failed_notifications)
+select 'sppu-result-tracker',
+       (select max(last_seen) from public.results),
+       (select max(created_at) from public.results_history),
+       (select count(*) from public.results),
+       (select count(*) from public.results_history where notification_sent = false),
+       (select count(*) from public.results_history where notification_sent = false and notification_error is not null)
+on conflict (name) do nothing;
+
+comment on table public.results is 'Current mirror of every tracked result page, partitioned by source.';
 comment on table public.results_history is 'Permanent result change history and notification state.';
+comment on table public.notification_deliveries is 'Notification outbox: delivery attempts, retry schedule and dead letters per history event and channel.';
+comment on table public.subscriptions is 'Subscriber course patterns matched against every result change for targeted notifications.';
+comment on table public.tracker_status is 'Fingerprint, heartbeat and health summary of the last successful tracker run, plus the metrics of the last run.';
@@ -0,0 +1,165 @@
+import base64
+import binascii
+import json
+import re
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+
+SORTS = {"date_desc", "date_asc", "name"}
+DEFAULT_SORT = "date_desc"
+MIN_FUZZY_LENGTH = 4
+FUZZY_SIMILARITY = 0.5
+MIN_ABBREVIATION_LENGTH = 3
+MIN_PREFIX_LENGTH = 3
+
+_TOKEN = re.compile(r"[^\W\d_]+|\d+")
+
+
+class SearchError(ValueError):
+    """Raised for query parameters that cannot be applied."""
+
+
+def tokenize(text: str) -> List[str]:
+    """Split on punctuation, keeping dotted abbreviations such as ``S.E.`` as ``se``."""
+    return _TOKEN.findall(text.casefold().replace(".", ""))
+
+
+def _trigrams(token: str) -> Set[str]:
+    return {token[index:index + 3] for index in range(len(token) - 2)}
+
+
+@dataclass(frozen=True)
+class Page:
+    items: List[dict]
+    total: int
+    next_cursor: Optional[str]
+
+
+def encode_cursor(key: Tuple) -> str:
+    raw = json.dumps(key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise SearchError("Invalid cursor") from exc
+    types = (str, int) if sort == "name" else (int, str)
+    if not isinstance(key, list) or len(key) != 2 or not all(map(isinstance, key, types)):
+        raise SearchError("Invalid cursor")
+    return tuple(key)
+
+
+class ResultIndex:
+    """In-memory token index and presorted orders over one version of the results table.
+
+    Every query term must match a course: exactly when shorter than three
+    characters (``SE``), otherwise as a prefix of one of its tokens, as
+    an abbreviation that one of its tokens starts with (``pattern`` matches
+    ``PAT.``), or, when neither matches anywhere, by trigram similarity.
+    """
+
+    def __init__(self, version: Hashable, rows: Sequence[dict]) -> None:
+        self.version = version
+        self.rows = list(rows)
+        self._postings: Dict[str, Set[int]] = {}
+        for position, row in enumerate(self.rows):
+            for token in tokenize(f"{row['course_name']} {row['course_key']}"):
+                self._postings.setdefault(token, set()).add(position)
+        self._vocabulary = sorted(self._postings)
+        self._by_trigram: Dict[str, Set[str]] = {}
+        for token in self._vocabulary:
+            for trigram in _trigrams(token):
+                self._by_trigram.setdefault(trigram, set()).add(token)
+
+        self._orders: Dict[str, List[int]] = {}
+        self._keys: Dict[str, List[Tuple]] = {}
+        for sort in SORTS:
+            order = sorted(range(len(self.rows)), key=lambda position: self._sort_key(sort, position))
+            self._orders[sort] = order
+            self._keys[sort] = [self._sort_key(sort, position) for position in order]
+
+    def _sort_key(self, sort: str, position: int) -> Tuple:
+        row = self.rows[position]
+        ordinal = row["result_date"].toordinal()
+        if sort == "date_desc":
+            return (-ordinal, row["course_key"])
+        if sort == "date_asc":
+            return (ordinal, row["course_key"])
+        return (row["course_key"], ordinal)
+
+    def _tokens_for(self, term: str) -> Set[str]:
+        if len(term) < MIN_PREFIX_LENGTH:
+            return {term} if term in self._postings else set()
+        start = bisect_left(self._vocabulary, term)
+        end = bisect_left(self._vocabulary, term + "\U0010ffff")
+        tokens = set(self._vocabulary[start:end])
+        if not term.isalpha():
+            return tokens
+        for length in range(MIN_ABBREVIATION_LENGTH, len(term)):
+            if term[:length] in self._postings:
+                tokens.add(term[:length])
+        if tokens or len(term) < MIN_FUZZY_LENGTH:
+            return tokens
+
+        wanted = _trigrams(term)
+        candidates = set().union(*(self._by_trigram.get(trigram, ()) for trigram in wanted))
+        for token in candidates:
+            found = _trigrams(token)
+            if len(wanted & found) / len(wanted | found) >= FUZZY_SIMILARITY:
+                tokens.add(token)
+        return tokens
+
+    def matches(self, query: str) -> Optional[Set[int]]:
+        """Row positions matching every term, or ``None`` for an empty query."""
+        matched = None
+        for term in tokenize(query):
+            positions = set()
+            for token in self._tokens_for(term):
+                positions |= self._postings[token]
+            matched = positions if matched is None else matched & positions
+            if not matched:
+                return set()
+        return matched
+
+    def page(
+        self,
+        query: str = "",
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        sort: str = DEFAULT_SORT,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+    ) -> Page:
+        if sort not in SORTS:
+            raise SearchError(f"Unknown sort: {sort}")
+        matched = self.matches(query)
+
+        def selected(position: int) -> bool:
+            result_date = self.rows[position]["result_date"]
+            return (
+                (matched is None or position in matched)
+                and (date_from is None or result_date >= date_from)
+                and (date_to is None or result_date <= date_to)
+            )
+
+        order, keys = self._orders[sort], self._keys[sort]
+        start = bisect_right(keys, decode_cursor(cursor, sort)) if cursor else 0
+        items: List[int] = []
+        next_cursor = None
+        for index in range(start, len(order)):
+            if not selected(order[index]):
+                continue
+            if len(items) == limit:
+                next_cursor = encode_cursor(keys[items[-1]])
+                break
+            items.append(index)
+
+        candidates = range(len(self.rows)) if matched is None else matched
+        total = sum(1 for position in candidates if selected(position))
+        return Page([self.rows[order[index]] for index in items], total, next_cursor)
@@ -1,12 +1,39 @@
+import json
 import os
-from dataclasses import dataclass
+import re
+from dataclasses import dataclass, fields, replace
+from typing import Tuple
 from urllib.parse import urlparse
 
 from dotenv import load_dotenv
 
+from src.parse import DEFAULT_PARSER_BACKEND, PARSER_BACKENDS
 
 load_dotenv()
 
+DEFAULT_SOURCE = "sppu"
+SOURCE_NAME = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+# Source field type -> the JSON values accepted for it and their name in errors.
+JSON_FIELD_TYPES = {
+    bool: ((bool,), "true or false"),
+    int: ((int,), "an integer"),
+    float: ((int, float), "a number"),
+    str: ((str,), "a string"),
+}
+
+
+@dataclass(frozen=True)
+class Source:
+    """One tracked page with its own parser profile and thresholds."""
+
+    name: str
+    url: str
+    parser_backend: str = DEFAULT_PARSER_BACKEND
+    stream_parsing: bool = False
+    minimum_result_count: int = 25
+    suspicious_count_ratio: float = 0.70
+    discord_webhook_url: str = ""
+
 
 @dataclass(frozen=True)
 class Settings:
@@ -15,6 +42,47 @@ class Settings:
     result_url: str = "https://onlineresults.unipune.ac.in/Result/Dashboard/Default"
     minimum_result_count: int = 25
     suspicious_count_ratio: float = 0.70
+    parser_backend: str = DEFAULT_PARSER_BACKEND
+    stream_parsing: bool = False
+    poll_interval: float = 60.0
+    adaptive_schedule: bool = False
+    metrics_file: str = ""
+    sources: Tuple[Source, ...] = ()
+    max_parallel_sources: int = 4
+    archive_dir: str = ""
+    archive_delta: bool = False
+    archive_retention_days: float = 90.0
+    notify_webhook_url: str = ""
+    smtp_host: str = ""
+    smtp_port: int = 25
+    email_from: str = "sppu-result-tracker@localhost"
+    email_to: Tuple[str, ...] = ()
+    notify_max_attempts: int = 8
+
+    def tracked_sources(self) -> Tuple[Source, ...]:
+        """Configured sources, or the SPPU dashboard described by the top-level settings."""
+        if self.sources:
+            return self.sources
+        return (
+            Source(
+                name=DEFAULT_SOURCE,
+                url=self.result_url,
+                parser_backend=self.parser_backend,
+                stream_parsing=self.stream_parsing,
+                minimum_result_count=self.minimum_result_count,
+                suspicious_count_ratio=self.suspicious_count_ratio,
+                discord_webhook_url=self.discord_webhook_url,
+            ),
+        )
+
+    def notification_channels(self) -> Tuple[str, ...]:
+        """Discord, plus the generic webhook and email channels when they are configured."""
+        channels = ["discord"]
+        if self.notify_webhook_url:
+            channels.append("webhook")
+        if self.smtp_host and self.email_to:
+            channels.append("email")
+        return tuple(channels)
 
     @classmethod
     def from_env(cls, require_discord: bool = True) -> "Settings":
@@ -31,11 +99,80 @@ class Settings:
 
         _validate_database_url(database_url)
 
-        return cls(
+        settings = cls(
             database_url=database_url,
             discord_webhook_url=discord_webhook_url,
             result_url=os.getenv("SPPU_RESULT_URL", cls.result_url).strip(),
+            parser_backend=os.getenv("SPPU_PARSER_BACKEND", cls.parser_backend).strip().lower(),
+            stream_parsing=os.getenv("SPPU_STREAM_PARSE", "").strip().lower() in {"1", "true", "yes"},
+            poll_interval=float(os.getenv("SPPU_POLL_INTERVAL", cls.poll_interval)),
+            adaptive_schedule=os.getenv("SPPU_ADAPTIVE_SCHEDULE", "").strip().lower() in {"1", "true", "yes"},
+            metrics_file=os.getenv("SPPU_METRICS_FILE", "").strip(),
+            max_parallel_sources=int(os.getenv("SPPU_MAX_PARALLEL_SOURCES", cls.max_parallel_sources)),
+            archive_dir=os.getenv("SPPU_ARCHIVE_DIR", "").strip(),
+            archive_delta=os.getenv("SPPU_ARCHIVE_DELTA", "").strip().lower() in {"1", "true", "yes"},
+            archive_retention_days=float(os.getenv("SPPU_ARCHIVE_RETENTION_DAYS", cls.archive_retention_days)),
+            notify_webhook_url=os.getenv("SPPU_NOTIFY_WEBHOOK_URL", "").strip(),
+            smtp_host=os.getenv("SPPU_SMTP_HOST", "").strip(),
+            smtp_port=int(os.getenv("SPPU_SMTP_PORT", cls.smtp_port)),
+            email_from=os.getenv("SPPU_EMAIL_FROM", cls.email_from).strip(),
+            email_to=tuple(
+                address.strip() for address in os.getenv("SPPU_EMAIL_TO", "").split(",") if address.strip()
+            ),
+            notify_max_attempts=int(os.getenv("SPPU_NOTIFY_MAX_ATTEMPTS", cls.notify_max_attempts)),
         )
+        if settings.parser_backend not in PARSER_BACKENDS:
+            raise RuntimeError(f"SPPU_PARSER_BACKEND must be one of {', '.join(sorted(PARSER_BACKENDS))}")
+        sources_json = os.getenv("SPPU_SOURCES", "").strip()
+        if sources_json:
+            settings = replace(settings, sources=_parse_sources(sources_json, settings))
+        if settings.max_parallel_sources < 1:
+            raise RuntimeError("SPPU_MAX_PARALLEL_SOURCES must be at least 1")
+        if settings.notify_max_attempts < 1:
+            raise RuntimeError("SPPU_NOTIFY_MAX_ATTEMPTS must be at least 1")
+        if settings.email_to and not settings.smtp_host:
+            raise RuntimeError("SPPU_EMAIL_TO needs SPPU_SMTP_HOST")
+        return settings
+
+
+def _parse_sources(sources_json: str, defaults: Settings) -> Tuple[Source, ...]:
+    """Read SPPU_SOURCES, a JSON list of sources; omitted fields use the top-level settings."""
+    try:
+        items = json.loads(sources_json)
+    except ValueError as exc:
+        raise RuntimeError(f"SPPU_SOURCES is not valid JSON: {exc}") from exc
+    if not isinstance(items, list) or not items:
+        raise RuntimeError("SPPU_SOURCES must be a non-empty JSON list of sources")
+
+    field_types = {field.name: field.type for field in fields(Source)}
+    inherited = defaults.tracked_sources()[0]
+    sources = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise RuntimeError("Every SPPU_SOURCES entry must be a JSON object")
+        unknown = set(item) - set(field_types)
+        if unknown:
+            raise RuntimeError(f"Unknown SPPU_SOURCES fields: {', '.join(sorted(unknown))}")
+        name = str(item.get("name", ""))
+        if not SOURCE_NAME.match(name):
+            raise RuntimeError(f"Invalid source name {name!r}: use lowercase letters, digits, - and _")
+        if name in {source.name for source in sources}:
+            raise RuntimeError(f"Duplicate source name {name!r}")
+        if not item.get("url"):
+            raise RuntimeError(f"Source {name!r} is missing its url")
+        values = {}
+        for key, value in item.items():
+            accepted, expected = JSON_FIELD_TYPES[field_types[key]]
+            # bool is an int in Python, but not a number in SPPU_SOURCES.
+            if not isinstance(value, accepted) or (isinstance(value, bool) and bool not in accepted):
+                raise RuntimeError(f"Source {name!r}: {key} must be {expected}, not {json.dumps(value)}")
+            values[key] = field_types[key](value)
+        if values.get("parser_backend", inherited.parser_backend) not in PARSER_BACKENDS:
+            raise RuntimeError(
+                f"Source {name!r}: parser_backend must be one of {', '.join(sorted(PARSER_BACKENDS))}"
+            )
+        sources.append(replace(inherited, **values))
+    return tuple(sources)
 
 
 def _validate_database_url(database_url: str) -> None:
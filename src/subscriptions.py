@@ -0,0 +1,199 @@
+"""Subscriber course patterns and the index that matches result changes against them.
+
+A subscription matches a change when every term of its pattern matches a
+token of the course key, as in the search box but without typo tolerance:
+exactly, or for words of three letters or more as an abbreviation either way
+(``PATTERN`` matches ``PAT.``, ``COMP`` matches ``COMPUTER``). Numbers match
+exactly, so ``2019`` never matches ``2015``.
+
+Usage:
+    python -m src.subscriptions add PATTERN --channel webhook --target URL [--source NAME]
+    python -m src.subscriptions remove ID
+    python -m src.subscriptions list
+    python -m src.subscriptions match COURSE_NAME [--source NAME]
+"""
+import argparse
+import sys
+import threading
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import database
+from src.database import Subscription
+from src.parse import course_key, normalize_course_name
+from src.search import MIN_ABBREVIATION_LENGTH, tokenize
+from src.settings import DEFAULT_SOURCE, Settings
+
+
+CHANNELS = ("discord", "webhook", "email")
+
+# (source or None for every source, sorted distinct terms, (subscription id, channel) pairs)
+_Pattern = Tuple[Optional[str], Tuple[str, ...], List[Tuple[int, str]]]
+
+
+def pattern_terms(pattern: str) -> Tuple[str, ...]:
+    return tuple(sorted(set(tokenize(pattern))))
+
+
+def _word_prefixes(token: str) -> List[str]:
+    """Prefixes of three letters or more of a word, the token itself included; none for numbers."""
+    if len(token) < MIN_ABBREVIATION_LENGTH or not token.isalpha():
+        return []
+    return [token[:length] for length in range(MIN_ABBREVIATION_LENGTH, len(token) + 1)]
+
+
+def _term_matches(term: str, tokens: Set[str], prefixes: Set[str]) -> bool:
+    """Whether ``term`` equals a token, abbreviates one, or is an abbreviated token's full word."""
+    if term in tokens or term in prefixes:
+        return True
+    return any(prefix in tokens for prefix in _word_prefixes(term))
+
+
+class SubscriptionIndex:
+    """Distinct subscription patterns, each filed under its rarest term.
+
+    Matching a course looks up the anchors its tokens can match (the token
+    itself, its word prefixes and the words it abbreviates) and checks only
+    the patterns filed there, so the cost follows the number of candidate
+    patterns rather than the number of subscriptions. Subscribers sharing a
+    pattern share one entry.
+    """
+
+    def __init__(self, subscriptions: Iterable[Subscription], version: Hashable = None) -> None:
+        self.version = version
+        grouped: Dict[Tuple[Optional[str], Tuple[str, ...]], List[Tuple[int, str]]] = {}
+        self.size = 0
+        for subscription in subscriptions:
+            terms = pattern_terms(subscription.pattern)
+            if not terms:
+                continue
+            grouped.setdefault((subscription.source, terms), []).append((subscription.id, subscription.channel))
+            self.size += 1
+
+        frequency = Counter(term for _source, terms in grouped for term in terms)
+        self._anchors: Dict[str, List[_Pattern]] = {}
+        for (source, terms), subscribers in grouped.items():
+            anchor = min(terms, key=lambda term: (frequency[term], -len(term), term))
+            self._anchors.setdefault(anchor, []).append((source, terms, subscribers))
+        self._words = sorted(anchor for anchor in self._anchors if anchor.isalpha())
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _candidate_anchors(self, tokens: Set[str], prefixes: Set[str]) -> Set[str]:
+        anchors = {token for token in tokens | prefixes if token in self._anchors}
+        for token in tokens:
+            if len(token) < MIN_ABBREVIATION_LENGTH or not token.isalpha():
+                continue
+            position = bisect_left(self._words, token)
+            while position < len(self._words) and self._words[position].startswith(token):
+                anchors.add(self._words[position])
+                position += 1
+        return anchors
+
+    def match(self, source: str, key: str) -> List[Tuple[int, str]]:
+        """``(subscription id, channel)`` of every subscription matching a course of ``source``."""
+        if not self._anchors:
+            return []
+        tokens = set(tokenize(key))
+        prefixes = {prefix for token in tokens for prefix in _word_prefixes(token)}
+        known: Dict[str, bool] = {}
+        matched: List[Tuple[int, str]] = []
+        for anchor in self._candidate_anchors(tokens, prefixes):
+            for pattern_source, terms, subscribers in self._anchors[anchor]:
+                if pattern_source is not None and pattern_source != source:
+                    continue
+                for term in terms:
+                    if term not in known:
+                        known[term] = _term_matches(term, tokens, prefixes)
+                    if not known[term]:
+                        break
+                else:
+                    matched.extend(subscribers)
+        return matched
+
+
+class SubscriptionCache:
+    """The current ``SubscriptionIndex``, rebuilt only when the subscriptions table changes."""
+
+    def __init__(self) -> None:
+        self._index: Optional[SubscriptionIndex] = None
+        self._lock = threading.Lock()
+
+    def current(self, database_source: database.Database) -> SubscriptionIndex:
+        version = database.subscriptions_version(database_source)
+        with self._lock:
+            if self._index is None or self._index.version != version:
+                self._index = SubscriptionIndex(database.load_subscriptions(database_source), version)
+            return self._index
+
+
+def validate(pattern: str, channel: str, target: str) -> None:
+    if not pattern_terms(pattern):
+        raise ValueError("The pattern has no words or numbers to match")
+    if channel not in CHANNELS:
+        raise ValueError(f"Unknown channel {channel!r}; use one of {', '.join(CHANNELS)}")
+    if channel == "email":
+        if "@" not in target or any(character.isspace() or character == "," for character in target):
+            raise ValueError(f"Invalid email address: {target!r}")
+    elif not target.startswith(("https://", "http://")):
+        raise ValueError(f"The {channel} target must be an http(s) URL")
+
+
+def _print_subscriptions(subscriptions: Sequence[Subscription]) -> None:
+    for subscription in subscriptions:
+        print(
+            f"{subscription.id:>8}  {subscription.source or '*':<12} {subscription.channel:<8} "
+            f"{subscription.pattern}  ->  {subscription.target}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Manage subscriber course patterns.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="subscribe a target to a course pattern")
+    add.add_argument("pattern")
+    add.add_argument("--channel", choices=CHANNELS, required=True)
+    add.add_argument("--target", required=True, help="webhook URL or email address")
+    add.add_argument("--source", help="only match changes of this source")
+    remove = commands.add_parser("remove", help="delete a subscription and its queued notifications")
+    remove.add_argument("id", type=int)
+    commands.add_parser("list", help="print every subscription")
+    match = commands.add_parser("match", help="print the subscriptions a course name would notify")
+    match.add_argument("course_name")
+    match.add_argument("--source", default=DEFAULT_SOURCE)
+    args = parser.parse_args(argv)
+
+    settings = Settings.from_env(require_discord=False)
+    if args.command == "add":
+        pattern = normalize_course_name(args.pattern)
+        try:
+            validate(pattern, args.channel, args.target)
+        except ValueError as exc:
+            parser.error(str(exc))
+        if args.channel == "email" and not settings.smtp_host:
+            print("Warning: SPPU_SMTP_HOST is not set, so email notifications stay queued", file=sys.stderr)
+        print(database.add_subscription(settings.database_url, pattern, args.channel, args.target, args.source))
+    elif args.command == "remove":
+        if not database.remove_subscription(settings.database_url, args.id):
+            print(f"No subscription {args.id}", file=sys.stderr)
+            return 1
+    elif args.command == "list":
+        _print_subscriptions(database.load_subscriptions(settings.database_url))
+    else:
+        subscriptions = database.load_subscriptions(settings.database_url)
+        matched = {subscription_id for subscription_id, _channel in SubscriptionIndex(subscriptions).match(
+            args.source, course_key(args.course_name)
+        )}
+        _print_subscriptions([subscription for subscription in subscriptions if subscription.id in matched])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
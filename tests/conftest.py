@@ -0,0 +1,27 @@
+import os
+from pathlib import Path
+
+import pytest
+
+
+SCHEMA = Path(__file__).resolve().parent.parent / "src" / "schema.sql"
+
+
+@pytest.fixture
+def database_url():
+    """A local PostgreSQL database reset to the tracker schema; set TEST_DATABASE_URL to enable."""
+    url = os.getenv("TEST_DATABASE_URL", "").strip()
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    import psycopg2
+
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SCHEMA.read_text(encoding="utf-8"))
+            cursor.execute("TRUNCATE results, results_history, notification_deliveries, subscriptions, tracker_status RESTART IDENTITY")
+    finally:
+        conn.close()
+    return url
@@ -1,9 +1,17 @@
+import threading
+from dataclasses import replace
 from datetime import date
+from pathlib import Path
 from types import SimpleNamespace
 
-from src import actions
-from src.discord import DeliverySummary
-from src.settings import Settings
+import pytest
+
+from src import actions, outbox
+from src.archive import PageArchive
+from src.database import Delivery, TrackerStatus
+from src.discord import DeliverySummary, SendResult
+from src.extract import FetchResult, PageValidators
+from src.settings import Settings, Source
 
 
 SETTINGS = Settings(
@@ -11,51 +19,374 @@ SETTINGS = Settings(
     discord_webhook_url="https://discord.test/webhook",
     minimum_result_count=1,
 )
+RECORDS = [{"course_key": "course", "course_name": "Course", "result_date": date(2026, 7, 18)}]
+
+
+class FakeOutbox:
+    """Due Discord deliveries of ``events`` and the outcomes recorded for them."""
+
+    def __init__(self, monkeypatch, events, attempts=1):
+        self.deliveries = [Delivery(index, "discord", attempts, event) for index, event in enumerate(events, 1)]
+        self.outcomes = []
+        monkeypatch.setattr(actions.database, "lease_deliveries", self.lease)
+        monkeypatch.setattr(
+            actions.database, "record_deliveries", lambda _database, outcomes: self.outcomes.extend(outcomes)
+        )
+        monkeypatch.setattr(
+            actions.database,
+            "refresh_notification_counts",
+            lambda _database: sum(error is not None for _delivery, error, _retry in self.outcomes),
+        )
+
+    def lease(self, _database, channel, *_args):
+        leased = [delivery for delivery in self.deliveries if delivery.channel == channel]
+        self.deliveries = []
+        return leased
+
+
+class FakeDelivery:
+    def __init__(self, succeeds):
+        self.succeeds = succeeds
+
+    def send_all(self, deliveries):
+        return [
+            SendResult(sent=True) if self.succeeds(event) else SendResult(sent=False, error="Discord HTTP 500")
+            for _url, event in deliveries
+        ]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_subscriptions(monkeypatch):
+    monkeypatch.setattr(actions.database, "subscriptions_version", lambda _database: (0, None, None))
+    monkeypatch.setattr(actions.database, "load_subscriptions", lambda _database: [])
+
+
+@pytest.fixture(autouse=True)
+def saved_metrics(monkeypatch):
+    saved = []
+    monkeypatch.setattr(actions.database, "save_run_metrics", lambda _database, snapshot: saved.append(snapshot))
+    return saved
+
 
+def page(html="html", not_modified=False):
+    return FetchResult(html=html, validators=PageValidators(body_hash="hash"), not_modified=not_modified)
 
-def test_successful_workflow(monkeypatch):
-    records = [{"course_key": "course", "course_name": "Course", "result_date": date(2026, 7, 18)}]
-    monkeypatch.setattr(actions.extract, "fetch_html", lambda _url: "html")
-    monkeypatch.setattr(actions.parse, "parse_html_content", lambda _html, _minimum: records)
+
+def patch_fetch(monkeypatch, fetched, status=TrackerStatus()):
+    monkeypatch.setattr(actions.database, "load_tracker_status", lambda _url, _source: status)
+    monkeypatch.setattr(actions.extract, "fetch_page", lambda _url, _validators, **_kwargs: fetched)
+
+
+def test_successful_workflow(monkeypatch, saved_metrics):
+    patch_fetch(monkeypatch, page())
+    monkeypatch.setattr(actions.parse, "parse_html_content", lambda _html, _minimum, _backend: RECORDS)
+    monkeypatch.setattr(actions.database, "record_heartbeat", lambda *_args, **_kwargs: False)
     monkeypatch.setattr(
         actions.database,
         "sync_results",
-        lambda *_args: SimpleNamespace(status="success", baseline_created=False, added=1, updated=0, removed=0),
+        lambda *_args, **_kwargs: SimpleNamespace(status="success", baseline_created=False, added=1, updated=0, removed=0),
     )
+    pending = FakeOutbox(monkeypatch, [SimpleNamespace(history_id=1, result_id=2, source="sppu")])
+    monkeypatch.setattr(actions.discord, "DiscordDelivery", lambda: FakeDelivery(lambda _event: True))
+
+    assert actions.run_workflow(SETTINGS) is True
+    assert [error for _delivery, error, _retry in pending.outcomes] == [None]
+    [snapshot] = saved_metrics
+    assert snapshot["succeeded"] is True
+    assert set(snapshot["stages"]) == {"fetch", "parse", "sync", "deliver"}
+    assert snapshot["counters"] == {
+        "rows_parsed": 1,
+        "notifications_delivered": 1,
+        "notifications_failed": 0,
+        "notifications_dead": 0,
+    }
+
+
+def test_failed_delivery_is_scheduled_for_a_retry(monkeypatch):
+    pending = FakeOutbox(monkeypatch, [
+        SimpleNamespace(history_id=1, result_id=2, source="sppu"),
+        SimpleNamespace(history_id=3, result_id=None, source="sppu"),
+    ])
+    failing = pending.deliveries[1]
     monkeypatch.setattr(
         actions.discord,
-        "send_event",
-        lambda *_args: SimpleNamespace(sent=True),
+        "DiscordDelivery",
+        lambda: FakeDelivery(lambda event: event.history_id == 1),
+    )
+
+    summary = actions._send_pending_notifications(SETTINGS)
+
+    assert summary == DeliverySummary(delivered=1, failed=1, remaining=1)
+    assert pending.outcomes[1] == (failing, "Discord HTTP 500", outbox.RETRY_BASE_SECONDS)
+
+
+def test_delivery_is_dead_lettered_after_the_last_attempt(monkeypatch):
+    pending = FakeOutbox(monkeypatch, [SimpleNamespace(history_id=1, result_id=2, source="sppu")], attempts=3)
+    monkeypatch.setattr(actions.discord, "DiscordDelivery", lambda: FakeDelivery(lambda _event: False))
+
+    summary = actions._send_pending_notifications(replace(SETTINGS, notify_max_attempts=3))
+
+    assert summary == DeliverySummary(delivered=0, failed=1, remaining=1, dead=1)
+    assert pending.outcomes == [(pending.outcomes[0][0], "Discord HTTP 500", None)]
+
+
+def test_unchanged_page_skips_sync(monkeypatch):
+    heartbeats = []
+    patch_fetch(monkeypatch, page())
+    monkeypatch.setattr(actions.parse, "parse_html_content", lambda _html, _minimum, _backend: RECORDS)
+    monkeypatch.setattr(
+        actions.database,
+        "record_heartbeat",
+        lambda _url, fingerprint, _validators, **_kwargs: heartbeats.append(fingerprint) or True,
     )
     monkeypatch.setattr(
         actions.database,
-        "pending_notifications",
-        lambda *_args: [SimpleNamespace(history_id=1, result_id=2)],
+        "sync_results",
+        lambda *_args, **_kwargs: (_ for _ in ()).throw(AssertionError("sync_results should not run")),
+    )
+    monkeypatch.setattr(
+        actions,
+        "_send_pending_notifications",
+        lambda *_args: DeliverySummary(delivered=0, failed=0, remaining=0),
     )
-    monkeypatch.setattr(actions.database, "mark_notification_sent", lambda *_args: None)
 
     assert actions.run_workflow(SETTINGS) is True
+    assert heartbeats == [actions.parse.result_fingerprint(RECORDS)]
 
 
-def test_fetch_failure_returns_false(monkeypatch):
-    monkeypatch.setattr(actions.extract, "fetch_html", lambda _url: (_ for _ in ()).throw(RuntimeError("down")))
+def test_not_modified_page_skips_parsing(monkeypatch):
+    heartbeats = []
+    patch_fetch(monkeypatch, page(html=None, not_modified=True), TrackerStatus(fingerprint="abc", etag='"v1"'))
+    monkeypatch.setattr(
+        actions.parse,
+        "parse_html_content",
+        lambda *_args: (_ for _ in ()).throw(AssertionError("parse_html_content should not run")),
+    )
+    monkeypatch.setattr(
+        actions.database,
+        "record_heartbeat",
+        lambda _url, fingerprint, _validators, **_kwargs: heartbeats.append(fingerprint) or True,
+    )
+    monkeypatch.setattr(
+        actions,
+        "_send_pending_notifications",
+        lambda *_args: DeliverySummary(delivered=0, failed=0, remaining=0),
+    )
 
-    assert actions.run_workflow(SETTINGS) is False
+    assert actions.run_workflow(SETTINGS) is True
+    assert heartbeats == ["abc"]
+
+
+def test_stream_parsing_uses_streamed_page(monkeypatch):
+    settings = Settings(
+        database_url="postgresql://test",
+        discord_webhook_url="https://discord.test/webhook",
+        minimum_result_count=1,
+        stream_parsing=True,
+    )
+    streamed = FetchResult(html=None, validators=PageValidators(), chunks=iter(["html"]))
+    monkeypatch.setattr(actions.database, "load_tracker_status", lambda _url, _source: TrackerStatus())
+    monkeypatch.setattr(actions.extract, "stream_page", lambda _url, _validators, **_kwargs: streamed)
+    monkeypatch.setattr(actions.parse, "parse_html_stream", lambda chunks, _minimum: list(chunks) and RECORDS)
+    monkeypatch.setattr(actions.database, "record_heartbeat", lambda *_args, **_kwargs: True)
+    monkeypatch.setattr(
+        actions,
+        "_send_pending_notifications",
+        lambda *_args: DeliverySummary(delivered=0, failed=0, remaining=0),
+    )
+
+    assert actions.run_workflow(settings) is True
+
+
+def test_fetch_failure_returns_false(monkeypatch, saved_metrics, tmp_path):
+    monkeypatch.setattr(actions.database, "load_tracker_status", lambda _url, _source: TrackerStatus())
+    monkeypatch.setattr(
+        actions.extract,
+        "fetch_page",
+        lambda *_args, **_kwargs: (_ for _ in ()).throw(RuntimeError("down")),
+    )
+    metrics_file = tmp_path / "tracker.prom"
+
+    assert actions.run_workflow(replace(SETTINGS, metrics_file=str(metrics_file))) is False
+    assert saved_metrics[0]["error"] == "down"
+    assert list(saved_metrics[0]["stages"]) == ["fetch"]
+    assert "sppu_tracker_last_run_success 0.0" in metrics_file.read_text(encoding="utf-8")
+
+
+def test_pages_that_fail_to_parse_are_archived(monkeypatch, tmp_path):
+    patch_fetch(monkeypatch, page("<html>changed</html>"))
+    monkeypatch.setattr(
+        actions.parse,
+        "parse_html_content",
+        lambda *_args: (_ for _ in ()).throw(actions.parse.ParseError("The SPPU result table headers have changed")),
+    )
+    pages = PageArchive(tmp_path, codec="gzip")
+
+    assert actions.run_workflow(SETTINGS, actions.Clients("postgresql://test", archive=pages)) is False
+    [entry] = pages.entries()
+    assert entry["error"] == "The SPPU result table headers have changed"
+    assert pages.load(entry["sha256"]) == b"<html>changed</html>"
+
+
+def test_streamed_pages_are_archived_whole(monkeypatch, tmp_path):
+    html = (Path(__file__).parent / "sppu_result_page.html").read_bytes()
+    closed = threading.Event()
+
+    def chunks():
+        try:
+            for start in range(0, len(html), 4096):
+                yield html[start:start + 4096]
+        finally:
+            closed.set()
+
+    streamed = FetchResult(html=None, validators=PageValidators(), chunks=chunks())
+    monkeypatch.setattr(actions.database, "load_tracker_status", lambda _url, _source: TrackerStatus())
+    monkeypatch.setattr(actions.extract, "stream_page", lambda _url, _validators, **_kwargs: streamed)
+    monkeypatch.setattr(actions.database, "record_heartbeat", lambda *_args, **_kwargs: True)
+    monkeypatch.setattr(
+        actions,
+        "_send_pending_notifications",
+        lambda *_args: DeliverySummary(delivered=0, failed=0, remaining=0),
+    )
+    pages = PageArchive(tmp_path, codec="gzip")
+
+    clients = actions.Clients("postgresql://test", archive=pages)
+    assert actions.run_workflow(replace(SETTINGS, stream_parsing=True), clients) is True
+    [entry] = pages.entries()
+    assert entry["rows"] == 259
+    assert pages.load(entry["sha256"]) == html
+    assert closed.is_set()
 
 
 def test_discord_failure_fails_workflow(monkeypatch):
-    records = [{"course_key": "course", "course_name": "Course", "result_date": date(2026, 7, 18)}]
-    monkeypatch.setattr(actions.extract, "fetch_html", lambda _url: "html")
-    monkeypatch.setattr(actions.parse, "parse_html_content", lambda _html, _minimum: records)
+    patch_fetch(monkeypatch, page())
+    monkeypatch.setattr(actions.parse, "parse_html_content", lambda _html, _minimum, _backend: RECORDS)
+    monkeypatch.setattr(actions.database, "record_heartbeat", lambda *_args, **_kwargs: False)
     monkeypatch.setattr(
         actions.database,
         "sync_results",
-        lambda *_args: SimpleNamespace(status="success", baseline_created=False, added=0, updated=0, removed=0),
+        lambda *_args, **_kwargs: SimpleNamespace(status="success", baseline_created=False, added=0, updated=0, removed=0),
     )
     monkeypatch.setattr(
         actions,
         "_send_pending_notifications",
-        lambda _settings: DeliverySummary(delivered=0, failed=1, remaining=1),
+        lambda *_args: DeliverySummary(delivered=0, failed=1, remaining=1),
     )
 
     assert actions.run_workflow(SETTINGS) is False
+
+
+def test_sources_are_checked_concurrently_and_fail_independently(monkeypatch, saved_metrics):
+    settings = replace(
+        SETTINGS,
+        sources=(
+            Source("sppu", "https://sppu.test/results", minimum_result_count=1),
+            Source("reval", "https://sppu.test/reval", minimum_result_count=1, discord_webhook_url="https://reval"),
+            Source("broken", "https://sppu.test/broken"),
+        ),
+    )
+    both_fetching = threading.Barrier(2, timeout=5)
+    synced = []
+
+    def fetch(url, _validators, **_kwargs):
+        if url.endswith("broken"):
+            raise actions.extract.FetchError("SPPU HTTP 503")
+        both_fetching.wait()
+        return page(url)
+
+    monkeypatch.setattr(actions.database, "load_tracker_status", lambda _database, _source: TrackerStatus())
+    monkeypatch.setattr(actions.extract, "fetch_page", fetch)
+    monkeypatch.setattr(actions.parse, "parse_html_content", lambda _html, _minimum, _backend: RECORDS)
+    monkeypatch.setattr(actions.database, "record_heartbeat", lambda *_args, **_kwargs: False)
+    monkeypatch.setattr(
+        actions.database,
+        "sync_results",
+        lambda *_args, source, **_kwargs: synced.append(source)
+        or SimpleNamespace(status="success", baseline_created=False, added=1, updated=0, removed=0),
+    )
+    FakeOutbox(monkeypatch, [
+        SimpleNamespace(history_id=1, result_id=1, source="sppu"),
+        SimpleNamespace(history_id=2, result_id=2, source="reval"),
+    ])
+    webhooks = []
+    delivery = FakeDelivery(lambda _event: True)
+    delivery.send_all = lambda deliveries: webhooks.extend(url for url, _event in deliveries) or [
+        SendResult(sent=True) for _delivery in deliveries
+    ]
+    monkeypatch.setattr(actions.discord, "DiscordDelivery", lambda: delivery)
+
+    assert actions.run_workflow(settings) is False
+    assert sorted(synced) == ["reval", "sppu"]
+    assert webhooks == ["https://discord.test/webhook", "https://reval"]
+    assert saved_metrics[0]["counters"]["rows_parsed"] == 2
+
+
+def test_run_fails_when_every_source_fails(monkeypatch, saved_metrics):
+    settings = replace(
+        SETTINGS,
+        sources=(Source("a", "https://sppu.test/a"), Source("b", "https://sppu.test/b")),
+    )
+    monkeypatch.setattr(actions.database, "load_tracker_status", lambda _database, _source: TrackerStatus())
+    monkeypatch.setattr(
+        actions.extract,
+        "fetch_page",
+        lambda url, *_args, **_kwargs: (_ for _ in ()).throw(actions.extract.FetchError(f"{url} down")),
+    )
+    monkeypatch.setattr(
+        actions,
+        "_send_pending_notifications",
+        lambda *_args: (_ for _ in ()).throw(AssertionError("nothing to deliver")),
+    )
+
+    assert actions.run_workflow(settings) is False
+    assert saved_metrics[0]["error"] == "https://sppu.test/a down"
+
+
+def test_check_wakes_the_outbox_worker_instead_of_delivering(monkeypatch):
+    woken = []
+    monkeypatch.setattr(actions, "_check_sources", lambda *_args: [])
+    monkeypatch.setattr(
+        actions,
+        "_send_pending_notifications",
+        lambda *_args: (_ for _ in ()).throw(AssertionError("the worker delivers")),
+    )
+    clients = actions.Clients("postgresql://test", outbox=SimpleNamespace(wake=lambda: woken.append(True)))
+
+    assert actions._check(SETTINGS, clients) is True
+    assert woken == [True]
+
+
+def test_next_delay_backs_off_only_after_source_failures():
+    midpoint = lambda low, high: (low + high) / 2
+
+    assert actions.next_delay(60, uniform=midpoint) == 60
+    assert actions.next_delay(60, 3, uniform=midpoint) == 480
+    assert actions.next_delay(60, 50, max_backoff=600, uniform=midpoint) == 600
+    assert 48 <= actions.next_delay(60) <= 72
+
+
+def test_daemon_reuses_clients_and_stops_when_signalled(monkeypatch, saved_metrics):
+    stop = threading.Event()
+    seen = []
+    delays = []
+
+    def check(_settings, clients):
+        seen.append(clients)
+        if len(seen) == 1:
+            raise actions.extract.FetchError("SPPU HTTP 503")
+        stop.set()
+        return True
+
+    monkeypatch.setattr(actions, "_check", check)
+    monkeypatch.setattr(actions.discord, "DiscordDelivery", lambda: FakeDelivery(lambda _event: True))
+    monkeypatch.setattr(actions, "next_delay", lambda interval, failures: delays.append(failures) or 0)
+
+    assert actions.run_daemon(SETTINGS, stop) == 0
+    assert seen[0] is seen[1]
+    assert isinstance(seen[0].database, actions.database.ConnectionPool)
+    assert isinstance(seen[0].outbox, outbox.OutboxWorker)
+    assert delays == [1, 0]
+    assert [snapshot["error"] for snapshot in saved_metrics] == ["SPPU HTTP 503", None]
@@ -1,6 +1,72 @@
+import gzip
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
 from unittest.mock import Mock
 
+from psycopg2.extras import RealDictCursor
+
 import app
+from src import events
+from src.cache import PayloadCache
+from src.database import ConnectionPool, sync_results
+from src.schedule import PollSchedule
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        return False
+
+    def execute(self, query, params=None):
+        self.database.queries.append(" ".join(query.split()))
+        self.result = self.database.respond(self.database.queries[-1], params)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeDatabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.version = (len(rows), datetime(2026, 7, 18, tzinfo=timezone.utc), None)
+        self.summary = None
+        self.queries = []
+
+    def respond(self, query, _params):
+        if query.startswith("SELECT COUNT(*) AS count, MAX(last_seen)"):
+            count, last_seen, updated_at = self.version
+            return [{"count": count, "last_seen": last_seen, "updated_at": updated_at}]
+        if query.startswith("SELECT course_name, result_date, last_seen"):
+            return self.rows
+        if query.startswith("SELECT course_key, course_name, result_date, last_seen"):
+            return [{"course_key": row["course_name"].casefold(), **row} for row in self.rows]
+        if query.startswith("SELECT last_checked, last_change, active_results"):
+            return [self.summary] if self.summary else []
+        raise AssertionError(f"Unexpected query: {query}")
+
+    @contextmanager
+    def connection(self):
+        yield SimpleNamespace(cursor=lambda: FakeCursor(self))
+
+
+def use_database(monkeypatch, rows, ttl=60):
+    database = FakeDatabase(rows)
+    monkeypatch.setattr(app, "get_db", database.connection)
+    monkeypatch.setattr(app, "RESULTS_CACHE", PayloadCache(ttl))
+    monkeypatch.setattr(app, "HEALTH_CACHE_TTL", ttl)
+    monkeypatch.setattr(app, "_health_row", None)
+    monkeypatch.setattr(app, "_index", None)
+    return database
 
 
 def test_trigger_rejects_invalid_secret(monkeypatch):
@@ -25,3 +91,269 @@ def test_trigger_dispatches_manual_workflow(monkeypatch):
 
     assert response.status_code == 200
     assert post.call_args.kwargs["json"] == {"ref": "main"}
+
+
+def use_schedule(monkeypatch, last_checked, schedule=None):
+    monkeypatch.setattr(app, "WORKFLOW_SECRET", "correct")
+    monkeypatch.setattr(app, "GH_API_TOKEN", "token")
+    monkeypatch.setattr(app, "ADAPTIVE_SCHEDULE", True)
+    monkeypatch.setattr(app, "_poll_schedule", lambda: schedule or PollSchedule.fixed(600))
+    monkeypatch.setattr(app, "_tracker_summary", lambda: {"last_checked": last_checked})
+    post = Mock(return_value=Mock(status_code=204))
+    monkeypatch.setattr(app.requests, "post", post)
+    return post
+
+
+def test_trigger_skips_checks_that_are_not_due(monkeypatch):
+    post = use_schedule(monkeypatch, datetime.now(timezone.utc) - timedelta(minutes=2))
+    client = app.app.test_client()
+
+    skipped = client.post("/api/trigger", json={"key": "correct"})
+    forced = client.post("/api/trigger", json={"key": "correct", "force": True})
+
+    assert skipped.status_code == 200
+    assert skipped.get_json()["message"] == "Check not due"
+    assert forced.get_json()["message"] == "Workflow accepted"
+    assert post.call_count == 1
+
+
+def test_trigger_dispatches_when_due_or_schedule_is_unavailable(monkeypatch):
+    post = use_schedule(monkeypatch, datetime.now(timezone.utc) - timedelta(minutes=10))
+    client = app.app.test_client()
+    assert client.post("/api/trigger", json={"key": "correct"}).get_json()["message"] == "Workflow accepted"
+
+    monkeypatch.setattr(app, "_poll_schedule", Mock(side_effect=RuntimeError("database down")))
+    assert client.post("/api/trigger", json={"key": "correct"}).get_json()["message"] == "Workflow accepted"
+    assert post.call_count == 2
+
+
+def test_results_payload_is_served_from_cache(monkeypatch):
+    rows = [{"course_name": "Course", "result_date": date(2026, 7, 18), "last_seen": None}]
+    database = use_database(monkeypatch, rows)
+    client = app.app.test_client()
+
+    first = client.get("/api/results")
+    second = client.get("/api/results")
+
+    assert first.status_code == second.status_code == 200
+    assert first.get_data() == second.get_data()
+    assert first.get_json()[0]["course_name"] == "Course"
+    assert len(database.queries) == 2
+
+
+def test_results_cache_is_rebuilt_when_data_version_changes(monkeypatch):
+    database = use_database(monkeypatch, [])
+    clock = [0.0]
+    monkeypatch.setattr(app, "RESULTS_CACHE", PayloadCache(60, clock=lambda: clock[0]))
+    client = app.app.test_client()
+    assert client.get("/api/results").get_json() == []
+
+    clock[0] = 61.0
+    database.rows = [{"course_name": "Course", "result_date": date(2026, 7, 18), "last_seen": None}]
+    database.version = (1, datetime(2026, 7, 19, tzinfo=timezone.utc), None)
+
+    assert len(client.get("/api/results").get_json()) == 1
+    assert len(database.queries) == 4
+
+
+def test_matching_etag_returns_304_without_database(monkeypatch):
+    rows = [{"course_name": "Course", "result_date": date(2026, 7, 18), "last_seen": None}]
+    database = use_database(monkeypatch, rows)
+    client = app.app.test_client()
+    etag = client.get("/api/results").headers["ETag"]
+    queries = len(database.queries)
+
+    response = client.get("/api/results", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.get_data() == b""
+    assert len(database.queries) == queries
+
+
+def test_stale_cache_revalidates_with_version_query_only(monkeypatch):
+    rows = [{"course_name": "Course", "result_date": date(2026, 7, 18), "last_seen": None}]
+    database = use_database(monkeypatch, rows, ttl=0)
+    client = app.app.test_client()
+    etag = client.get("/api/results").headers["ETag"]
+    database.queries.clear()
+
+    response = client.get("/api/results", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert len(database.queries) == 1
+
+
+def test_gzip_payload_is_precompressed(monkeypatch):
+    rows = [{"course_name": f"Course {index}", "result_date": date(2026, 7, 18), "last_seen": None} for index in range(50)]
+    use_database(monkeypatch, rows)
+    client = app.app.test_client()
+
+    plain = client.get("/api/results")
+    compressed = client.get("/api/results", headers={"Accept-Encoding": "gzip"})
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["Vary"] == "Accept-Encoding"
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert len(compressed.get_data()) < len(plain.get_data())
+
+
+def test_health_reads_the_summary_row_once_per_ttl(monkeypatch):
+    database = use_database(monkeypatch, [])
+    database.summary = {
+        "last_checked": datetime.now(timezone.utc),
+        "last_change": datetime(2026, 7, 18, tzinfo=timezone.utc),
+        "active_results": 12,
+        "pending_notifications": 2,
+        "failed_notifications": 1,
+        "dead_notifications": 3,
+        "last_run": None,
+    }
+    client = app.app.test_client()
+
+    first = client.get("/api/health").get_json()
+    second = client.get("/api/health").get_json()
+
+    assert first == second
+    assert first["status"] == "ok"
+    assert not first["stale"]
+    assert first["active_results"] == 12
+    assert (first["pending_notifications"], first["failed_notifications"], first["dead_notifications"]) == (2, 1, 3)
+    assert database.queries == [
+        "SELECT last_checked, last_change, active_results, pending_notifications, failed_notifications, "
+        "dead_notifications, last_run FROM tracker_status WHERE name = %s"
+    ]
+
+
+def test_health_without_summary_row_is_empty_and_stale(monkeypatch):
+    use_database(monkeypatch, [], ttl=0)
+    client = app.app.test_client()
+
+    payload = client.get("/api/health").get_json()
+
+    assert payload["status"] == "empty"
+    assert payload["stale"]
+    assert payload["pending_notifications"] == 0
+    assert payload["last_run"] is None
+    assert client.get("/api/metrics").status_code == 404
+
+
+def test_metrics_render_the_last_run_for_prometheus(monkeypatch):
+    database = use_database(monkeypatch, [])
+    database.summary = {
+        "last_checked": datetime.now(timezone.utc),
+        "last_change": None,
+        "active_results": 1,
+        "pending_notifications": 0,
+        "failed_notifications": 0,
+        "dead_notifications": 0,
+        "last_run": {
+            "started_at": "2026-07-18T10:00:00+00:00",
+            "seconds": 2.5,
+            "succeeded": True,
+            "error": None,
+            "stages": {"fetch": 2.0},
+            "counters": {"http_attempts": 1},
+            "histograms": {},
+        },
+    }
+    client = app.app.test_client()
+
+    health = client.get("/api/health").get_json()
+    response = client.get("/api/metrics")
+
+    assert health["last_run"]["stages"] == {"fetch": 2.0}
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert 'sppu_tracker_stage_seconds{stage="fetch"} 2.0' in response.get_data(as_text=True)
+
+
+def test_results_pages_are_searched_in_memory(monkeypatch):
+    rows = [
+        {"course_name": f"S.E.(2019 PATTERN) {index}", "result_date": date(2026, 7, index + 1), "last_seen": None}
+        for index in range(3)
+    ] + [{"course_name": "B.Sc. Physics", "result_date": date(2026, 7, 10), "last_seen": None}]
+    database = use_database(monkeypatch, rows)
+    client = app.app.test_client()
+
+    first = client.get("/api/results?q=SE+2019+pattern&limit=2").get_json()
+    second = client.get(f"/api/results?q=SE+2019+pattern&limit=2&cursor={first['next_cursor']}").get_json()
+
+    assert first["total"] == 3
+    assert [item["course_name"] for item in first["items"] + second["items"]] == [
+        "S.E.(2019 PATTERN) 2",
+        "S.E.(2019 PATTERN) 1",
+        "S.E.(2019 PATTERN) 0",
+    ]
+    assert second["next_cursor"] is None
+    assert len(database.queries) == 2
+
+
+def test_results_page_etag_and_validation(monkeypatch):
+    use_database(monkeypatch, [{"course_name": "Course", "result_date": date(2026, 7, 18), "last_seen": None}])
+    client = app.app.test_client()
+    etag = client.get("/api/results?sort=name").headers["ETag"]
+
+    assert client.get("/api/results?sort=name", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/results?limit=0").status_code == 400
+    assert client.get("/api/results?from=yesterday").status_code == 400
+    assert client.get("/api/results?cursor=bogus").status_code == 400
+
+
+def use_real_database(monkeypatch, database_url):
+    pool = ConnectionPool(database_url, maxconn=1, autocommit=True, cursor_factory=RealDictCursor)
+    monkeypatch.setattr(app, "_pool", pool)
+    return pool
+
+
+def history_record(key, result_date):
+    return {"course_key": key, "course_name": key.upper(), "result_date": result_date}
+
+
+def test_history_pages_backwards_and_polls_forwards(monkeypatch, database_url):
+    pool = use_real_database(monkeypatch, database_url)
+    base = [history_record("base", date(2026, 7, 1))]
+    sync_results(database_url, base, 0.0)
+    sync_results(database_url, base + [history_record(f"course-{index}", date(2026, 7, 2)) for index in range(5)], 0.0)
+    client = app.app.test_client()
+    try:
+        first = client.get("/api/history?limit=3").get_json()
+        second = client.get(f"/api/history?limit=3&before={first['next_cursor']}").get_json()
+        ids = [event["id"] for event in first["events"] + second["events"]]
+        assert ids == sorted(ids, reverse=True) and len(ids) == 5
+        assert second["next_cursor"] is None
+
+        polled = client.get(f"/api/history?since={ids[2]}").get_json()
+        assert [event["id"] for event in polled["events"]] == sorted(ids[:2])
+        caught_up = client.get(f"/api/history?since={polled['next_cursor']}").get_json()
+        assert caught_up == {"events": [], "next_cursor": polled["next_cursor"], "has_more": False}
+
+        timeline = client.get("/api/courses/course-3/timeline").get_json()
+        assert [(event["course_key"], event["change_type"]) for event in timeline["events"]] == [("course-3", "added")]
+        assert client.get("/api/history?before=1&since=1").status_code == 400
+    finally:
+        pool.close()
+
+
+def test_event_stream_resumes_from_last_event_id(monkeypatch, database_url):
+    pool = use_real_database(monkeypatch, database_url)
+    monkeypatch.setattr(app, "_event_hub", None)
+    monkeypatch.setattr(events, "POLL_TIMEOUT", 0.05)
+    base = [history_record("base", date(2026, 7, 1))]
+    sync_results(database_url, base, 0.0)
+    sync_results(database_url, base + [history_record("new", date(2026, 7, 2))], 0.0)
+    client = app.app.test_client()
+    try:
+        response = client.get("/api/events", headers={"Last-Event-ID": "0"}, buffered=False)
+        chunks = iter(response.response)
+
+        assert response.mimetype == "text/event-stream"
+        assert next(chunks) == b"retry: 5000\n\n"
+        event = next(chunks).decode("utf-8")
+        assert event.startswith("id: 1\nevent: change\ndata: ")
+        assert '"course_key":"new"' in event.replace(" ", "")
+        response.close()
+        assert client.get("/api/events?last_event_id=abc").status_code == 400
+    finally:
+        app._event_hub.stop()
+        pool.close()
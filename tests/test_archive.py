@@ -0,0 +1,137 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks import generators
+from src import archive
+from src.archive import ArchiveError, PageArchive, replay
+from src.parse import parse_html_content, result_fingerprint
+
+
+NOW = datetime(2026, 7, 18, tzinfo=timezone.utc)
+ROWS = generators.snapshot(60)
+
+
+def page(rows=ROWS) -> bytes:
+    return generators.page(rows).encode("utf-8")
+
+
+def store_parsed(pages: PageArchive, body: bytes, source="sppu", fetched_at=NOW, minimum=25):
+    records = parse_html_content(body.decode("utf-8"), minimum)
+    return pages.store(
+        source,
+        "https://sppu.test",
+        body,
+        rows=len(records),
+        fingerprint=result_fingerprint(records),
+        minimum_result_count=minimum,
+        fetched_at=fetched_at,
+    )
+
+
+def objects(root):
+    return sorted(path.name for path in (root / "objects").glob("*/*"))
+
+
+def test_identical_bodies_are_stored_once(tmp_path):
+    pages = PageArchive(tmp_path, codec="gzip")
+
+    first = pages.store("sppu", "https://sppu.test", page())
+    second = pages.store("sppu", "https://sppu.test", page())
+
+    assert first == second
+    assert objects(tmp_path) == [first]
+    assert [entry["sha256"] for entry in pages.entries()] == [first, first]
+    assert PageArchive(tmp_path).load(first) == page()
+    assert os.path.getsize(pages.object_path(first)) < len(page()) / 5
+
+
+def test_corrupted_page_is_rejected(tmp_path):
+    pages = PageArchive(tmp_path, codec="gzip")
+    digest = pages.store("sppu", "https://sppu.test", page())
+    other = PageArchive(tmp_path, codec="gzip").object_path(pages.store("sppu", "https://sppu.test", b"other"))
+    pages.object_path(digest).write_bytes(other.read_bytes())
+
+    with pytest.raises(ArchiveError, match="does not match"):
+        PageArchive(tmp_path).load(digest)
+
+
+def test_zstd_deltas_are_small_and_chains_are_cut(tmp_path):
+    pytest.importorskip("zstandard")
+    pages = PageArchive(tmp_path, codec="zstd", delta=True, keyframe_interval=3)
+    bodies = [page(generators.churn(ROWS, 0.05, seed)) for seed in range(5)]
+
+    digests = [pages.store("sppu", "https://sppu.test", body) for body in bodies]
+    headers = [pages._header(digest) for digest in digests]
+
+    assert [header["depth"] for header in headers] == [0, 1, 2, 0, 1]
+    assert headers[1]["base"] == digests[0] and headers[3]["base"] is None
+    assert os.path.getsize(pages.object_path(digests[1])) < os.path.getsize(pages.object_path(digests[0])) / 2
+    assert [PageArchive(tmp_path).load(digest) for digest in reversed(digests)] == bodies[::-1]
+
+
+def test_prune_keeps_recent_fetches_and_their_bases(tmp_path):
+    pytest.importorskip("zstandard")
+    pages = PageArchive(tmp_path, codec="zstd", delta=True)
+    old = pages.store("sppu", "https://sppu.test", page(), fetched_at=NOW - timedelta(days=40))
+    recent = pages.store("sppu", "https://sppu.test", page(ROWS[1:]), fetched_at=NOW)
+    stale = PageArchive(tmp_path, codec="gzip").store(
+        "other", "https://other.test", b"old page", fetched_at=NOW - timedelta(days=40)
+    )
+    (tmp_path / "refs" / "other").unlink()
+
+    assert pages.prune(30, now=NOW) == (2, 1)
+    assert [entry["sha256"] for entry in pages.entries()] == [recent]
+    assert objects(tmp_path) == sorted([old, recent])
+    assert stale not in objects(tmp_path)
+    assert PageArchive(tmp_path).load(recent) == page(ROWS[1:])
+
+
+def test_prune_if_due_runs_once_per_interval(tmp_path, monkeypatch):
+    pages = PageArchive(tmp_path, codec="gzip", retention_days=30)
+    calls = []
+    monkeypatch.setattr(pages, "prune", lambda days: calls.append(days) or (0, 0))
+
+    pages.prune_if_due()
+    pages.prune_if_due()
+    os.utime(tmp_path / "pruned", (time.time() - 2 * archive.PRUNE_INTERVAL_SECONDS,) * 2)
+    pages.prune_if_due()
+
+    assert calls == [30, 30]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_replay_reclassifies_snapshots_and_reports_regressions(tmp_path, workers):
+    pages = PageArchive(tmp_path, codec="gzip")
+    changed = generators.churn(ROWS, 0.1)
+    store_parsed(pages, page(), fetched_at=NOW)
+    store_parsed(pages, page(), fetched_at=NOW + timedelta(minutes=1))
+    store_parsed(pages, page(changed), fetched_at=NOW + timedelta(minutes=2))
+    missing = "The expected SPPU result table (tblRVList) is missing"
+    pages.store("sppu", "https://sppu.test", b"<html></html>", error=missing)
+    pages.store("sppu", "https://sppu.test", page(), fingerprint="from an older parser", rows=60)
+
+    report = replay(PageArchive(tmp_path), workers=workers)
+
+    assert (report["fetches"], report["pages"], report["parse_errors"]) == (5, 3, 1)
+    assert report["changes"] == {"added": 4, "removed": 4, "updated": 4}
+    assert [mismatch["recorded"] for mismatch in report["mismatches"]] == ["from an older parser"]
+
+
+def test_replay_uses_the_recorded_minimum_result_count(tmp_path):
+    pages = PageArchive(tmp_path, codec="gzip")
+    store_parsed(pages, page(ROWS[:5]), minimum=1)
+
+    assert replay(pages)["mismatches"] == []
+    assert replay(pages, minimum_count=25)["parse_errors"] == 1
+
+
+def test_replay_cli_prints_a_json_report(tmp_path, capsys):
+    store_parsed(PageArchive(tmp_path, codec="gzip"), page())
+
+    assert archive.main(["replay", "--archive", str(tmp_path), "--workers", "1"]) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert (report["fetches"], report["rows"], report["mismatches"]) == (1, 60, 0)
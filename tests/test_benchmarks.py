@@ -0,0 +1,87 @@
+import requests
+
+from benchmarks import generators, run, simulate
+from src import database, parse
+from src.subscriptions import SubscriptionIndex
+
+
+def test_synthetic_page_parses_to_the_generated_rows():
+    rows = generators.snapshot(600, seed=3)
+
+    records = parse.parse_html_content(generators.page(rows))
+
+    assert len(records) == 600
+    assert {(record["course_name"], record["result_date"]) for record in records} == {
+        (parse.normalize_course_name(name), result_date) for name, result_date in rows
+    }
+
+
+def test_churn_changes_the_requested_share_of_rows():
+    rows = generators.snapshot(3000)
+    active = run.pairs(rows)
+
+    changes = database.classify_changes(active, run.pairs(generators.churn(rows, 0.1)), {})
+
+    change_types = [candidate.change_type for candidate in changes.destructive]
+    assert (len(changes.additions), change_types.count("updated"), change_types.count("removed")) == (100, 100, 100)
+
+
+def test_generated_subscription_patterns_match_their_courses():
+    index = SubscriptionIndex(
+        database.Subscription(number, pattern, "webhook", "https://hooks.test")
+        for number, pattern in enumerate(generators.subscription_patterns(500))
+    )
+    names = [name for name, _date in generators.snapshot(259)]
+
+    matched = {number for name in names for number, _channel in index.match("sppu", parse.course_key(name))}
+
+    assert len(index) == 500 and len(matched) == 500
+
+
+def test_measure_and_compare_report_regressions():
+    fast = run.measure("case", {"rows": 1}, 1, lambda: None, repeats=2)
+    slow = {**fast, "median_ms": fast["median_ms"] * 2 + 1}
+
+    assert set(fast) >= {"median_ms", "min_ms", "items_per_second", "peak_kib"}
+    assert run.compare({"results": [fast]}, {"results": [slow]})[0].endswith("REGRESSION")
+
+
+def test_webhook_sink_enforces_its_rate_limit():
+    sink = simulate.WebhookSink(limit=2, window=60)
+    try:
+        statuses = [requests.post(sink.url, json={"embeds": [{}, {}]}).status_code for _ in range(3)]
+    finally:
+        sink.close()
+
+    assert statuses == [200, 200, 429]
+    assert sink.counts() == {"messages": 2, "embeds": 4, "rate_limited": 1}
+
+
+def test_simulation_drives_the_tracker_end_to_end(database_url):
+    sink = simulate.WebhookSink(limit=50, window=1)
+    try:
+        runs = simulate.simulate(database_url, simulate.synthetic_pages(200, 3, 0.05, {2: 0.0}), sink)
+    finally:
+        sink.close()
+
+    assert [run["succeeded"] for run in runs] == [True, True, True]
+    assert [run["notifications_delivered"] for run in runs] == [0, 10, 0]
+    assert runs[1]["sink_embeds"] == 10 and runs[1]["lock_held_seconds"] > 0
+    assert runs[2]["transactions"] >= 1 and runs[2]["lock_held_seconds"] == 0
+    summary = simulate.summarize(runs)
+    assert (summary["failed_runs"], summary["notifications_delivered"], summary["pending_notifications"]) == (0, 10, 0)
+
+
+def test_simulation_fans_out_to_every_channel(database_url):
+    sink, webhook, mail = simulate.WebhookSink(limit=50, window=1), simulate.WebhookSink(), simulate.SmtpSink()
+    try:
+        runs = simulate.simulate(
+            database_url, simulate.synthetic_pages(200, 2, 0.05, {}), sink, webhook=webhook, mail=mail
+        )
+    finally:
+        for server in (sink, webhook, mail):
+            server.close()
+
+    assert [run["succeeded"] for run in runs] == [True, True]
+    assert (runs[1]["sink_embeds"], runs[1]["sink_webhook_embeds"], runs[1]["sink_emails"]) == (10, 10, 1)
+    assert runs[1]["notifications_delivered"] == 30 and runs[1]["pending_notifications"] == 0
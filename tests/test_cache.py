@@ -0,0 +1,36 @@
+from src.cache import PayloadCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entry_is_fresh_until_ttl_then_needs_version_check():
+    clock = FakeClock()
+    cache = PayloadCache(ttl=10, clock=clock)
+    cache.store("results", 1, b"[]")
+
+    assert cache.fresh("results").body == b"[]"
+    clock.now = 11
+    assert cache.fresh("results") is None
+    assert cache.lookup("results", 1).body == b"[]"
+    assert cache.fresh("results") is not None
+
+
+def test_changed_version_misses():
+    cache = PayloadCache(ttl=10, clock=FakeClock())
+    cache.store("results", 1, b"[]")
+
+    assert cache.lookup("results", 2) is None
+
+
+def test_zero_ttl_disables_cache():
+    cache = PayloadCache(ttl=0)
+    cache.store("results", 1, b"[]")
+
+    assert cache.fresh("results") is None
+    assert cache.lookup("results", 1) is None
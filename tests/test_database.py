@@ -0,0 +1,330 @@
+import random
+import threading
+from contextlib import closing
+from datetime import date, timedelta
+
+import psycopg2
+import pytest
+
+from src import metrics
+from src.database import (
+    TRACKER_NAME,
+    ConnectionPool,
+    classify_changes,
+    lease_deliveries,
+    load_change_activity,
+    load_tracker_status,
+    record_deliveries,
+    record_heartbeat,
+    refresh_notification_counts,
+    save_run_metrics,
+    sync_results,
+)
+from src.extract import PageValidators
+
+
+OLD = date(2026, 7, 18)
+NEW = date(2026, 7, 19)
+
+
+def record(key, result_date, name=None):
+    return {"course_key": key, "course_name": name or key.upper(), "result_date": result_date}
+
+
+def fetch_all(database_url, query):
+    with closing(psycopg2.connect(database_url)) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            return cursor.fetchall()
+
+
+def history(database_url):
+    return fetch_all(
+        database_url,
+        """
+        SELECT change_type, course_key, old_result_date, new_result_date
+        FROM results_history
+        ORDER BY id
+        """,
+    )
+
+
+def test_sync_applies_changes_with_history(database_url):
+    baseline = [record("moved", OLD), record("gone", OLD), record("multi", OLD), record("multi", NEW)]
+    assert sync_results(database_url, baseline, 0.0).baseline_created
+    assert history(database_url) == []
+
+    scraped = [record("moved", NEW), record("multi", NEW), record("fresh", NEW)]
+    outcome = sync_results(database_url, scraped, 0.0)
+
+    assert (outcome.added, outcome.updated, outcome.removed) == (1, 1, 2)
+    assert sorted(history(database_url)) == [
+        ("added", "fresh", None, NEW),
+        ("removed", "gone", OLD, None),
+        ("removed", "multi", OLD, None),
+        ("updated", "moved", OLD, NEW),
+    ]
+    assert fetch_all(
+        database_url,
+        "SELECT course_key, result_date, notification_sent FROM results ORDER BY course_key",
+    ) == [("fresh", NEW, False), ("moved", NEW, False), ("multi", NEW, True)]
+    linked = fetch_all(
+        database_url,
+        """
+        SELECT h.change_type
+        FROM results_history h
+        JOIN results r ON r.id = h.result_id AND r.result_date = h.new_result_date
+        ORDER BY h.change_type
+        """,
+    )
+    assert linked == [("added",), ("updated",)]
+
+
+def test_sync_refreshes_names_of_unchanged_results(database_url):
+    sync_results(database_url, [record("course", OLD, "Course")], 0.0)
+
+    sync_results(database_url, [record("course", OLD, "COURSE\\ \t name")], 0.0)
+
+    assert fetch_all(database_url, "SELECT course_name FROM results") == [("COURSE\\ \t name",)]
+    assert history(database_url) == []
+
+
+def test_heartbeat_matches_only_the_synced_fingerprint(database_url):
+    validators = PageValidators(etag='"v1"', body_hash="hash")
+    sync_results(database_url, [record("course", OLD)], 0.0, "fingerprint", validators)
+
+    assert load_tracker_status(database_url).etag == '"v1"'
+    assert record_heartbeat(database_url, "fingerprint", PageValidators(etag='"v2"'))
+    assert not record_heartbeat(database_url, "other")
+    assert load_tracker_status(database_url).etag == '"v2"'
+
+
+def test_change_activity_counts_runs_per_ist_hour(database_url):
+    sync_results(database_url, [record("base", OLD)], 0.0)
+    sync_results(database_url, [record("base", OLD), record("a", NEW), record("b", NEW)], 0.0)
+    with closing(psycopg2.connect(database_url)) as conn, conn, conn.cursor() as cursor:
+        cursor.execute("UPDATE results_history SET created_at = '2026-01-05 08:45:00+00'")
+
+    assert load_change_activity(database_url) == {}
+    assert load_change_activity(database_url, days=100000) == {(0, 14): 1}
+    assert load_change_activity(database_url, days=100000, source="reval") == {}
+
+
+def test_sync_counts_round_trips_and_rows_written(database_url):
+    sync_results(database_url, [record("kept", OLD), record("moved", OLD)], 0.0)
+    run = metrics.RunMetrics()
+
+    with run.activate():
+        sync_results(database_url, [record("kept", OLD), record("moved", NEW)], 0.0)
+    save_run_metrics(database_url, run.snapshot(succeeded=True))
+
+    # The moved row, its history row and the refreshed last_seen of the kept row.
+    assert run.counters["rows_written"] == 3
+    assert run.counters["db_round_trips"] == run.histograms["db_statement_seconds"].count >= 6
+    assert run.histograms["db_transaction_seconds"].count == run.histograms["sync_lock_seconds"].count == 1
+    [(last_run,)] = fetch_all(database_url, "SELECT last_run FROM tracker_status")
+    assert last_run["counters"] == run.counters
+
+
+def test_suspicious_count_rolls_back(database_url):
+    sync_results(database_url, [record(f"course-{index}", OLD) for index in range(10)], 0.0)
+
+    with pytest.raises(RuntimeError, match="Suspicious result count"):
+        sync_results(database_url, [record("course-0", NEW)], 0.7)
+    assert fetch_all(database_url, "SELECT COUNT(*) FROM results") == [(10,)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_set_based_sync_matches_classify_changes(database_url, seed):
+    rng = random.Random(seed)
+
+    def snapshot():
+        return {
+            (f"course-{rng.randrange(40)}", OLD + timedelta(days=rng.randrange(4)))
+            for _ in range(80)
+        }
+
+    active, scraped = snapshot(), snapshot()
+    sync_results(database_url, [record(key, result_date) for key, result_date in active], 0.0)
+    sync_results(database_url, [record(key, result_date) for key, result_date in scraped], 0.0)
+
+    changes = classify_changes(active, scraped, {})
+    expected = [("added", key, None, result_date) for key, result_date in changes.additions]
+    expected += [
+        (candidate.change_type, candidate.course_key, candidate.old_date, candidate.new_date)
+        for candidate in changes.destructive
+    ]
+    assert sorted(history(database_url)) == sorted(expected)
+    assert set(fetch_all(database_url, "SELECT course_key, result_date FROM results")) == scraped
+
+
+def test_changes_queue_one_delivery_per_channel(database_url):
+    sync_results(database_url, [record("base", OLD)], 0.0, channels=("discord", "email"))
+    sync_results(database_url, [record("base", OLD), record("a", NEW)], 0.0, channels=("discord", "email"))
+
+    assert fetch_all(
+        database_url,
+        "SELECT h.course_key, d.channel FROM notification_deliveries d JOIN results_history h ON h.id = d.history_id ORDER BY 2",
+    ) == [("a", "discord"), ("a", "email")]
+
+
+def test_leases_skip_rows_leased_by_another_worker(database_url):
+    sync_results(database_url, [record("base", OLD)], 0.0)
+    sync_results(database_url, [record("base", OLD), record("a", NEW), record("b", NEW), record("c", NEW)], 0.0)
+
+    leased = lease_deliveries(database_url, "discord", limit=2)
+    assert [(delivery.event.course_name, delivery.attempts) for delivery in leased] == [("A", 1), ("B", 1)]
+    assert [delivery.event.course_name for delivery in lease_deliveries(database_url, "discord")] == ["C"]
+    assert lease_deliveries(database_url, "discord") == []
+    assert lease_deliveries(database_url, "email") == []
+
+
+def test_recorded_deliveries_are_sent_retried_or_dead(database_url):
+    sync_results(database_url, [record("base", OLD)], 0.0, channels=("discord", "email"))
+    sync_results(
+        database_url,
+        [record("base", OLD), record("a", NEW), record("b", NEW), record("c", NEW)],
+        0.0,
+        channels=("discord", "email"),
+    )
+    discord = lease_deliveries(database_url, "discord")
+    email = lease_deliveries(database_url, "email")
+
+    record_deliveries(database_url, [
+        (discord[0], None, 0.0),
+        (discord[1], "Discord HTTP 500", 0.0),
+        (discord[2], "Discord HTTP 500", None),
+    ])
+    record_deliveries(database_url, [(delivery, None, 0.0) for delivery in email])
+
+    assert fetch_all(
+        database_url,
+        """
+        SELECT h.course_key, d.sent_at IS NOT NULL, d.dead_at IS NOT NULL, d.last_error
+        FROM notification_deliveries d JOIN results_history h ON h.id = d.history_id
+        WHERE d.channel = 'discord' ORDER BY d.id
+        """,
+    ) == [("a", True, False, None), ("b", False, False, "Discord HTTP 500"), ("c", False, True, "Discord HTTP 500")]
+    assert fetch_all(
+        database_url,
+        "SELECT course_key, notification_sent, notification_error FROM results_history ORDER BY id",
+    ) == [("a", True, None), ("b", False, "Discord HTTP 500"), ("c", False, "Discord HTTP 500")]
+    assert fetch_all(
+        database_url,
+        "SELECT course_key, notification_sent FROM results WHERE course_key <> 'base' ORDER BY course_key",
+    ) == [("a", True), ("b", False), ("c", False)]
+    assert [delivery.event.course_name for delivery in lease_deliveries(database_url, "discord")] == ["B"]
+
+
+def test_retries_wait_for_their_next_attempt(database_url):
+    sync_results(database_url, [record("base", OLD)], 0.0)
+    sync_results(database_url, [record("base", OLD), record("a", NEW)], 0.0)
+
+    [delivery] = lease_deliveries(database_url, "discord", lease_seconds=0.0)
+    record_deliveries(database_url, [(delivery, "Discord HTTP 500", 3600.0)])
+
+    assert lease_deliveries(database_url, "discord") == []
+
+
+def test_summary_row_tracks_syncs_and_deliveries(database_url):
+    def summary():
+        return fetch_all(
+            database_url,
+            """
+            SELECT last_change IS NOT NULL, active_results, pending_notifications, failed_notifications,
+                   dead_notifications
+            FROM tracker_status
+            """,
+        )
+
+    sync_results(database_url, [record("base", OLD), record("gone", OLD)], 0.0)
+    assert summary() == [(False, 2, 0, 0, 0)]
+
+    sync_results(database_url, [record("base", OLD), record("a", NEW), record("b", NEW), record("c", NEW)], 0.0)
+    assert summary() == [(True, 4, 4, 0, 0)]
+
+    sent, retried, dead, _pending = lease_deliveries(database_url, "discord")
+    record_deliveries(database_url, [(sent, None, 0.0), (retried, "Discord HTTP 500", 60.0), (dead, "gone", None)])
+    assert refresh_notification_counts(database_url) == 2
+    assert summary() == [(True, 4, 2, 1, 1)]
+
+
+def test_database_functions_accept_a_pool(database_url):
+    pool = ConnectionPool(database_url, maxconn=1)
+    try:
+        sync_results(pool, [record("course", OLD)], 0.0, "fingerprint")
+        assert record_heartbeat(pool, "fingerprint")
+        assert load_tracker_status(pool).fingerprint == "fingerprint"
+        assert lease_deliveries(pool, "discord") == []
+        assert refresh_notification_counts(pool) == 0
+        assert len(pool._idle) == 1
+    finally:
+        pool.close()
+
+
+def test_pool_reuses_connections_and_replaces_dropped_ones(database_url):
+    pool = ConnectionPool(database_url, maxconn=2, autocommit=True, check_after=0.0)
+    try:
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                first_pid = cursor.fetchone()[0]
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                assert cursor.fetchone()[0] == first_pid
+
+        with closing(psycopg2.connect(database_url)) as admin:
+            admin.autocommit = True
+            with admin.cursor() as cursor:
+                cursor.execute("SELECT pg_terminate_backend(%s)", (first_pid,))
+
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                assert cursor.fetchone()[0] != first_pid
+    finally:
+        pool.close()
+
+
+def test_sources_sync_and_notify_independently(database_url):
+    sync_results(database_url, [record("base", OLD)], 0.0, "sppu")
+    sync_results(database_url, [record("base", NEW)], 0.0, "other", source="other")
+    sync_results(database_url, [record("base", OLD), record("a", NEW)], 0.0, "sppu 2")
+    sync_results(database_url, [record("base", NEW)], 0.0, "other", source="other")
+
+    assert fetch_all(database_url, "SELECT source, course_key, result_date FROM results ORDER BY 1, 2") == [
+        ("other", "base", NEW),
+        ("sppu", "a", NEW),
+        ("sppu", "base", OLD),
+    ]
+    assert load_tracker_status(database_url).fingerprint == "sppu 2"
+    assert load_tracker_status(database_url, "other").fingerprint == "other"
+    assert record_heartbeat(database_url, "other", source="other")
+    assert not record_heartbeat(database_url, "other")
+
+    leased = lease_deliveries(database_url, "discord")
+    assert [(delivery.event.source, delivery.event.course_name) for delivery in leased] == [("sppu", "A")]
+    assert fetch_all(
+        database_url,
+        "SELECT source, active_results, pending_notifications FROM tracker_status ORDER BY source",
+    ) == [("other", 1, 0), ("sppu", 2, 1)]
+
+
+def test_other_sources_apply_changes_in_history_id_order(database_url):
+    sync_results(database_url, [record("base", OLD)], 0.0, source="other")
+    finished = threading.Event()
+    with closing(psycopg2.connect(database_url)) as conn, conn, conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (TRACKER_NAME,))
+        worker = threading.Thread(
+            target=lambda: (
+                sync_results(database_url, [record("base", NEW)], 0.0, source="other"),
+                finished.set(),
+            )
+        )
+        worker.start()
+        assert not finished.wait(0.5), "history was written while another sync held the tracker lock"
+    worker.join(5)
+
+    assert finished.is_set()
+    assert history(database_url) == [("updated", "base", OLD, NEW)]
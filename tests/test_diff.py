@@ -0,0 +1,81 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from src.diff import Change, diff_snapshots, rows_from_records
+
+
+OLD = date(2026, 7, 18)
+NEW = date(2026, 7, 19)
+
+
+def dict_of_sets_classification(active_pairs, scraped_pairs):
+    """The classification the merge diff replaced, kept as the reference."""
+    active_by_course, scraped_by_course = {}, {}
+    for key, result_date in active_pairs:
+        active_by_course.setdefault(key, set()).add(result_date)
+    for key, result_date in scraped_pairs:
+        scraped_by_course.setdefault(key, set()).add(result_date)
+
+    changes = set()
+    for key in active_by_course.keys() | scraped_by_course.keys():
+        old_dates = active_by_course.get(key, set())
+        new_dates = scraped_by_course.get(key, set())
+        if len(old_dates) == 1 and len(new_dates) == 1 and old_dates != new_dates:
+            changes.add(("updated", key, next(iter(old_dates)), next(iter(new_dates))))
+            continue
+        changes.update(("added", key, None, value) for value in new_dates - old_dates)
+        changes.update(("removed", key, value, None) for value in old_dates - new_dates)
+        changes.update(("unchanged", key, value, value) for value in old_dates & new_dates)
+    return changes
+
+
+def rows(pairs, name=str.upper):
+    return [(key, result_date, name(key)) for key, result_date in sorted(pairs)]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_merge_diff_matches_dict_of_sets_classification(seed):
+    rng = random.Random(seed)
+    dates = [OLD + timedelta(days=offset) for offset in range(4)]
+    keys = [f"course {index}" for index in range(15)]
+    active = {(rng.choice(keys), rng.choice(dates)) for _ in range(rng.randrange(0, 30))}
+    scraped = {(rng.choice(keys), rng.choice(dates)) for _ in range(rng.randrange(0, 30))}
+
+    changes = list(diff_snapshots(rows(active), rows(scraped)))
+
+    assert {(c.change_type, c.course_key, c.old_date, c.new_date) for c in changes} == (
+        dict_of_sets_classification(active, scraped)
+    )
+    assert [(c.course_key, c.old_date or c.new_date) for c in changes] == sorted(
+        (c.course_key, c.old_date or c.new_date) for c in changes
+    )
+
+
+def test_changes_carry_the_scraped_name_of_courses_still_listed():
+    old = [("gone", OLD, "Gone"), ("moved", OLD, "Moved"), ("multi", OLD, "Multi"), ("multi", NEW, "Multi")]
+    new = rows_from_records([
+        {"course_key": "moved", "result_date": NEW, "course_name": "Moved (renamed)"},
+        {"course_key": "multi", "result_date": NEW, "course_name": "Multi (renamed)"},
+    ])
+
+    assert list(diff_snapshots(old, new)) == [
+        Change("removed", "gone", "Gone", OLD, None),
+        Change("updated", "moved", "Moved (renamed)", OLD, NEW),
+        Change("removed", "multi", "Multi (renamed)", OLD, None),
+        Change("unchanged", "multi", "Multi (renamed)", NEW, NEW),
+    ]
+
+
+@pytest.mark.parametrize(
+    "snapshot",
+    [
+        [("b", OLD, "B"), ("a", OLD, "A")],
+        [("a", NEW, "A"), ("a", OLD, "A")],
+        [("a", OLD, "A"), ("a", OLD, "A")],
+    ],
+)
+def test_unsorted_snapshots_are_rejected(snapshot):
+    with pytest.raises(ValueError):
+        list(diff_snapshots([], snapshot))
@@ -0,0 +1,153 @@
+import threading
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import requests
+
+from src import discord, metrics
+from src.discord import MAX_MESSAGE_CHARACTERS, DiscordDelivery, RateLimiter, pack_events, send_event
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def event(history_id, course_name=None):
+    return SimpleNamespace(
+        history_id=history_id,
+        result_id=history_id,
+        event_type="added",
+        course_name=course_name or f"Course {history_id}",
+        result_date=date(2026, 7, 18),
+        previous_date=None,
+    )
+
+
+def response(status=204, headers=None, body=None):
+    result = Mock(spec=requests.Response)
+    result.status_code = status
+    result.headers = headers or {}
+    result.text = ""
+    result.json.return_value = body or {}
+    return result
+
+
+def test_limiter_waits_for_bucket_reset_before_sending():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+    limiter.update("hook", {"X-RateLimit-Limit": "5", "X-RateLimit-Remaining": "1", "X-RateLimit-Reset-After": "2"})
+
+    assert limiter.acquire("hook") == 0.0
+    assert limiter.acquire("hook") == 2.0
+    assert clock.sleeps == [2.0]
+    assert limiter.waited == 2.0
+
+
+def test_send_event_uses_headers_to_avoid_429():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+    session = Mock(spec=requests.Session)
+    session.post.return_value = response(
+        headers={"X-RateLimit-Limit": "5", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "1.5"},
+    )
+
+    assert send_event("https://discord.test/webhook", event(1), session, limiter).sent
+    assert send_event("https://discord.test/webhook", event(2), session, limiter).sent
+    assert clock.sleeps == [1.5]
+
+
+def test_send_event_retries_once_after_429():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+    session = Mock(spec=requests.Session)
+    session.post.side_effect = [response(429, body={"retry_after": 0.5}), response(200)]
+
+    assert send_event("https://discord.test/webhook", event(1), session, limiter).sent
+    assert session.post.call_count == 2
+    assert clock.sleeps == [0.5]
+
+
+def test_send_all_keeps_webhook_order_and_reuses_session():
+    posted = {}
+    lock = threading.Lock()
+
+    def post(endpoint, json, timeout):
+        with lock:
+            posted.setdefault(endpoint.split("?")[0], []).append(json["embeds"][0]["footer"]["text"])
+        return response()
+
+    session = Mock(spec=requests.Session)
+    session.post.side_effect = post
+    delivery = DiscordDelivery(session=session, max_workers=2, max_embeds=1)
+    deliveries = [
+        ("https://discord.test/a", event(1)),
+        ("https://discord.test/b", event(2)),
+        ("https://discord.test/a", event(3)),
+        ("https://discord.test/b", event(4)),
+    ]
+
+    run = metrics.RunMetrics()
+    with run.activate():
+        results = delivery.send_all(deliveries)
+
+    assert all(result.sent for result in results)
+    assert run.counters["discord_requests"] == 4
+    assert posted == {
+        "https://discord.test/a": ["History 1", "History 3"],
+        "https://discord.test/b": ["History 2", "History 4"],
+    }
+
+
+def test_pack_events_respects_embed_count_and_message_size():
+    assert [len(message) for message in pack_events([event(index) for index in range(23)])] == [10, 10, 3]
+
+    long_events = [event(index, "X" * 250) for index in range(30)]
+    messages = pack_events(long_events, max_embeds=30)
+    assert len(messages) > 1
+    assert sum(len(message) for message in messages) == 30
+    for message in messages:
+        assert sum(len(item.course_name) for item in message) < MAX_MESSAGE_CHARACTERS
+
+
+def test_send_all_batches_embeds_and_marks_each_event_by_message():
+    session = Mock(spec=requests.Session)
+    session.post.side_effect = [response(204), response(500)]
+    delivery = DiscordDelivery(session=session, max_embeds=2, digest_threshold=0)
+
+    results = delivery.send_all([("https://discord.test/a", event(index)) for index in range(1, 4)])
+
+    assert [result.sent for result in results] == [True, True, False]
+    assert [len(call.kwargs["json"]["embeds"]) for call in session.post.call_args_list] == [2, 1]
+
+
+def test_large_burst_is_collapsed_into_one_digest():
+    session = Mock(spec=requests.Session)
+    session.post.return_value = response(204)
+    delivery = DiscordDelivery(session=session, digest_threshold=50)
+
+    results = delivery.send_all([("https://discord.test/a", event(index)) for index in range(200)])
+
+    assert len(results) == 200 and all(result.sent for result in results)
+    assert session.post.call_count == 1
+    embed = session.post.call_args.kwargs["json"]["embeds"][0]
+    assert embed["title"].startswith("📚 200 SPPU result updates")
+    assert len(embed["description"]) <= 4096
+    assert embed["description"].endswith("more")
+
+
+def test_footer_names_non_default_sources():
+    default = event(1)
+    other = SimpleNamespace(**vars(event(2)), source="revaluation")
+
+    assert discord._format_payload(default)["embeds"][0]["footer"]["text"] == "History 1"
+    assert discord._format_payload(other)["embeds"][0]["footer"]["text"] == "revaluation · History 2"
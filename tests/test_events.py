@@ -0,0 +1,97 @@
+from datetime import date
+
+import pytest
+
+from src import events
+from src.database import sync_results
+from src.events import EventHub, Subscription
+
+
+def record(key, result_date=date(2026, 7, 19)):
+    return {"course_key": key, "course_name": key.upper(), "result_date": result_date}
+
+
+BASE = [record("base", date(2026, 7, 18))]
+
+
+@pytest.fixture(autouse=True)
+def quick_polls(monkeypatch):
+    monkeypatch.setattr(events, "POLL_TIMEOUT", 0.05)
+
+
+def next_event(subscription, keepalive=5.0):
+    for event in subscription.events(keepalive):
+        return event
+
+
+def test_subscription_skips_replayed_duplicates_and_keeps_alive():
+    subscription = Subscription([{"id": 4}, {"id": 5}], last_event_id=3)
+    subscription._offer({"id": 5})
+    subscription._offer({"id": 6})
+
+    stream = subscription.events(keepalive=0.01)
+
+    assert [next(stream)["id"] for _ in range(3)] == [4, 5, 6]
+    assert next(stream) is None
+
+
+def test_full_queue_closes_the_subscription(monkeypatch):
+    monkeypatch.setattr(events, "QUEUE_SIZE", 1)
+    subscription = Subscription([], None)
+
+    subscription._offer({"id": 1})
+    subscription._offer({"id": 2})
+
+    assert subscription.closed
+    assert list(subscription.events(keepalive=0.01)) == []
+
+
+def test_hub_fans_out_committed_history_and_resumes(database_url):
+    sync_results(database_url, BASE, 0.0)
+    hub = EventHub(database_url)
+    try:
+        first, second = hub.subscribe(), hub.subscribe()
+        sync_results(database_url, BASE + [record("a"), record("b")], 0.0)
+
+        received = [next_event(first), next_event(first), next_event(second)]
+        assert [event["course_key"] for event in received] == ["a", "b", "a"]
+
+        from_buffer = hub.subscribe(received[0]["id"])
+        assert [event["course_key"] for event in from_buffer.backlog] == ["b"]
+
+        hub._buffer.clear()
+        from_database = hub.subscribe(0)
+        assert [event["course_key"] for event in from_database.backlog] == ["a", "b"]
+        assert hub.subscriber_count() == 4
+    finally:
+        hub.stop()
+
+
+def test_hub_catches_up_on_rows_committed_while_not_listening(database_url):
+    sync_results(database_url, BASE, 0.0)
+    hub = EventHub(database_url)
+    hub._catch_up()
+    subscription = Subscription([], None)
+    hub._subscribers.add(subscription)
+
+    sync_results(database_url, BASE + [record("missed")], 0.0)
+    hub._catch_up()
+
+    assert next_event(subscription)["course_key"] == "missed"
+    assert hub.last_id == subscription.last_event_id
+
+
+def test_hub_ignores_changes_of_other_sources(database_url):
+    sync_results(database_url, BASE, 0.0)
+    sync_results(database_url, BASE, 0.0, source="reval")
+    hub = EventHub(database_url)
+    hub._catch_up()
+    subscription = Subscription([], None)
+    hub._subscribers.add(subscription)
+
+    sync_results(database_url, BASE + [record("elsewhere")], 0.0, source="reval")
+    sync_results(database_url, BASE + [record("here")], 0.0)
+    hub._catch_up()
+
+    assert next_event(subscription)["course_key"] == "here"
+    assert [event["course_key"] for event in hub.subscribe(0).backlog] == ["here"]
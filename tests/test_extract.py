@@ -1,9 +1,11 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import Mock, patch
 
 import pytest
 import requests
 
-from src.extract import FetchError, fetch_html
+from src.extract import FetchError, PageValidators, fetch_html, fetch_page, stream_page
 
 
 def response(status, text="", headers=None):
@@ -41,3 +43,120 @@ def test_fetch_does_not_retry_permanent_client_error():
     with pytest.raises(FetchError, match="HTTP 404"):
         fetch_html("https://example.test", session=session)
     assert session.get.call_count == 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        status, headers, body = self.server.responses.pop(0)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    server.responses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def stub_url(server):
+    return f"http://127.0.0.1:{server.server_port}/Result/Dashboard/Default"
+
+
+def test_stub_server_returns_page_and_validators(stub_server):
+    stub_server.responses.append((200, {"ETag": '"v1"', "Last-Modified": "Sat, 18 Jul 2026 10:00:00 GMT"}, b"<html>ok</html>"))
+
+    result = fetch_page(stub_url(stub_server))
+
+    assert result.html == "<html>ok</html>"
+    assert not result.not_modified
+    assert result.validators.etag == '"v1"'
+    assert result.validators.last_modified == "Sat, 18 Jul 2026 10:00:00 GMT"
+    assert "If-None-Match" not in stub_server.requests[0]
+
+
+def test_stub_server_not_modified_skips_body(stub_server):
+    stub_server.responses.append((304, {"ETag": '"v1"'}, b""))
+    previous = PageValidators(etag='"v1"', last_modified="Sat, 18 Jul 2026 10:00:00 GMT", body_hash="hash")
+
+    result = fetch_page(stub_url(stub_server), previous)
+
+    assert result.not_modified
+    assert result.html is None
+    assert result.validators == previous
+    assert stub_server.requests[0]["If-None-Match"] == '"v1"'
+    assert stub_server.requests[0]["If-Modified-Since"] == "Sat, 18 Jul 2026 10:00:00 GMT"
+
+
+@patch("src.extract.time.sleep", return_value=None)
+def test_stub_server_retries_before_conditional_response(_sleep, stub_server):
+    stub_server.responses.extend([(503, {"Retry-After": "1"}, b""), (304, {}, b"")])
+
+    result = fetch_page(stub_url(stub_server), PageValidators(etag='"v1"'))
+
+    assert result.not_modified
+    assert len(stub_server.requests) == 2
+    _sleep.assert_called_once_with(1.0)
+
+
+def test_identical_body_hash_is_not_modified(stub_server):
+    stub_server.responses.extend([(200, {}, b"<html>ok</html>"), (200, {}, b"<html>ok</html>")])
+
+    first = fetch_page(stub_url(stub_server))
+    second = fetch_page(stub_url(stub_server), first.validators)
+
+    assert first.html == "<html>ok</html>"
+    assert second.not_modified
+    assert second.html is None
+
+
+def test_stub_server_streams_page_in_chunks(stub_server):
+    body = b"<html>" + b"x" * 5000 + b"</html>"
+    stub_server.responses.append((200, {"Content-Type": "text/html; charset=utf-8", "ETag": '"v2"'}, body))
+
+    result = stream_page(stub_url(stub_server), chunk_size=1024)
+    chunks = list(result.chunks)
+
+    assert result.validators.etag == '"v2"'
+    assert len(chunks) > 1
+    assert "".join(chunks) == body.decode()
+
+
+def test_stream_not_modified_has_no_chunks(stub_server):
+    stub_server.responses.append((304, {}, b""))
+
+    result = stream_page(stub_url(stub_server), PageValidators(etag='"v2"'))
+
+    assert result.not_modified
+    assert result.chunks is None
+
+
+def test_stream_read_error_mid_body_is_fetch_error():
+    streamed = response(200, headers={"ETag": '"v2"'})
+
+    def broken_body(chunk_size, decode_unicode):
+        yield "<html>"
+        raise requests.exceptions.ChunkedEncodingError("connection dropped")
+
+    streamed.iter_content.side_effect = broken_body
+    session = Mock(spec=requests.Session)
+    session.get.return_value = streamed
+
+    result = stream_page("https://example.test", session=session)
+
+    with pytest.raises(FetchError, match="after 6 characters"):
+        list(result.chunks)
+    streamed.close.assert_called_once()
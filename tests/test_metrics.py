@@ -0,0 +1,48 @@
+from src import metrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 10.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_stages_counters_and_histograms_record_into_the_active_run():
+    clock = FakeClock()
+    run = metrics.RunMetrics(clock=clock)
+
+    metrics.increment("http_attempts")
+    with run.activate():
+        with metrics.stage("fetch"):
+            clock.now += 1.5
+        with metrics.stage("fetch"):
+            clock.now += 0.5
+        with metrics.timed("db_statement_seconds", "db_round_trips"):
+            clock.now += 0.02
+        metrics.increment("http_bytes", 2048)
+    metrics.increment("http_bytes", 1)
+
+    snapshot = run.snapshot(succeeded=True)
+    assert snapshot["stages"] == {"fetch": 2.0}
+    assert snapshot["counters"] == {"db_round_trips": 1, "http_bytes": 2048}
+    histogram = snapshot["histograms"]["db_statement_seconds"]
+    assert (histogram["count"], histogram["buckets"]["0.01"], histogram["buckets"]["0.025"]) == (1, 0, 1)
+    assert metrics.current() is None
+
+
+def test_prometheus_text_uses_the_persisted_snapshot():
+    run = metrics.RunMetrics()
+    run.increment("rows_written", 3)
+    run.observe("sppu_request_seconds", 0.2)
+    with run.stage("sync"):
+        pass
+
+    text = metrics.render_prometheus(run.snapshot(succeeded=False, error="down"))
+
+    assert "# TYPE sppu_tracker_rows_written gauge\nsppu_tracker_rows_written 3.0" in text
+    assert 'sppu_tracker_stage_seconds{stage="sync"}' in text
+    assert 'sppu_tracker_sppu_request_seconds_bucket{le="0.25"} 1' in text
+    assert 'sppu_tracker_sppu_request_seconds_bucket{le="+Inf"} 1' in text
+    assert "sppu_tracker_last_run_success 0.0" in text
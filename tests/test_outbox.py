@@ -0,0 +1,251 @@
+import os
+import signal
+import threading
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import requests
+
+from benchmarks.simulate import SmtpSink, WebhookSink
+from src import outbox
+from src.database import Delivery, sync_results
+from src.discord import DeliverySummary, SendResult
+from src.outbox import EmailChannel, OutboxWorker, WebhookChannel, deliver_due, retry_delay
+
+
+OLD = date(2026, 7, 18)
+NEW = date(2026, 7, 19)
+
+
+def event(history_id, source="sppu"):
+    return SimpleNamespace(
+        history_id=history_id,
+        result_id=history_id,
+        source=source,
+        event_type="added",
+        course_name=f"Course {history_id}",
+        result_date=NEW,
+        previous_date=None,
+    )
+
+
+class FakeTable:
+    """Due deliveries per channel, leased once, and the outcomes recorded for them."""
+
+    def __init__(self, monkeypatch, channels, events):
+        self.due = {
+            channel: [Delivery(index, channel, 1, item) for index, item in enumerate(events, 1)]
+            for channel in channels
+        }
+        self.recorded = {}
+        self.lock = threading.Lock()
+        monkeypatch.setattr(outbox.database, "lease_deliveries", self.lease)
+        monkeypatch.setattr(outbox.database, "record_deliveries", self.record)
+        monkeypatch.setattr(outbox.database, "refresh_notification_counts", lambda _database: 0)
+
+    def lease(self, _database, channel, *_args):
+        with self.lock:
+            return self.due.pop(channel, [])
+
+    def record(self, _database, outcomes):
+        with self.lock:
+            for delivery, error, retry_after in outcomes:
+                self.recorded.setdefault(delivery.channel, []).append((error, retry_after))
+
+
+class FakeChannel:
+    def __init__(self, name, send_all):
+        self.name = name
+        self.send_all = send_all
+
+
+def test_retry_delay_doubles_up_to_the_cap():
+    assert [retry_delay(attempts, base=10, maximum=100) for attempts in range(1, 6)] == [10, 20, 40, 80, 100]
+    assert retry_delay(1000) == outbox.MAX_RETRY_SECONDS
+
+
+def test_webhook_channel_posts_json_batches_per_target():
+    sink, subscriber = WebhookSink(limit=10, window=60), WebhookSink(limit=10, window=60)
+    try:
+        results = WebhookChannel(sink.url, batch_size=2).send_all(
+            [(None, event(1)), (subscriber.url, event(2)), (None, event(3)), (None, event(4))]
+        )
+    finally:
+        sink.close()
+        subscriber.close()
+
+    assert results == [SendResult(sent=True)] * 4
+    assert sink.counts() == {"messages": 2, "embeds": 3, "rate_limited": 0}
+    assert subscriber.counts() == {"messages": 1, "embeds": 1, "rate_limited": 0}
+
+
+def test_webhook_channel_reports_http_errors():
+    session = Mock(spec=requests.Session)
+    session.post.return_value = SimpleNamespace(status_code=503, text="down")
+
+    assert WebhookChannel("https://hooks.test", session).send_all([(None, event(1))]) == [
+        SendResult(sent=False, error="Webhook HTTP 503: down")
+    ]
+
+
+def test_email_channel_sends_one_digest_per_recipient_list():
+    mail = SmtpSink()
+    try:
+        channel = EmailChannel(mail.host, mail.port, "tracker@example.test", ["a@example.test", "b@example.test"])
+        results = channel.send_all(
+            [(None, event(1)), (None, event(2, source="reval")), ("student@example.test", event(3))]
+        )
+    finally:
+        mail.close()
+
+    assert results == [SendResult(sent=True)] * 3
+    everyone, student = mail.messages
+    assert b"To: a@example.test, b@example.test" in everyone and b"Subject: 2 SPPU result update(s)" in everyone
+    assert b"[reval] Course 2: 2026-07-19" in everyone
+    assert b"To: student@example.test" in student and b"Course 3" in student
+
+
+def test_email_channel_reports_an_unreachable_relay():
+    mail = SmtpSink()
+    host, port = mail.host, mail.port
+    mail.close()
+
+    [result] = EmailChannel(host, port, "tracker@example.test", ["a@example.test"], timeout=2).send_all(
+        [(None, event(1))]
+    )
+
+    assert not result.sent and result.error
+
+
+def test_a_slow_channel_does_not_hold_up_the_others(monkeypatch):
+    table = FakeTable(monkeypatch, ["slow", "fast"], [event(1), event(2)])
+    fast_recorded = threading.Event()
+    original_record = table.record
+
+    def record(database, outcomes):
+        original_record(database, outcomes)
+        if outcomes[0][0].channel == "fast":
+            fast_recorded.set()
+
+    monkeypatch.setattr(outbox.database, "record_deliveries", record)
+
+    def slow(deliveries):
+        assert fast_recorded.wait(5), "the fast channel waited for the slow one"
+        return [SendResult(sent=False, error="timeout")] * len(deliveries)
+
+    channels = [
+        FakeChannel("slow", slow),
+        FakeChannel("fast", lambda deliveries: [SendResult(sent=True)] * len(deliveries)),
+    ]
+    summary = deliver_due("postgresql://test", channels)
+
+    assert summary == DeliverySummary(delivered=2, failed=2, remaining=0)
+    assert table.recorded == {
+        "fast": [(None, 0.0), (None, 0.0)],
+        "slow": [("timeout", outbox.RETRY_BASE_SECONDS)] * 2,
+    }
+
+
+def test_a_crashing_channel_fails_only_its_own_batch(monkeypatch):
+    table = FakeTable(monkeypatch, ["broken", "fine"], [event(1)])
+
+    def broken(_deliveries):
+        raise ValueError("bad payload")
+
+    channels = [
+        FakeChannel("broken", broken),
+        FakeChannel("fine", lambda deliveries: [SendResult(sent=True)] * len(deliveries)),
+    ]
+    summary = deliver_due("postgresql://test", channels, max_attempts=1)
+
+    assert summary == DeliverySummary(delivered=1, failed=1, remaining=0, dead=1)
+    assert table.recorded == {"broken": [("ValueError: bad payload", None)], "fine": [(None, 0.0)]}
+
+
+def test_deliveries_of_removed_subscriptions_are_dead_lettered(monkeypatch):
+    table = FakeTable(monkeypatch, [], [])
+    table.due["webhook"] = [
+        Delivery(1, "webhook", 1, event(1), subscription_id=7, target=None),
+        Delivery(2, "webhook", 1, event(1), subscription_id=8, target="https://student.test"),
+    ]
+    sent = []
+    channel = FakeChannel(
+        "webhook", lambda deliveries: sent.extend(deliveries) or [SendResult(sent=True)] * len(deliveries)
+    )
+
+    summary = deliver_due("postgresql://test", [channel])
+
+    assert summary == DeliverySummary(delivered=1, failed=1, remaining=0, dead=1)
+    assert [target for target, _event in sent] == ["https://student.test"]
+    assert table.recorded == {"webhook": [("The subscription was removed", None), (None, 0.0)]}
+
+
+def test_worker_delivers_when_woken(monkeypatch):
+    FakeTable(monkeypatch, ["discord"], [event(1)])
+    sent = threading.Event()
+
+    def send_all(deliveries):
+        sent.set()
+        return [SendResult(sent=True)] * len(deliveries)
+
+    worker = OutboxWorker("postgresql://test", [FakeChannel("discord", send_all)], poll_interval=60).start()
+    try:
+        worker.wake()
+        assert sent.wait(5)
+    finally:
+        worker.stop(timeout=5)
+
+
+def test_main_stops_the_worker_on_sigterm(monkeypatch):
+    calls = []
+
+    class SignalledWorker:
+        def __init__(self, *_args):
+            pass
+
+        def start(self):
+            calls.append("start")
+            return self
+
+        def wake(self):
+            os.kill(os.getpid(), signal.SIGTERM)
+
+        def stop(self, timeout=None):
+            calls.append("stop")
+
+    settings = SimpleNamespace(database_url="postgresql://test", notify_max_attempts=5)
+    monkeypatch.setattr(outbox.Settings, "from_env", staticmethod(lambda: settings))
+    monkeypatch.setattr(outbox, "build_channels", lambda _settings: [])
+    monkeypatch.setattr(outbox, "OutboxWorker", SignalledWorker)
+    previous = signal.getsignal(signal.SIGTERM)
+
+    assert outbox.main([]) == 0
+    assert calls == ["start", "stop"]
+    assert signal.getsignal(signal.SIGTERM) is previous
+
+
+def test_outbox_delivers_to_every_channel(database_url):
+    sync_results(database_url, [{"course_key": "base", "course_name": "Base", "result_date": OLD}], 0.0)
+    sync_results(
+        database_url,
+        [
+            {"course_key": "base", "course_name": "Base", "result_date": OLD},
+            {"course_key": "new", "course_name": "New", "result_date": NEW},
+        ],
+        0.0,
+        channels=("webhook", "email"),
+    )
+    webhook, mail = WebhookSink(), SmtpSink()
+    try:
+        channels = [
+            WebhookChannel(webhook.url),
+            EmailChannel(mail.host, mail.port, "tracker@example.test", ["a@example.test"]),
+        ]
+        summary = OutboxWorker(database_url, channels).drain()
+    finally:
+        webhook.close()
+        mail.close()
+
+    assert summary == DeliverySummary(delivered=2, failed=0, remaining=0)
+    assert (webhook.counts()["embeds"], mail.counts()["emails"]) == (1, 1)
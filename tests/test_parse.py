@@ -1,9 +1,20 @@
-from datetime import date
+import re
+from datetime import date, datetime
 from pathlib import Path
 
 import pytest
 
-from src.parse import ParseError, parse_html_content, parse_result_date
+from src.parse import (
+    PARSER_BACKENDS,
+    ParseError,
+    clear_caches,
+    course_key,
+    iter_html_records,
+    parse_html_content,
+    parse_html_stream,
+    parse_result_date,
+    result_fingerprint,
+)
 
 
 FIXTURE = Path(__file__).with_name("sppu_result_page.html")
@@ -16,18 +27,121 @@ def test_saved_sppu_page_has_expected_results():
     assert len({(row["course_key"], row["result_date"]) for row in records}) == 259
 
 
+def test_parser_backends_produce_identical_records():
+    html = FIXTURE.read_text(encoding="utf-8")
+
+    reference = parse_html_content(html, backend="bs4")
+
+    assert parse_html_content(html, backend="lxml") == reference
+
+
+def test_streamed_page_matches_full_parse():
+    html = FIXTURE.read_text(encoding="utf-8")
+    chunks = (html[offset:offset + 4096] for offset in range(0, len(html), 4096))
+
+    assert parse_html_stream(chunks) == parse_html_content(html)
+
+
+def test_stream_stops_reading_after_table_closes():
+    html = """
+    <table id="tblRVList">
+      <tr><th>Course Name</th><th>Result Date</th></tr>
+      <tr><td>Test Course</td><td>08- November- 2025</td></tr>
+    </table>
+    """
+    consumed = []
+
+    def chunks():
+        for chunk in (html, "<footer>", "</footer>"):
+            consumed.append(chunk)
+            yield chunk
+
+    records = list(iter_html_records(chunks(), minimum_count=1))
+
+    assert [record["course_name"] for record in records] == ["Test Course"]
+    assert consumed == [html]
+
+
+def test_stream_validates_table_after_it_closes():
+    html = """
+    <table id="tblRVList">
+      <tr><th>Course Name</th><th>Result Date</th></tr>
+      <tr><td>Test Course</td><td>not-a-date</td></tr>
+    </table>
+    """
+    with pytest.raises(ParseError, match="malformed"):
+        parse_html_stream([html], minimum_count=1)
+
+
+def test_unknown_parser_backend_is_rejected():
+    with pytest.raises(ValueError, match="parser backend"):
+        parse_html_content(FIXTURE.read_text(encoding="utf-8"), backend="regex")
+
+
 def test_result_date_parser_validates_real_dates():
     assert parse_result_date("08- November- 2025") == date(2025, 11, 8)
     with pytest.raises(ValueError):
         parse_result_date("99- November- 2025")
 
 
-def test_missing_expected_table_is_rejected():
+def strptime_result_date(value):
+    normalized = re.sub(r"\s*-\s*", "-", value.strip())
+    for pattern in ("%d-%B-%Y", "%d-%b-%Y"):
+        try:
+            return datetime.strptime(normalized, pattern).date()
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "08- November- 2025",
+        " 8 -nov-2025 ",
+        "31-DECEMBER-1999",
+        "29-Feb-2024",
+        "29-Feb-2023",
+        "1-Sept-2025",
+        "12-July 2025",
+        "12--July-2025",
+        "123-July-2025",
+        "12-July-25",
+        "00-July-2025",
+        "+1-July-2025",
+        "12-Jul y-2025",
+        "",
+    ],
+)
+def test_date_tokenizer_matches_strptime(value):
+    try:
+        expected = strptime_result_date(value)
+    except ValueError:
+        with pytest.raises(ValueError):
+            parse_result_date(value)
+    else:
+        assert parse_result_date(value) == expected
+
+
+def test_cached_normalization_returns_the_same_values():
+    raw = "  S.E.\u00a0(2019   PATTERN) "
+    clear_caches()
+
+    first = (course_key(raw), parse_result_date("08- November- 2025"))
+    second = (course_key(raw), parse_result_date("08- November- 2025"))
+
+    assert first == second == ("s.e. (2019 pattern)", date(2025, 11, 8))
+    assert course_key.cache_info().hits == 1
+
+
+@pytest.mark.parametrize("backend", sorted(PARSER_BACKENDS))
+def test_missing_expected_table_is_rejected(backend):
     with pytest.raises(ParseError, match="tblRVList"):
-        parse_html_content("<html><table></table></html>", minimum_count=1)
+        parse_html_content("<html><table></table></html>", minimum_count=1, backend=backend)
 
 
-def test_malformed_result_row_is_rejected():
+@pytest.mark.parametrize("backend", sorted(PARSER_BACKENDS))
+def test_malformed_result_row_is_rejected(backend):
     html = """
     <table id="tblRVList">
       <tr><th>#</th><th>Course Name</th><th>Result Date</th></tr>
@@ -35,10 +149,11 @@ def test_malformed_result_row_is_rejected():
     </table>
     """
     with pytest.raises(ParseError, match="malformed"):
-        parse_html_content(html, minimum_count=1)
+        parse_html_content(html, minimum_count=1, backend=backend)
 
 
-def test_excessive_duplicates_are_rejected():
+@pytest.mark.parametrize("backend", sorted(PARSER_BACKENDS))
+def test_excessive_duplicates_are_rejected(backend):
     html = """
     <table id="tblRVList">
       <tr><th>#</th><th>Course Name</th><th>Result Date</th></tr>
@@ -47,4 +162,60 @@ def test_excessive_duplicates_are_rejected():
     </table>
     """
     with pytest.raises(ParseError, match="Duplicate"):
-        parse_html_content(html, minimum_count=1)
+        parse_html_content(html, minimum_count=1, backend=backend)
+
+
+def test_fingerprint_ignores_order_but_tracks_changes():
+    records = parse_html_content(FIXTURE.read_text(encoding="utf-8"))
+    changed = [dict(records[0], result_date=date(2030, 1, 1))] + records[1:]
+
+    assert result_fingerprint(records) == result_fingerprint(list(reversed(records)))
+    assert result_fingerprint(records) != result_fingerprint(changed)
+
+
+TABLE = """
+<table id="tblRVList">
+  <tr><th>#</th><th>Course <b>Name</b></th><th>Result&nbsp;Date</th></tr>
+  {row}
+</table>
+"""
+
+
+def parse_with(backend, html):
+    try:
+        return parse_html_content(html, minimum_count=1, backend=backend)
+    except ParseError as exc:
+        return str(exc)
+
+
+@pytest.mark.parametrize(
+    "row",
+    [
+        "<tr><td>1</td><td> Test<!-- note -->Course <br>2019</td><td>08- November- 2025</td></tr>",
+        "<tr><td>1</td><td><table><tr><td>Inner</td><td>08- November- 2025</td></tr></table>Outer</td>"
+        "<td>08- November- 2025</td></tr>",
+        "<tr><td>1</td><td>Test Course<script>var x = 1;</script><style>td {}</style></td>"
+        "<td>08- November- 2025</td></tr>",
+        "<tr><td>1<td>Test Course<td>08- November- 2025</tr>",
+    ],
+    ids=["nested markup", "nested table", "script and style", "unclosed cells"],
+)
+def test_parser_backends_agree_on_unusual_markup(row):
+    html = TABLE.format(row=row)
+
+    assert parse_with("lxml", html) == parse_with("bs4", html)
+
+
+def test_unusual_cells_parse_as_browsers_show_them():
+    scripted = TABLE.format(
+        row="<tr><td>1</td><td>Test Course<script>x()</script></td><td>08- November- 2025</td></tr>"
+    )
+    unclosed = TABLE.format(row="<tr><td>1<td>Test Course<td>08- November- 2025</tr>")
+    nested = TABLE.format(row="<tr><td>1</td><td><table><tr><td>Inner</td></tr></table></td><td>x</td></tr>")
+
+    for backend in sorted(PARSER_BACKENDS):
+        assert [record["course_name"] for record in parse_with(backend, scripted)] == ["Test Course"]
+        assert [record["course_name"] for record in parse_with(backend, unclosed)] == ["Test Course"]
+        assert parse_with(backend, nested) == "The SPPU result table contains a nested table"
+    with pytest.raises(ParseError, match="nested table"):
+        parse_html_stream([nested], minimum_count=1)
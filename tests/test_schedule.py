@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+from src.actions import POLL_JITTER
+from src.schedule import DUE_TOLERANCE_SECONDS, IST, SLOTS, STALE_AFTER_SECONDS, PollSchedule, slot_of
+
+
+AFTERNOONS = {(weekday, 14): 12 for weekday in range(5)}
+
+
+def test_slots_use_indian_standard_time():
+    assert slot_of(datetime(2026, 7, 20, 8, 45, tzinfo=timezone.utc)) == (0, 14)
+    assert slot_of(datetime(2026, 7, 19, 19, 0, tzinfo=timezone.utc)) == (0, 0)
+
+
+def test_without_history_the_baseline_interval_is_kept():
+    assert PollSchedule.from_activity({}, 600) == PollSchedule.fixed(600)
+
+
+def test_hot_windows_are_polled_faster_within_the_same_budget():
+    schedule = PollSchedule.from_activity(AFTERNOONS, 600)
+    monday_afternoon = datetime(2026, 7, 20, 14, 30, tzinfo=IST)
+    sunday_night = datetime(2026, 7, 19, 3, 0, tzinfo=IST)
+
+    assert schedule.interval_at(monday_afternoon) < 300
+    assert schedule.interval_at(sunday_night) > 600
+    assert schedule.checks_per_week() <= SLOTS * 6 * 1.001
+    assert min(schedule.intervals) >= 30
+
+
+def test_quiet_hours_are_checked_before_health_turns_stale():
+    schedule = PollSchedule.from_activity(AFTERNOONS, 600)
+    cron_period = 120
+
+    longest = max(schedule.intervals) * (1 + POLL_JITTER) + DUE_TOLERANCE_SECONDS + cron_period
+    assert longest < STALE_AFTER_SECONDS
+
+
+def test_due_allows_for_cron_drift():
+    schedule = PollSchedule.fixed(600)
+    now = datetime(2026, 7, 20, 12, 0, tzinfo=timezone.utc)
+
+    assert schedule.due(None, now)
+    assert schedule.due(now - timedelta(seconds=590), now)
+    assert not schedule.due(now - timedelta(seconds=300), now)
+    assert schedule.next_check(now - timedelta(seconds=300), now) == now + timedelta(seconds=300)
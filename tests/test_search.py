@@ -0,0 +1,84 @@
+import json
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from src.parse import course_key, parse_result_date
+from src.search import ResultIndex, SearchError, tokenize
+
+
+FIXTURES = Path(__file__).parent
+
+
+def load_rows():
+    subjects = json.loads((FIXTURES / "sppu_subjects.json").read_text(encoding="utf-8"))
+    return [
+        {
+            "course_key": course_key(item["course_name"]),
+            "course_name": item["course_name"],
+            "result_date": parse_result_date(item["result_date"]),
+            "last_seen": None,
+        }
+        for item in subjects
+    ]
+
+
+def row(name, result_date):
+    return {"course_key": course_key(name), "course_name": name, "result_date": result_date, "last_seen": None}
+
+
+def test_tokenize_keeps_dotted_abbreviations():
+    assert tokenize("S.E.(2019 CREDIT PAT.) APR-MAY 2025") == ["se", "2019", "credit", "pat", "apr", "may", "2025"]
+
+
+def test_search_matches_abbreviations_prefixes_and_typos():
+    index = ResultIndex(1, load_rows())
+
+    for query in ("SE 2019 pattern", "s.e. 2019 patern", "se 2019 cred"):
+        names = {item["course_name"] for item in index.page(query, limit=100).items}
+        assert names
+        assert all(name.startswith("S.E.") and "2019" in name for name in names)
+    assert index.page("no such course", limit=100).total == 0
+
+
+def test_pages_follow_keyset_cursors_without_gaps():
+    rows = load_rows()
+    index = ResultIndex(1, rows)
+    seen = []
+    cursor = None
+    while True:
+        page = index.page(sort="name", cursor=cursor, limit=17)
+        seen.extend(item["course_key"] for item in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert page.total == len(rows)
+    assert seen == sorted(item["course_key"] for item in rows)
+
+
+def test_date_range_and_sort():
+    index = ResultIndex(1, [
+        row("Old Course", date(2026, 1, 1)),
+        row("Middle Course", date(2026, 3, 1)),
+        row("New Course", date(2026, 5, 1)),
+    ])
+
+    page = index.page(date_from=date(2026, 2, 1), sort="date_asc")
+
+    assert [item["course_name"] for item in page.items] == ["Middle Course", "New Course"]
+    assert page.total == 2
+    assert index.page(date_to=date(2026, 2, 1)).items[0]["course_name"] == "Old Course"
+
+
+def test_invalid_cursor_and_sort_are_rejected():
+    index = ResultIndex(1, [row("Course", date(2026, 1, 1))])
+    name_cursor = "WyJjb3Vyc2UiLDFd"  # ["course", 1]
+
+    with pytest.raises(SearchError):
+        index.page(sort="date_desc", cursor="not-a-cursor")
+    with pytest.raises(SearchError):
+        index.page(sort="date_desc", cursor=name_cursor)
+    with pytest.raises(SearchError):
+        index.page(sort="unknown")
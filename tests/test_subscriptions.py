@@ -0,0 +1,166 @@
+from datetime import date
+
+import pytest
+
+from benchmarks import generators
+from src import database
+from src.database import (
+    Subscription,
+    add_subscription,
+    lease_deliveries,
+    record_deliveries,
+    refresh_notification_counts,
+    remove_subscription,
+    sync_results,
+)
+from src.parse import course_key
+from src.settings import Settings
+from src.subscriptions import SubscriptionCache, SubscriptionIndex, main, validate
+
+
+OLD = date(2026, 7, 18)
+NEW = date(2026, 7, 19)
+
+
+def subscription(subscription_id, pattern, source=None, channel="webhook"):
+    return Subscription(subscription_id, pattern, channel, f"https://hooks.test/{subscription_id}", source)
+
+
+def matched(index, name, source="sppu"):
+    return sorted(subscription_id for subscription_id, _channel in index.match(source, course_key(name)))
+
+
+def test_patterns_match_every_term_with_abbreviations():
+    index = SubscriptionIndex([
+        subscription(1, "T.E. 2019 PATTERN"),
+        subscription(2, "B.Sc. Computer Science"),
+        subscription(3, "te 2015"),
+        subscription(4, "Comp Sci"),
+        subscription(5, "M.PHARM"),
+    ])
+
+    assert matched(index, "T.E.(2019 PAT.) APR-MAY 2025") == [1]
+    assert matched(index, "T.E.2015 PERCENTAGE EXAMINATION APR-MAY 2025") == [3]
+    assert matched(index, "S.Y.B.Sc.(Computer Science) (2019 CBCS) APR 2025") == [4]
+    assert matched(index, "B.Sc. (COMPUTER SCIENCE) APR 2025") == [2, 4]
+    assert matched(index, "FIRST YEAR M.PHARM(2019 PATTERN) APRIL-2025") == [5]
+    assert matched(index, "FIRST YEAR B.PHARMACY(2019 PATTERN) APRIL-2025") == []
+
+
+def test_numbers_match_exactly():
+    index = SubscriptionIndex([subscription(1, "S.E. 2019")])
+
+    assert matched(index, "S.E.(2019 CREDIT PAT.)") == [1]
+    assert matched(index, "S.E.(20190 CREDIT PAT.)") == []
+    assert matched(index, "S.E.(201 CREDIT PAT.)") == []
+
+
+def test_subscribers_share_patterns_and_can_be_scoped_to_a_source():
+    index = SubscriptionIndex([
+        subscription(1, "T.E. 2019 PATTERN"),
+        subscription(2, "te 2019 pattern", channel="email"),
+        subscription(3, "T.E. 2019", source="reval"),
+        subscription(4, "..."),
+    ])
+
+    assert len(index) == 3
+    assert sorted(index.match("sppu", course_key("T.E.(2019 PATTERN)"))) == [(1, "webhook"), (2, "email")]
+    assert matched(index, "T.E.(2019 PATTERN)", source="reval") == [1, 2, 3]
+
+
+def test_index_agrees_with_a_linear_scan():
+    names = [name for name, _date in generators.snapshot(400)]
+    patterns = [" ".join(course_key(name).split()[:2]) for name in names[::7]] + ["pharm", "2019 pat", "exam"]
+    index = SubscriptionIndex([subscription(number, pattern) for number, pattern in enumerate(patterns)])
+    linear = [SubscriptionIndex([subscription(number, pattern)]) for number, pattern in enumerate(patterns)]
+
+    for name in names:
+        assert matched(index, name) == [
+            number for number, single in enumerate(linear) if single.match("sppu", course_key(name))
+        ]
+
+
+@pytest.mark.parametrize(
+    ("pattern", "channel", "target", "message"),
+    [
+        ("...", "webhook", "https://hooks.test", "no words"),
+        ("T.E.", "sms", "+91", "Unknown channel"),
+        ("T.E.", "email", "a@example.test, b@example.test", "Invalid email"),
+        ("T.E.", "discord", "discord.com/api/webhooks/1", "http"),
+    ],
+)
+def test_invalid_subscriptions_are_rejected(pattern, channel, target, message):
+    with pytest.raises(ValueError, match=message):
+        validate(pattern, channel, target)
+
+
+def test_matching_changes_queue_targeted_deliveries(database_url):
+    webhook = add_subscription(database_url, "T.E. 2019 PATTERN", "webhook", "https://student.test")
+    email = add_subscription(database_url, "te 2019", "email", "student@example.test")
+    add_subscription(database_url, "B.Sc. Computer Science", "webhook", "https://other.test")
+    assert add_subscription(database_url, "T.E. 2019 PATTERN", "webhook", "https://student.test") == webhook
+    subscribers = SubscriptionCache().current(database_url)
+
+    sync_results(database_url, [record("BASE", OLD)], 0.0, subscribers=subscribers)
+    sync_results(
+        database_url,
+        [record("BASE", OLD), record("T.E.(2019 PAT.) APR-MAY 2025", NEW), record("F.E. 2019", NEW)],
+        0.0,
+        subscribers=subscribers,
+    )
+
+    [broadcast_te, broadcast_fe] = lease_deliveries(database_url, "discord")
+    [targeted] = lease_deliveries(database_url, "webhook")
+    assert (targeted.event.course_name, targeted.subscription_id, targeted.target) == (
+        "T.E.(2019 PAT.) APR-MAY 2025", webhook, "https://student.test"
+    )
+    assert remove_subscription(database_url, email)
+    assert lease_deliveries(database_url, "email") == []
+
+    record_deliveries(database_url, [(broadcast_te, None, 0.0), (broadcast_fe, None, 0.0)])
+    record_deliveries(database_url, [(targeted, "Webhook HTTP 500", None)])
+    assert refresh_notification_counts(database_url) == 0
+    with database.connect(database_url) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT course_name, notification_sent, notification_error FROM results_history ORDER BY id")
+            assert cursor.fetchall() == [("F.E. 2019", True, None), ("T.E.(2019 PAT.) APR-MAY 2025", True, None)]
+            cursor.execute("SELECT pending_notifications, failed_notifications, dead_notifications FROM tracker_status")
+            assert cursor.fetchall() == [(0, 0, 0)]
+    conn.close()
+
+
+def test_cache_rebuilds_only_when_subscriptions_change(database_url, monkeypatch):
+    cache = SubscriptionCache()
+    first = cache.current(database_url)
+    assert cache.current(database_url) is first and len(first) == 0
+
+    subscription_id = add_subscription(database_url, "T.E.", "discord", "https://discord.test/student")
+    second = cache.current(database_url)
+    assert second is not first and len(second) == 1
+
+    remove_subscription(database_url, subscription_id)
+    assert len(cache.current(database_url)) == 0
+
+
+def test_cli_adds_matches_and_removes_subscriptions(monkeypatch, capsys):
+    stored = {}
+
+    def add(_database, pattern, channel, target, source):
+        stored[len(stored) + 1] = Subscription(len(stored) + 1, pattern, channel, target, source)
+        return len(stored)
+
+    monkeypatch.setattr(Settings, "from_env", classmethod(lambda cls, require_discord=True: cls("postgresql://test", "")))
+    monkeypatch.setattr(database, "add_subscription", add)
+    monkeypatch.setattr(database, "load_subscriptions", lambda _database: list(stored.values()))
+    monkeypatch.setattr(database, "remove_subscription", lambda _database, number: stored.pop(number, None) is not None)
+
+    assert main(["add", "  T.E.   2019 PATTERN ", "--channel", "webhook", "--target", "https://student.test"]) == 0
+    assert capsys.readouterr().out == "1\n"
+    assert main(["match", "T.E.(2019 PAT.) APR-MAY 2025"]) == 0
+    assert "T.E. 2019 PATTERN  ->  https://student.test" in capsys.readouterr().out
+    assert main(["remove", "1"]) == 0
+    assert main(["remove", "1"]) == 1
+
+
+def record(name, result_date):
+    return {"course_key": course_key(name), "course_name": name, "result_date": result_date}